@@ -0,0 +1,92 @@
+"""Comparing the vectorized and sequential Jacobian computations of backprop Jacobian flows"""
+import sys
+import logging
+from time import perf_counter
+
+import click
+import pandas as pd
+import torch
+
+from utils.command_line_tools import PythonLiteralOption
+from utils.torch_utils import get_device
+from zunis.models.flows.backprop_jacobian_flows.nnflows import NNFlow
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(levelname)s: %(message)s [%(name)s]')
+logger = logging.getLogger("benchmark_backprop_jacobian")
+
+methods = {
+    "vectorized": NNFlow.compute_jacobian,
+    "sequential": NNFlow.compute_jacobian_sequential
+}
+
+
+def time_jacobian(flow, method, x, n_repeat):
+    """Time the computation of the log-determinant of the Jacobian and of its gradient
+
+    Returns
+    -------
+        tuple
+            (mean time per call in seconds, peak CUDA memory in MB or None on CPU, last log-determinant)
+    """
+    on_cuda = x.device.type == "cuda"
+    if on_cuda:
+        torch.cuda.synchronize(x.device)
+        torch.cuda.reset_peak_memory_stats(x.device)
+
+    start = perf_counter()
+    for _ in range(n_repeat):
+        flow.zero_grad()
+        _, jx = method(flow, x)
+        _, log_det_j = torch.slogdet(jx)
+        log_det_j.sum().backward()
+    if on_cuda:
+        torch.cuda.synchronize(x.device)
+    duration = (perf_counter() - start) / n_repeat
+
+    peak_memory = torch.cuda.max_memory_allocated(x.device) / 2 ** 20 if on_cuda else None
+    return duration, peak_memory, log_det_j.detach()
+
+
+def benchmark_backprop_jacobian(dimensions=None, n_batch=1000, n_repeat=10, nh=2, cuda=0, output=None):
+    if dimensions is None:
+        dimensions = [8, 16, 32]
+    device = get_device(cuda_ID=cuda)
+
+    results = []
+    for d in dimensions:
+        flow = NNFlow(d=d, nh=nh, dh=d).to(device)
+        flow.weight_init_identity_()
+        x = torch.rand(n_batch, d, device=device)
+
+        log_dets = dict()
+        for name, method in methods.items():
+            # Warm-up run
+            time_jacobian(flow, method, x, 1)
+            duration, peak_memory, log_dets[name] = time_jacobian(flow, method, x, n_repeat)
+            logger.info(f"d={d}, {name}: {1000 * duration:.2f} ms per call")
+            results.append({"d": d, "method": name, "n_batch": n_batch, "time_ms": 1000 * duration,
+                            "peak_cuda_memory_mb": peak_memory})
+
+        mismatch = (log_dets["vectorized"] - log_dets["sequential"]).abs().max().cpu().item()
+        logger.info(f"d={d}: maximum log-determinant difference {mismatch:.2e}")
+        for result in results[-len(methods):]:
+            result["max_log_det_difference"] = mismatch
+
+    results = pd.DataFrame(results)
+    print(results.to_string(index=False))
+    if output is not None:
+        results.to_csv(output, index=False)
+    return results
+
+
+cli = click.Command("cli", callback=benchmark_backprop_jacobian, params=[
+    PythonLiteralOption(["--dimensions"], default=None),
+    click.Option(["--n_batch"], default=1000, type=int),
+    click.Option(["--n_repeat"], default=10, type=int),
+    click.Option(["--nh"], default=2, type=int),
+    click.Option(["--cuda"], default=0, type=int),
+    click.Option(["--output"], default=None, type=str)
+])
+
+if __name__ == '__main__':
+    cli()
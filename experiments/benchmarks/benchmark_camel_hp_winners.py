@@ -6,7 +6,8 @@ from utils.config.loaders import get_sql_types
 from utils.integrands.gaussian import SymmetricCamelIntegrand
 
 
-def benchmark_camel(db=None, experiment_name=None, debug=None, cuda=None, keep_history=None, config=None):
+def benchmark_camel(db=None, experiment_name=None, debug=None, cuda=None, keep_history=None, config=None,
+                    n_workers=None, threads_per_worker=None, resume=None):
     dtypes = get_sql_types()
 
     # Integrand specific defaults
@@ -21,6 +22,8 @@ def benchmark_camel(db=None, experiment_name=None, debug=None, cuda=None, keep_h
                                                              keep_history=keep_history,
                                                              dbname=db, experiment_name=experiment_name, cuda=cuda,
                                                              debug=debug,
+                                                             n_workers=n_workers, threads_per_worker=threads_per_worker,
+                                                             resume=resume,
                                                              base_integrand_params=base_integrand_params)
 
     # Integrand specific CLI argument mapped to standard API
@@ -34,7 +37,10 @@ cli = click.Command("cli", callback=benchmark_camel, params=[
     click.Option(["--cuda"], default=None, type=int),
     click.Option(["--db"], default=None, type=str),
     click.Option(["--experiment_name"], default=None, type=str),
-    click.Option(["--config"], default=None, type=str)
+    click.Option(["--config"], default=None, type=str),
+    click.Option(["--n_workers"], default=None, type=int),
+    click.Option(["--threads_per_worker"], default=None, type=int),
+    click.Option(["--resume/--no-resume"], default=None, type=bool)
 ])
 
 if __name__ == '__main__':
@@ -9,8 +9,8 @@ from utils.integrands.pretty import SineIntegrand
 
 def benchmark_camel(dimensions=None, db=None,
                     experiment_name=None, debug=None, cuda=None, keep_history=None,
-                    config=None,
-                    n_search=10):
+                    config=None, n_workers=None, threads_per_worker=None,
+                    n_search=10, seed=None, resume=None):
     dtypes = get_sql_types()
 
     # Integrand specific defaults
@@ -19,12 +19,14 @@ def benchmark_camel(dimensions=None, db=None,
         "offset": 0.1
     }
 
-    benchmarker = VegasRandomHPBenchmarker(n=n_search)
+    benchmarker = VegasRandomHPBenchmarker(n=n_search, seed=seed)
 
     benchmark_config = benchmarker.set_benchmark_grid_config(config=config, dimensions=dimensions,
                                                              keep_history=keep_history,
                                                              dbname=db, experiment_name=experiment_name, cuda=cuda,
                                                              debug=debug,
+                                                             n_workers=n_workers, threads_per_worker=threads_per_worker,
+                                                             resume=resume,
                                                              base_integrand_params=base_integrand_params)
 
     benchmarker.run(integrand=SineIntegrand, sql_dtypes=dtypes,
@@ -38,7 +40,11 @@ cli = click.Command("cli", callback=benchmark_camel, params=[
     click.Option(["--db"], default=None, type=str),
     click.Option(["--experiment_name"], default=None, type=str),
     click.Option(["--config"], default=None, type=str),
-    click.Option(["--n_search"], default=10, type=int)
+    click.Option(["--n_workers"], default=None, type=int),
+    click.Option(["--threads_per_worker"], default=None, type=int),
+    click.Option(["--n_search"], default=10, type=int),
+    click.Option(["--seed"], default=None, type=int),
+    click.Option(["--resume/--no-resume"], default=None, type=bool)
 ])
 
 if __name__ == '__main__':
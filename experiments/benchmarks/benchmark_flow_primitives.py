@@ -0,0 +1,156 @@
+"""Micro-benchmarks of the flow primitives used in the sampling and training inner loops
+
+The piecewise transforms, a single coupling cell, a full sequential flow and the prior sampling layer are timed
+on a grid of batch sizes, dimensions, numbers of bins, masking strategies and dtypes. Throughputs and peak memory
+increases are saved to JSON and can be compared to a stored baseline, in which case the script exits with a non-zero
+status if a kernel is slower than its baseline by more than the tolerance.
+"""
+import sys
+import logging
+from itertools import product
+
+import click
+import pandas as pd
+import torch
+
+from utils.command_line_tools import PythonLiteralOption
+from utils.performance import measure_throughput, save_results, load_results, compare_to_baseline
+from utils.torch_utils import get_device
+from zunis.models.flows.coupling_cells.piecewise_coupling.piecewise_linear import piecewise_linear_transform, \
+    piecewise_linear_inverse_transform
+from zunis.models.flows.coupling_cells.piecewise_coupling.piecewise_quadratic import piecewise_quadratic_transform, \
+    piecewise_quadratic_inverse_transform
+from zunis.models.flows.sampling import UniformSampler
+from zunis.models.flows.sequential.repeated_cell import RepeatedCellFlow
+from zunis.utils.dtypes import resolve_dtype
+from zunis.utils.hardware import hardware_summary
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(levelname)s: %(message)s [%(name)s]')
+logger = logging.getLogger("benchmark_flow_primitives")
+
+configuration_keys = ["kernel", "cell", "n_batch", "d", "n_bins", "masking", "dtype"]
+"""Columns identifying a measurement, used to match results with the baseline"""
+
+
+def transform_kernels(n_batch, d, n_bins, dtype, device):
+    """Element-wise piecewise transforms applied to half of the dimensions, as in a checkerboard coupling cell
+
+    Returns
+    -------
+        dict
+            kernel name -> function without arguments
+    """
+    k = max(d // 2, 1)
+    x = torch.rand(n_batch, k, dtype=dtype, device=device)
+    q_tilde = torch.randn(n_batch, k, n_bins, dtype=dtype, device=device)
+    wv_tilde = torch.randn(n_batch, k, 2 * n_bins + 1, dtype=dtype, device=device)
+    return {
+        "pwlinear_transform": lambda: piecewise_linear_transform(x, q_tilde),
+        "pwlinear_inverse_transform": lambda: piecewise_linear_inverse_transform(x, q_tilde),
+        "pwquad_transform": lambda: piecewise_quadratic_transform(x, wv_tilde),
+        "pwquad_inverse_transform": lambda: piecewise_quadratic_inverse_transform(x, wv_tilde),
+    }
+
+
+def flow_kernels(n_batch, d, n_bins, masking, cell, cell_params, dtype, device):
+    """Coupling cell, sequential flow and prior sampling
+
+    Returns
+    -------
+        dict
+            kernel name -> function without arguments
+    """
+    flow = RepeatedCellFlow(d=d, cell=cell, masking=masking, cell_params={**cell_params, "n_bins": n_bins})
+    flow = flow.to(device=device, dtype=dtype)
+    prior = UniformSampler(d=d, device=device, dtype=dtype)
+
+    xj = prior(n_batch)
+    x = xj[:, :-1].contiguous()
+    coupling_cell = flow.flows[0]
+    return {
+        "coupling_cell_transform_and_compute_jacobian": lambda: coupling_cell.transform_and_compute_jacobian(xj),
+        "sequential_flow": lambda: flow.flow(x),
+        "sequential_flow_transform_and_compute_jacobian": lambda: flow.transform_and_compute_jacobian(xj),
+        "prior_sampling": lambda: prior(n_batch),
+    }
+
+
+def benchmark_flow_primitives(batch_sizes=None, dimensions=None, n_bins=None, maskings=None, dtypes=None,
+                              cells=None, d_hidden=256, n_hidden=2, n_repeat=10, n_warmup=2, cuda=0, output=None,
+                              baseline=None, tolerance=0.1):
+    if batch_sizes is None:
+        batch_sizes = [1000, 10000, 100000]
+    if dimensions is None:
+        dimensions = [2, 8, 32]
+    if n_bins is None:
+        n_bins = [10, 50]
+    if maskings is None:
+        maskings = ["checkerboard", "maximal"]
+    if dtypes is None:
+        dtypes = ["float32", "float64"]
+    if cells is None:
+        cells = ["pwlinear", "pwquad"]
+    device = get_device(cuda_ID=cuda)
+    cell_params = {"d_hidden": d_hidden, "n_hidden": n_hidden}
+
+    results = []
+
+    def record(kernels, **configuration):
+        for kernel, function in kernels.items():
+            measurement = measure_throughput(function, n_items=configuration["n_batch"], n_repeat=n_repeat,
+                                             n_warmup=n_warmup, device=device)
+            result = {"kernel": kernel, **configuration, **measurement}
+            logger.info(f"{result}")
+            results.append(result)
+
+    with torch.no_grad():
+        for n_batch, d, bins, dtype_name in product(batch_sizes, dimensions, n_bins, dtypes):
+            dtype = resolve_dtype(dtype_name)
+            # The element-wise transforms do not depend on the masking strategy or the conditioners
+            record(transform_kernels(n_batch, d, bins, dtype, device),
+                   cell=None, n_batch=n_batch, d=d, n_bins=bins, masking=None, dtype=dtype_name)
+            for masking, cell in product(maskings, cells):
+                record(flow_kernels(n_batch, d, bins, masking, cell, cell_params, dtype, device),
+                       cell=cell, n_batch=n_batch, d=d, n_bins=bins, masking=masking, dtype=dtype_name)
+
+    results = pd.DataFrame(results)
+    print(results.to_string(index=False))
+
+    metadata = {**hardware_summary(device), "d_hidden": d_hidden, "n_hidden": n_hidden, "n_repeat": n_repeat}
+    if output is not None:
+        save_results(results, output, metadata=metadata)
+
+    if baseline is not None:
+        baseline_results, baseline_metadata = load_results(baseline)
+        if baseline_metadata.get("platform") != metadata["platform"] or \
+                baseline_metadata.get("device") != metadata["device"]:
+            logger.warning("The baseline was measured on a different platform or device")
+        comparison = compare_to_baseline(results.fillna("none"), baseline_results.fillna("none"),
+                                         keys=configuration_keys, tolerance=tolerance)
+        print(comparison.to_string(index=False))
+        if comparison["regression"].any():
+            logger.error(f"{comparison['regression'].sum()} kernels are slower than their baseline")
+            sys.exit(1)
+
+    return results
+
+
+cli = click.Command("cli", callback=benchmark_flow_primitives, params=[
+    PythonLiteralOption(["--batch_sizes"], default=None),
+    PythonLiteralOption(["--dimensions"], default=None),
+    PythonLiteralOption(["--n_bins"], default=None),
+    PythonLiteralOption(["--maskings"], default=None),
+    PythonLiteralOption(["--dtypes"], default=None),
+    PythonLiteralOption(["--cells"], default=None),
+    click.Option(["--d_hidden"], default=256, type=int),
+    click.Option(["--n_hidden"], default=2, type=int),
+    click.Option(["--n_repeat"], default=10, type=int),
+    click.Option(["--n_warmup"], default=2, type=int),
+    click.Option(["--cuda"], default=0, type=int),
+    click.Option(["--output"], default=None, type=str),
+    click.Option(["--baseline"], default=None, type=str),
+    click.Option(["--tolerance"], default=0.1, type=float)
+])
+
+if __name__ == '__main__':
+    cli()
@@ -9,8 +9,8 @@ from utils.integrands.gaussian import DiagonalGaussianIntegrand
 
 def benchmark_gaussian(dimensions=None, sigmas=None, db=None,
                     experiment_name=None, debug=None, cuda=None, keep_history=None,
-                    config=None,
-                    n_search=10):
+                    config=None, n_workers=None, threads_per_worker=None,
+                    n_search=10, seed=None, resume=None):
     dtypes = get_sql_types()
 
     # Integrand specific defaults
@@ -19,12 +19,14 @@ def benchmark_gaussian(dimensions=None, sigmas=None, db=None,
         "norm": 1.
     }
 
-    benchmarker = VegasRandomHPBenchmarker(n=n_search)
+    benchmarker = VegasRandomHPBenchmarker(n=n_search, seed=seed)
 
     benchmark_config = benchmarker.set_benchmark_grid_config(config=config, dimensions=dimensions,
                                                              keep_history=keep_history,
                                                              dbname=db, experiment_name=experiment_name, cuda=cuda,
                                                              debug=debug,
+                                                             n_workers=n_workers, threads_per_worker=threads_per_worker,
+                                                             resume=resume,
                                                              base_integrand_params=base_integrand_params)
 
     # Integrand specific CLI argument mapped to standard API
@@ -43,7 +45,11 @@ cli = click.Command("cli", callback=benchmark_gaussian, params=[
     click.Option(["--db"], default=None, type=str),
     click.Option(["--experiment_name"], default=None, type=str),
     click.Option(["--config"], default=None, type=str),
-    click.Option(["--n_search"], default=10, type=int)
+    click.Option(["--n_workers"], default=None, type=int),
+    click.Option(["--threads_per_worker"], default=None, type=int),
+    click.Option(["--n_search"], default=10, type=int),
+    click.Option(["--seed"], default=None, type=int),
+    click.Option(["--resume/--no-resume"], default=None, type=bool)
 ])
 
 if __name__ == '__main__':
@@ -0,0 +1,182 @@
+"""End-to-end integration throughput benchmark
+
+Full integrations are run on standard integrands in several dimensions. For each of them we record the time spent
+in the survey and refine phases, the number of integrand calls and evaluated points, the peak resident set size, the
+extrapolated time to reach a target relative error and the variance ratio with respect to uniform sampling.
+
+Runs are appended to a versioned JSON history. The latest run can be gated against the previous one with the
+`--tolerance` option or with `compare_benchmark_history.py`.
+"""
+import sys
+import logging
+from itertools import product
+
+import click
+import pandas as pd
+import torch
+
+from utils.command_line_tools import PythonLiteralOption
+from utils.flat_integrals import evaluate_integral_flat
+from utils.integral_validation import time_to_relative_error
+from utils.integrands.gaussian import DiagonalGaussianIntegrand, CamelIntegrand
+from utils.integrands.pretty import CircleLineIntegrand
+from utils.integrands.volume import HypersphereVolumeIntegrand
+from utils.performance import PeakMemoryMonitor, append_to_history, load_history, compare_to_baseline
+from utils.torch_utils import get_device
+from zunis.integration import Integrator
+from zunis.utils.hardware import hardware_summary
+from zunis.utils.timing import TimedFunction, timed_call
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(levelname)s: %(message)s [%(name)s]')
+logger = logging.getLogger("benchmark_integration_throughput")
+
+integrands = {
+    "gaussian": (DiagonalGaussianIntegrand, {"s": 0.1}),
+    "camel": (CamelIntegrand, {"s1": 0.1, "s2": 0.1}),
+    "circleline": (CircleLineIntegrand, {"r": 0.3, "sig": 0.05}),
+    "hypersphere": (HypersphereVolumeIntegrand, {"r": 0.49, "c": 0.5}),
+}
+"""Benchmarked integrands and their parameters"""
+
+configuration_keys = ["integrand", "d", "flow", "n_points_survey", "n_iter_survey", "n_points_refine",
+                      "n_iter_refine"]
+"""Columns identifying a measurement, used to match runs in the history"""
+
+gated_metrics = {"time_to_target_error": False, "integration_time": False, "refine_points_per_second": True}
+"""Metrics checked for regressions and whether larger values are improvements"""
+
+
+def benchmark_integration(integrand, d, flow, n_points_survey, n_iter_survey, n_points_refine, n_iter_refine,
+                          target_relative_error, device):
+    """Integrate an integrand and measure the cost of the integration
+
+    Returns
+    -------
+        dict
+    """
+    integrand_cls, integrand_params = integrands[integrand]
+    f = integrand_cls(d=d, device=device, **integrand_params)
+    timed_f = TimedFunction(f)
+
+    integrator = Integrator(f=timed_f, d=d, flow=flow, device=device, n_points_survey=n_points_survey,
+                            n_iter_survey=n_iter_survey, n_points_refine=n_points_refine, n_iter_refine=n_iter_refine)
+    with PeakMemoryMonitor(device) as monitor:
+        (value, value_std, history), integration_time = timed_call(integrator.integrate)
+
+    timing = integrator.timing_summary()
+    n_refine_points = int(history.loc[history["phase"] == "refine", "n_points"].sum())
+    flat_result = evaluate_integral_flat(f, d, n_batch=n_points_refine, device=device)
+
+    result = {
+        "integrand": integrand,
+        "d": d,
+        "flow": flow,
+        "n_points_survey": n_points_survey,
+        "n_iter_survey": n_iter_survey,
+        "n_points_refine": n_points_refine,
+        "n_iter_refine": n_iter_refine,
+        "value": value,
+        "value_std": value_std,
+        "integration_time": integration_time,
+        "integrand_calls": timed_f.n_calls,
+        "integrand_points": int(history["n_points"].sum()),
+        "integrand_time": timed_f.time,
+        "peak_rss_mb": monitor.peak_rss / 2 ** 20,
+        "peak_memory_mb": monitor.peak_memory / 2 ** 20,
+        "target_relative_error": target_relative_error,
+        "time_to_target_error": time_to_relative_error(value, value_std, n_refine_points,
+                                                       timing.get("refine_time", 0.), target_relative_error,
+                                                       setup_time=timing.get("survey_time", 0.)),
+        # Ratio of the variances per point of the uniform sampling and of the refine estimators
+        "flat_variance_ratio": (flat_result["value_std"] ** 2 * n_points_refine) / (value_std ** 2 * n_refine_points)
+        if value_std > 0. else float("inf"),
+        **timing
+    }
+    logger.info(f"{integrand}, d={d}: {value:.3e} +/- {value_std:.3e} in {integration_time:.2f}s, "
+                f"time to {target_relative_error:.1e} relative error: {result['time_to_target_error']:.2e}s")
+    return result
+
+
+def compare_runs(run, reference, tolerance=0.1):
+    """Compare the gated metrics of two runs of the history
+
+    Parameters
+    ----------
+    run: dict
+    reference: dict
+        runs as stored in the history
+    tolerance: float
+        relative degradation above which a configuration is flagged as a regression
+
+    Returns
+    -------
+        pandas.Dataframe
+            one row per configuration and metric
+    """
+    results = pd.DataFrame(run["results"])
+    reference_results = pd.DataFrame(reference["results"])
+    comparisons = []
+    for metric, higher_is_better in gated_metrics.items():
+        if metric not in results or metric not in reference_results:
+            continue
+        comparison = compare_to_baseline(results, reference_results, keys=configuration_keys, metric=metric,
+                                         tolerance=tolerance, higher_is_better=higher_is_better)
+        comparison = comparison.rename(columns={metric: "value", f"{metric}_baseline": "reference"})
+        comparison["metric"] = metric
+        comparisons.append(comparison)
+    if len(comparisons) == 0:
+        return pd.DataFrame({"metric": [], "regression": []})
+    return pd.concat(comparisons, ignore_index=True, sort=False)
+
+
+def benchmark_integration_throughput(integrand_names=None, dimensions=None, flow="pwquad", n_points_survey=10000,
+                                     n_iter_survey=10, n_points_refine=100000, n_iter_refine=5,
+                                     target_relative_error=1.e-3, seed=None, cuda=0, history=None, tolerance=None):
+    if integrand_names is None:
+        integrand_names = list(integrands)
+    if dimensions is None:
+        dimensions = [2, 4, 8]
+    device = get_device(cuda_ID=cuda)
+
+    results = []
+    for integrand, d in product(integrand_names, dimensions):
+        if seed is not None:
+            torch.manual_seed(seed)
+        results.append(benchmark_integration(integrand, d, flow, n_points_survey, n_iter_survey, n_points_refine,
+                                             n_iter_refine, target_relative_error, device))
+
+    results = pd.DataFrame(results)
+    print(results[configuration_keys + list(gated_metrics) + ["flat_variance_ratio", "peak_rss_mb"]]
+          .to_string(index=False))
+
+    if history is not None:
+        append_to_history(results, history, metadata={**hardware_summary(device), "seed": seed})
+
+        runs = load_history(history)["runs"]
+        if tolerance is not None and len(runs) > 1:
+            comparison = compare_runs(runs[-1], runs[-2], tolerance=tolerance)
+            print(comparison.to_string(index=False))
+            if comparison["regression"].any():
+                logger.error(f"{comparison['regression'].sum()} metrics regressed with respect to the previous run")
+                sys.exit(1)
+
+    return results
+
+
+cli = click.Command("cli", callback=benchmark_integration_throughput, params=[
+    PythonLiteralOption(["--integrand_names"], default=None),
+    PythonLiteralOption(["--dimensions"], default=None),
+    click.Option(["--flow"], default="pwquad", type=str),
+    click.Option(["--n_points_survey"], default=10000, type=int),
+    click.Option(["--n_iter_survey"], default=10, type=int),
+    click.Option(["--n_points_refine"], default=100000, type=int),
+    click.Option(["--n_iter_refine"], default=5, type=int),
+    click.Option(["--target_relative_error"], default=1.e-3, type=float),
+    click.Option(["--seed"], default=None, type=int),
+    click.Option(["--cuda"], default=0, type=int),
+    click.Option(["--history"], default=None, type=str),
+    click.Option(["--tolerance"], default=None, type=float)
+])
+
+if __name__ == '__main__':
+    cli()
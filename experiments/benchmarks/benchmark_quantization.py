@@ -0,0 +1,94 @@
+"""Comparing CPU sampling with float32 and with dynamically quantized int8 conditioners
+
+An integrator is trained on a gaussian integrand, then refine batches are sampled from the trained flow and from
+its quantized copy. We report the sampling throughputs, the integral estimates and the relative variances of
+the importance weights.
+"""
+import sys
+import logging
+from time import perf_counter
+
+import click
+import pandas as pd
+import torch
+
+from utils.integrands.gaussian import DiagonalGaussianIntegrand
+from zunis.integration import Integrator
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(levelname)s: %(message)s [%(name)s]')
+logger = logging.getLogger("benchmark_quantization")
+
+
+def time_sampling(integrator, n_batch, n_repeat):
+    """Sample refine batches and measure the sampling throughput
+
+    Returns
+    -------
+        dict
+    """
+    # Warm-up run
+    integrator.sample_refine(n_points=n_batch)
+
+    weights = []
+    start = perf_counter()
+    for _ in range(n_repeat):
+        x, px, fx = integrator.sample_refine(n_points=n_batch)
+        weights.append((fx / px).to(torch.float64))
+    duration = perf_counter() - start
+
+    weights = torch.cat(weights)
+    return {
+        "points_per_second": n_batch * n_repeat / duration,
+        "integral": weights.mean().item(),
+        "error": (weights.var() / weights.shape[0]).sqrt().item(),
+        "relative_variance": (weights.var() / weights.mean() ** 2).item()
+    }
+
+
+def benchmark_quantization(d=8, flow="pwquad", n_hidden=4, d_hidden=256, n_points_survey=10000, n_iter_survey=10,
+                           n_batch=100000, n_repeat=10, n_threads=None, output=None):
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+
+    f = DiagonalGaussianIntegrand(d=d, s=0.1)
+    integrator = Integrator(f=f, d=d, flow=flow, n_points_survey=n_points_survey, n_iter_survey=n_iter_survey,
+                            flow_options={"cell_params": {"d_hidden": d_hidden, "n_hidden": n_hidden}},
+                            device=torch.device("cpu"))
+    integrator.survey()
+
+    results = []
+    with torch.no_grad():
+        result = time_sampling(integrator, n_batch, n_repeat)
+        result["conditioners"] = "float32"
+        logger.info(str(result))
+        results.append(result)
+
+        integrator.model_trainer.quantize_for_inference()
+        result = time_sampling(integrator, n_batch, n_repeat)
+        result["conditioners"] = "int8"
+        logger.info(str(result))
+        results.append(result)
+
+    results = pd.DataFrame(results)
+    results["speedup"] = results["points_per_second"] / results["points_per_second"].iloc[0]
+    print(results.to_string(index=False))
+    if output is not None:
+        results.to_csv(output, index=False)
+    return results
+
+
+cli = click.Command("cli", callback=benchmark_quantization, params=[
+    click.Option(["--d"], default=8, type=int),
+    click.Option(["--flow"], default="pwquad", type=str),
+    click.Option(["--n_hidden"], default=4, type=int),
+    click.Option(["--d_hidden"], default=256, type=int),
+    click.Option(["--n_points_survey"], default=10000, type=int),
+    click.Option(["--n_iter_survey"], default=10, type=int),
+    click.Option(["--n_batch"], default=100000, type=int),
+    click.Option(["--n_repeat"], default=10, type=int),
+    click.Option(["--n_threads"], default=None, type=int),
+    click.Option(["--output"], default=None, type=str)
+])
+
+if __name__ == '__main__':
+    cli()
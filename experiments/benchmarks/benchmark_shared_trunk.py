@@ -0,0 +1,107 @@
+"""Comparing coupling cells with independent conditioners and with a shared conditioner trunk
+
+For each architecture, the integrator is trained on a gaussian integrand and we report the number of parameters,
+the training and sampling throughputs and the variance of the integral estimator after training.
+"""
+import sys
+import logging
+from time import perf_counter
+
+import click
+import pandas as pd
+import torch
+
+from utils.command_line_tools import PythonLiteralOption
+from utils.integrands.gaussian import DiagonalGaussianIntegrand
+from utils.torch_utils import get_device
+from zunis.integration import Integrator
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(levelname)s: %(message)s [%(name)s]')
+logger = logging.getLogger("benchmark_shared_trunk")
+
+
+def benchmark_architecture(f, d, flow, flow_options, n_points_survey, n_iter_survey, n_epochs, n_batch, device):
+    """Train an integrator and measure its throughput and variance reduction
+
+    Returns
+    -------
+        dict
+    """
+    integrator = Integrator(f=f, d=d, flow=flow, flow_options=flow_options, n_points_survey=n_points_survey,
+                            n_iter_survey=n_iter_survey, trainer_options={"n_epochs": n_epochs}, device=device)
+    n_parameters = sum(p.numel() for p in integrator.model_trainer.flow.parameters())
+
+    start = perf_counter()
+    integrator.survey()
+    survey_time = perf_counter() - start
+
+    start = perf_counter()
+    with torch.no_grad():
+        x, px, fx = integrator.sample_refine(n_points=n_batch)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    sampling_time = perf_counter() - start
+
+    weights = (fx / px).to(torch.float64)
+    relative_variance = (weights.var() / weights.mean() ** 2).cpu().item()
+
+    return {
+        "n_parameters": n_parameters,
+        "training_points_per_second": n_points_survey * n_iter_survey * n_epochs / survey_time,
+        "sampling_points_per_second": n_batch / sampling_time,
+        "relative_variance": relative_variance
+    }
+
+
+def benchmark_shared_trunk(d=8, flow="pwrq", masking="iflow", repetitions=2, n_hidden=8, d_hidden=256,
+                           trunk_d_hidden=None, n_points_survey=10000, n_iter_survey=10, n_epochs=10,
+                           n_batch=100000, cuda=0, output=None):
+    device = get_device(cuda_ID=cuda)
+    f = DiagonalGaussianIntegrand(d=d, s=0.1, device=device)
+
+    base_options = {
+        "masking": masking,
+        "masking_options": {"repetitions": repetitions}
+    }
+    architectures = {
+        "independent": {**base_options,
+                        "cell_params": {"d_hidden": d_hidden, "n_hidden": n_hidden}},
+        "shared_trunk": {**base_options,
+                         "shared_trunk": {"d_hidden": trunk_d_hidden if trunk_d_hidden is not None else d_hidden,
+                                          "n_hidden": n_hidden}}
+    }
+
+    results = []
+    for name, flow_options in architectures.items():
+        logger.info(f"Benchmarking {name} conditioners")
+        result = benchmark_architecture(f, d, flow, flow_options, n_points_survey, n_iter_survey, n_epochs,
+                                        n_batch, device)
+        result["architecture"] = name
+        logger.info(str(result))
+        results.append(result)
+
+    results = pd.DataFrame(results)
+    print(results.to_string(index=False))
+    if output is not None:
+        results.to_csv(output, index=False)
+    return results
+
+
+cli = click.Command("cli", callback=benchmark_shared_trunk, params=[
+    click.Option(["--d"], default=8, type=int),
+    click.Option(["--flow"], default="pwrq", type=str),
+    click.Option(["--masking"], default="iflow", type=str),
+    click.Option(["--repetitions"], default=2, type=int),
+    click.Option(["--n_hidden"], default=8, type=int),
+    click.Option(["--d_hidden"], default=256, type=int),
+    PythonLiteralOption(["--trunk_d_hidden"], default=None),
+    click.Option(["--n_points_survey"], default=10000, type=int),
+    click.Option(["--n_iter_survey"], default=10, type=int),
+    click.Option(["--n_epochs"], default=10, type=int),
+    click.Option(["--n_batch"], default=100000, type=int),
+    click.Option(["--cuda"], default=0, type=int),
+    click.Option(["--output"], default=None, type=str)
+])
+
+if __name__ == '__main__':
+    cli()
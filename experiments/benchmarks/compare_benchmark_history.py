@@ -0,0 +1,46 @@
+"""Compare two runs of an end-to-end benchmark history and flag slowdowns
+
+By default, the last run is compared with the one before it. The script exits with a non-zero status if a gated
+metric of a configuration degraded by more than the tolerance.
+"""
+import sys
+import logging
+
+import click
+
+from benchmark_integration_throughput import compare_runs
+from utils.performance import load_history
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(levelname)s: %(message)s [%(name)s]')
+logger = logging.getLogger("compare_benchmark_history")
+
+
+def compare_benchmark_history(history, run=-1, reference=-2, tolerance=0.1):
+    runs = load_history(history)["runs"]
+    if len(runs) < 2:
+        logger.error(f"{history} holds {len(runs)} runs, at least two are needed for a comparison")
+        sys.exit(1)
+
+    for index in (run, reference):
+        logger.info(f"Run {index}: {runs[index]['date']}, code version {runs[index]['code_version']}")
+    if runs[run]["metadata"].get("platform") != runs[reference]["metadata"].get("platform") or \
+            runs[run]["metadata"].get("device") != runs[reference]["metadata"].get("device"):
+        logger.warning("The runs were measured on different platforms or devices")
+
+    comparison = compare_runs(runs[run], runs[reference], tolerance=tolerance)
+    print(comparison.to_string(index=False))
+    if comparison["regression"].any():
+        logger.error(f"{comparison['regression'].sum()} metrics regressed beyond a relative tolerance of {tolerance}")
+        sys.exit(1)
+    return comparison
+
+
+cli = click.Command("cli", callback=compare_benchmark_history, params=[
+    click.Argument(["history"], type=str),
+    click.Option(["--run"], default=-1, type=int),
+    click.Option(["--reference"], default=-2, type=int),
+    click.Option(["--tolerance"], default=0.1, type=float)
+])
+
+if __name__ == '__main__':
+    cli()
@@ -1,7 +1,12 @@
+import json
 import logging
+import multiprocessing
 import random
-from collections import Sequence, MutableMapping
+from collections import Sequence, Mapping, MutableMapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from copy import deepcopy
+from functools import partial
+from hashlib import sha1
 from itertools import product
 from typing import Dict, List
 
@@ -12,13 +17,101 @@ from dictwrapper import NestedMapping
 from zunis.utils.config.configuration import Configuration
 from utils.config.loaders import get_sql_types
 from zunis.utils.config.loaders import get_default_integrator_config
-from utils.data_storage.dataframe2sql import append_dataframe_to_sqlite
+from utils.data_storage.dataframe2sql import append_dataframe_to_sqlite, read_completed_config_hashes
+from utils.data_storage.result_sink import SQLiteResultSink
 from utils.logging import set_benchmark_logger_debug, set_benchmark_logger
 from utils.torch_utils import get_device
 
 logger = logging.getLogger(__name__)
 
 
+def normalize_config_value(value):
+    """Convert a configuration value into a JSON-serializable value that is identical across processes
+
+    Scalar arrays are converted to numbers, dtypes and devices to strings, functions and classes to their qualified
+    names and partial functions to their function, arguments and keyword arguments.
+
+    Raises
+    ------
+        TypeError
+            if the value cannot be normalized. Falling back to `repr` would make hashes depend on memory addresses
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [normalize_config_value(item) for item in value]
+    if isinstance(value, NestedMapping):
+        value = value.as_flat_dict()
+    if isinstance(value, Mapping):
+        return {str(key): normalize_config_value(item) for key, item in value.items()}
+    # Scalars of numpy or torch
+    if getattr(value, "ndim", None) == 0 and hasattr(value, "item"):
+        return normalize_config_value(value.item())
+    if isinstance(value, (torch.dtype, torch.device)):
+        return str(value)
+    if isinstance(value, partial):
+        return {"function": normalize_config_value(value.func), "args": normalize_config_value(value.args),
+                "keywords": normalize_config_value(value.keywords)}
+    if callable(value) and hasattr(value, "__module__") and hasattr(value, "__qualname__"):
+        return f"{value.__module__}.{value.__qualname__}"
+    raise TypeError(f"Cannot hash the configuration value {value!r} of type {type(value).__name__}")
+
+
+def config_hash(d, integrator_config, integrand_params):
+    """Hash a benchmark configuration to identify it across runs
+
+    Values are normalized with :py:func:`normalize_config_value`.
+
+    Parameters
+    ----------
+    d: int
+    integrator_config: dict or NestedMapping
+    integrand_params: dict or NestedMapping
+
+    Returns
+    -------
+        str
+    """
+    def as_flat_dict(mapping):
+        if isinstance(mapping, NestedMapping):
+            return mapping.as_flat_dict()
+        return dict(mapping)
+
+    key = normalize_config_value({"d": d, "integrator_config": as_flat_dict(integrator_config),
+                                  "integrand_params": as_flat_dict(integrand_params)})
+    return sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def initialize_benchmark_worker(threads_per_worker=None, debug=True, experiment_name="benchmark"):
+    """Set up logging and limit the number of torch threads in a benchmark worker process"""
+    if threads_per_worker is not None:
+        torch.set_num_threads(threads_per_worker)
+    if debug:
+        set_benchmark_logger_debug(zunis_integration_level=logging.DEBUG,
+                                   zunis_training_level=logging.DEBUG, zunis_level=logging.DEBUG)
+    else:
+        set_benchmark_logger(experiment_name)
+
+
+def run_benchmark_in_worker(benchmarker, d, integrand, integrand_params, integrator_config, n_batch, device,
+                            keep_history):
+    """Run a single benchmark in a worker process and return its result as a dataframe
+
+    Integrators are not sent back to the parent process
+    """
+    try:
+        result, _ = benchmarker.benchmark_method(d, integrand=integrand,
+                                                 integrand_params=integrand_params,
+                                                 integrator_config=integrator_config,
+                                                 n_batch=n_batch, device=device,
+                                                 keep_history=keep_history)
+        result["status"] = "done"
+    except Exception as e:
+        logger.exception(e)
+        result = benchmarker.failed_benchmark_result(d, integrator_config, integrand_params, e)
+    return result.as_dataframe()
+
+
 class Benchmarker(ABC):
     """Benchmarker class used to run benchmarks of our integrator comparing to others and perform parameter scans"""
 
@@ -81,7 +174,8 @@ class Benchmarker(ABC):
 
     def set_benchmark_grid_config(self, config=None, dimensions=None, n_batch=None, keep_history=None,
                                   dbname=None, experiment_name=None, cuda=None, debug=None,
-                                  default_dimension=(2,), base_integrand_params=()):
+                                  default_dimension=(2,), base_integrand_params=(), n_workers=None,
+                                  threads_per_worker=None, resume=None):
         """Prepare standard arguments for `run_benchmark_grid`
         The parameter importance hierarchy is:
         1. CLI arguments (direct arguments to this function)
@@ -99,7 +193,10 @@ class Benchmarker(ABC):
             "dbname": None,
             "experiment_name": "benchmark",
             "cuda": 0,
-            "debug": True
+            "debug": True,
+            "n_workers": 1,
+            "threads_per_worker": None,
+            "resume": True
         }
         if config is not None and not isinstance(config, Configuration):
             config = Configuration.from_yaml(config, check=False)
@@ -122,6 +219,9 @@ class Benchmarker(ABC):
         self.set_benchmark_grid_config_param(benchmark_config, "experiment_name", experiment_name, config)
         self.set_benchmark_grid_config_param(benchmark_config, "cuda", cuda, config)
         self.set_benchmark_grid_config_param(benchmark_config, "debug", debug, config)
+        self.set_benchmark_grid_config_param(benchmark_config, "n_workers", n_workers, config)
+        self.set_benchmark_grid_config_param(benchmark_config, "threads_per_worker", threads_per_worker, config)
+        self.set_benchmark_grid_config_param(benchmark_config, "resume", resume, config)
 
         return benchmark_config
 
@@ -129,8 +229,21 @@ class Benchmarker(ABC):
             base_integrand_params, base_integrator_config=None,
             integrand_params_grid=None, integrator_config_grid=None,
             n_batch=100000, debug=True, cuda=0,
-            sql_dtypes=None, dbname=None, experiment_name="benchmark", keep_history=False):
-        """Run benchmarks over a grid of parameters for the integrator and the integrand."""
+            sql_dtypes=None, dbname=None, experiment_name="benchmark", keep_history=False,
+            n_workers=1, threads_per_worker=None, resume=True, sink_options=None):
+        """Run benchmarks over a grid of parameters for the integrator and the integrand.
+
+        With `n_workers` larger than 1, the configurations of the grid are dispatched to a pool of worker
+        processes, each using at most `threads_per_worker` torch threads. Results are written to the database
+        by the parent process as soon as each benchmark finishes so that partial results survive crashes.
+
+        Each result is stored with a hash of its configuration (see :py:func:`config_hash`) and a status
+        ("done" or "failed"). If `resume` is True, configurations already completed in the results table are
+        skipped, so that an interrupted sweep can be restarted at little cost. Failed configurations are run again.
+
+        Results of parameter grids are written through a :py:class:`SQLiteResultSink
+        <utils.data_storage.result_sink.SQLiteResultSink>` configured by `sink_options`.
+        """
 
         if debug:
             set_benchmark_logger_debug(zunis_integration_level=logging.DEBUG,
@@ -149,11 +262,24 @@ class Benchmarker(ABC):
         if sql_dtypes is None:
             sql_dtypes = get_sql_types()
 
+        completed = set()
+        if resume and dbname is not None:
+            completed = read_completed_config_hashes(dbname=dbname, tablename=experiment_name)
+            if len(completed) > 0:
+                logger.info(f"Resuming: {len(completed)} configurations already completed")
+
         if integrand_params_grid is None and integrator_config_grid is None and len(dimensions) == 1:
+            benchmark_hash = config_hash(dimensions[0], base_integrator_config or get_default_integrator_config(),
+                                         base_integrand_params)
+            if benchmark_hash in completed:
+                logger.info("This configuration was already completed, skipping")
+                return None, None
             result, integrator = self.benchmark_method(dimensions[0], integrand=integrand,
                                            integrand_params=base_integrand_params,
                                            integrator_config=base_integrator_config,
                                            n_batch=n_batch, device=device, keep_history=keep_history)
+            result["config_hash"] = benchmark_hash
+            result["status"] = "done"
             result = result.as_dataframe()
 
             if dbname is not None:
@@ -173,33 +299,145 @@ class Benchmarker(ABC):
 
             benchmarks = self.generate_config_samples(dimensions, integrator_config_grid, integrand_params_grid)
 
-            for d, integrator_config_update, integrand_params_update in benchmarks:
-                logger.info("Benchmarking with:")
-                logger.info(f"d = {d}")
-                logger.info(f"integrator update: {integrator_config_update}")
-                logger.info(f"integrand update: {integrand_params_update}")
-                integrator_config.update(integrator_config_update)
-                integrand_params.update(integrand_params_update)
+            sink = None
+            if dbname is not None:
+                if sink_options is None:
+                    sink_options = dict()
+                sink = SQLiteResultSink(dbname, tablename=experiment_name, dtypes=sql_dtypes, **sink_options)
+
+            try:
+                if n_workers is not None and n_workers > 1:
+                    self.run_parallel(benchmarks, integrand, integrator_config=integrator_config,
+                                      integrand_params=integrand_params, n_batch=n_batch, device=device,
+                                      keep_history=keep_history, sink=sink, experiment_name=experiment_name,
+                                      debug=debug, n_workers=n_workers, threads_per_worker=threads_per_worker,
+                                      completed=completed)
+                else:
+                    self.run_serial(benchmarks, integrand, integrator_config=integrator_config,
+                                    integrand_params=integrand_params, n_batch=n_batch, device=device,
+                                    keep_history=keep_history, sink=sink, completed=completed)
+            finally:
+                if sink is not None:
+                    sink.close()
+
+    def run_serial(self, benchmarks, integrand, *, integrator_config, integrand_params, n_batch, device,
+                   keep_history, sink=None, completed=()):
+        """Run benchmarks one after the other in the current process
 
+        Parameters
+        ----------
+        benchmarks: iterable
+            triplets (d, integrator config update, integrand parameters update) as yielded by
+            :py:meth:`generate_config_samples`
+        integrand: callable
+            integrand constructor
+        integrator_config: dict
+            base integrator configuration, updated in place
+        integrand_params: dict
+            base integrand parameters, updated in place
+        sink: SQLiteResultSink, None
+            where to write results
+        completed: container of str
+            hashes of the configurations to skip
+        """
+        for d, integrator_config_update, integrand_params_update in benchmarks:
+            logger.info("Benchmarking with:")
+            logger.info(f"d = {d}")
+            logger.info(f"integrator update: {integrator_config_update}")
+            logger.info(f"integrand update: {integrand_params_update}")
+            integrator_config.update(integrator_config_update)
+            integrand_params.update(integrand_params_update)
+
+            benchmark_hash = config_hash(d, integrator_config, integrand_params)
+            if benchmark_hash in completed:
+                logger.info("This configuration was already completed, skipping")
+                continue
+
+            try:
+                result, _ = self.benchmark_method(d, integrand=integrand,
+                                                  integrand_params=integrand_params,
+                                                  integrator_config=integrator_config,
+                                                  n_batch=n_batch, device=device,
+                                                  keep_history=keep_history)
+                result["status"] = "done"
+
+            except Exception as e:
+                logger.exception(e)
+                result = self.failed_benchmark_result(d, integrator_config, integrand_params, e)
+            result["config_hash"] = benchmark_hash
+
+            if sink is not None:
+                sink.append(result.as_dataframe())
+
+    @staticmethod
+    def failed_benchmark_result(d, integrator_config, integrand_params, error):
+        """Result record of a benchmark that raised an exception"""
+        result = NestedMapping()
+        result["d"] = d
+        result.update(integrator_config)
+        result.update(integrand_params)
+        result["extra_data"] = error
+        result["status"] = "failed"
+        return result
+
+    def run_parallel(self, benchmarks, integrand, *, integrator_config, integrand_params, n_batch, device,
+                     keep_history, experiment_name, debug, n_workers, threads_per_worker=None, sink=None,
+                     completed=()):
+        """Run benchmarks in a pool of worker processes
+
+        Workers are started with the "spawn" method, which is required to use CUDA in subprocesses.
+        The parent process is the only one writing to the sink.
+
+        Parameters
+        ----------
+        benchmarks: iterable
+            triplets (d, integrator config update, integrand parameters update) as yielded by
+            :py:meth:`generate_config_samples`
+        integrand: callable
+            integrand constructor, must be picklable
+        integrator_config: dict
+            base integrator configuration
+        integrand_params: dict
+            base integrand parameters
+        n_workers: int
+            number of worker processes
+        threads_per_worker: None or int
+            maximum number of torch threads per worker. If None, torch decides
+        sink: SQLiteResultSink, None
+            where to write results
+        completed: container of str
+            hashes of the configurations to skip
+        """
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context, initializer=initialize_benchmark_worker,
+                                 initargs=(threads_per_worker, debug, experiment_name)) as executor:
+            futures = dict()
+            for d, integrator_config_update, integrand_params_update in benchmarks:
+                config = deepcopy(integrator_config)
+                config.update(integrator_config_update)
+                params = deepcopy(integrand_params)
+                params.update(integrand_params_update)
+                benchmark_hash = config_hash(d, config, params)
+                if benchmark_hash in completed:
+                    continue
+                future = executor.submit(run_benchmark_in_worker, self, d, integrand, params, config, n_batch,
+                                         device, keep_history)
+                futures[future] = (d, config, params, benchmark_hash)
+            logger.info(f"Dispatched {len(futures)} benchmarks to {n_workers} workers")
+
+            for i, future in enumerate(as_completed(futures)):
+                d, config, params, benchmark_hash = futures[future]
                 try:
-                    result, _ = self.benchmark_method(d, integrand=integrand,
-                                                   integrand_params=integrand_params,
-                                                   integrator_config=integrator_config,
-                                                   n_batch=n_batch, device=device,
-                                                   keep_history=keep_history)
-                    
+                    result = future.result()
                 except Exception as e:
+                    # The worker process died
                     logger.exception(e)
-                    result = NestedMapping()
-                    result["d"] = d
-                    result.update(integrator_config)
-                    result.update(integrand_params)
-                    result["extra_data"] = e
-                    result = result.as_dataframe()
+                    result = self.failed_benchmark_result(d, config, params, e).as_dataframe()
+                result["config_hash"] = benchmark_hash
+                logger.info(f"Finished benchmark {i + 1}/{len(futures)}")
 
-                if dbname is not None:
-                    append_dataframe_to_sqlite(result.as_dataframe(), dbname=dbname, tablename=experiment_name,
-                                               dtypes=sql_dtypes)
+                if sink is not None:
+                    sink.append(result)
 
 
 class GridBenchmarker(Benchmarker):
@@ -225,19 +463,24 @@ class GridBenchmarker(Benchmarker):
 class RandomHyperparameterBenchmarker(Benchmarker):
     """Benchmark by sampling integrator configurations randomly, a fixed number of times"""
 
-    def __init__(self, n=5):
+    def __init__(self, n=5, seed=None):
         """
 
         Parameters
         ----------
         n_attempts : int
             Number of random integrator configurations to draw
+        seed : int, optional
+            Seed of the random configuration draws. Setting it makes the sequence of configurations reproducible,
+            which is necessary to resume an interrupted run
         """
         self.n = n
+        self.seed = seed
 
     def generate_config_samples(self, dimensions, integrator_grid, integrand_grid):
         integrand_grid_keys = integrand_grid.keys()
         integrand_grid_values = integrand_grid.values()
+        rng = random.Random(self.seed) if self.seed is not None else random
 
         for d in dimensions:
             # Need to reset our cartesian product iterator at each pass through
@@ -246,7 +489,7 @@ class RandomHyperparameterBenchmarker(Benchmarker):
                 for i in range(self.n):
                     integrator_config_update = dict()
                     for param_name, param_grid in integrator_grid.items():
-                        integrator_config_update[param_name] = random.choice(param_grid)
+                        integrator_config_update[param_name] = rng.choice(param_grid)
                     integrand_config_update = dict(zip(integrand_grid_keys, integrand_update))
                     yield d, integrator_config_update, integrand_config_update
 
@@ -9,24 +9,44 @@ from utils.repo_info import get_git_summary
 logger = logging.getLogger(__name__)
 
 
-def append_dataframe_to_sqlite(dataframe, dbname="", tablename="results", dtypes=None, log_git_info=True):
-    """Append dataframe to a SQLite
+def add_missing_columns(connection, tablename, columns):
+    """Add columns to an existing SQL table if they are missing, for example when appending results with
+    new fields to a table created by an older version of the benchmarks
+
+    Parameters
+    ----------
+    connection: sqlalchemy.engine.Connection
+    tablename: str
+    columns: list of str
+    """
+    inspector = sql.inspect(connection)
+    if tablename not in inspector.get_table_names():
+        return
+    existing_columns = set(column["name"] for column in inspector.get_columns(tablename))
+    for column in columns:
+        if column not in existing_columns:
+            logger.info(f"Adding column {column} to table {tablename}")
+            connection.execute(sql.text(f'ALTER TABLE "{tablename}" ADD COLUMN "{column}"'))
+
+
+def prepare_dataframe_for_sql(dataframe, dtypes=None, git_info=None):
+    """Add the bookkeeping columns of result tables to a dataframe and set the SQL types of special columns
 
     Parameters
     ----------
     dataframe: pandas.Dataframe
-    dbname
-    tablename
-    types
+    dtypes: dict, None
+    git_info: str, None
+        summary of the repository status (see :py:func:`utils.repo_info.get_git_summary`). Not logged if None
 
+    Returns
+    -------
+        tuple
+            (dataframe, dtypes)
     """
-    engine = sql.create_engine(f"sqlite:///{dbname}")
-
-    if dtypes is None:
-        dtypes = dict()
+    dtypes = dict() if dtypes is None else dict(dtypes)
 
-    if log_git_info:
-        git_info = get_git_summary()
+    if git_info is not None:
         if "git_info" in dataframe.columns:
             dataframe["git_info"] = dataframe["git_info"].fillna(git_info)
         else:
@@ -37,12 +57,44 @@ def append_dataframe_to_sqlite(dataframe, dbname="", tablename="results", dtypes
         dataframe["extra_data"] = [()] * len(dataframe)
     dtypes["extra_data"] = sql.types.PickleType
 
+    if "config_hash" in dataframe:
+        dtypes["config_hash"] = sql.String
+    if "status" in dataframe:
+        dtypes["status"] = sql.String
+
     if "value_history" in dataframe:
         dtypes["value_history"] = sql.types.PickleType
     if "target_history" in dataframe:
         dtypes["target_history"] = sql.types.PickleType
 
-    dataframe.to_sql(tablename, con=engine, index=False, if_exists="append", dtype=dtypes)
+    return dataframe, dtypes
+
+
+def write_dataframe_to_sqlite(dataframe, engine, tablename="results", dtypes=None):
+    """Append a prepared dataframe to a SQLite table in a single transaction"""
+    with engine.begin() as connection:
+        add_missing_columns(connection, tablename, [str(column) for column in dataframe.columns])
+        dataframe.to_sql(tablename, con=connection, index=False, if_exists="append", dtype=dtypes)
+
+
+def append_dataframe_to_sqlite(dataframe, dbname="", tablename="results", dtypes=None, log_git_info=True):
+    """Append dataframe to a SQLite
+
+    This opens a database connection and collects the repository information at each call. To write many results,
+    use :py:class:`utils.data_storage.result_sink.SQLiteResultSink` instead.
+
+    Parameters
+    ----------
+    dataframe: pandas.Dataframe
+    dbname
+    tablename
+    types
+
+    """
+    engine = sql.create_engine(f"sqlite:///{dbname}")
+    git_info = get_git_summary() if log_git_info else None
+    dataframe, dtypes = prepare_dataframe_for_sql(dataframe, dtypes=dtypes, git_info=git_info)
+    write_dataframe_to_sqlite(dataframe, engine, tablename=tablename, dtypes=dtypes)
 
 
 def read_pkl_sql(dbname="", tablename="results", dtypes=None):
@@ -74,3 +126,26 @@ def read_pkl_sql(dbname="", tablename="results", dtypes=None):
 
     df.columns = df.columns.astype(str)
     return df
+
+
+def read_completed_config_hashes(dbname="", tablename="results"):
+    """Read the configuration hashes of the benchmarks successfully completed in a results table
+
+    Parameters
+    ----------
+    dbname: str
+    tablename: str
+
+    Returns
+    -------
+        set of str
+            empty if the table does not exist or does not record configuration hashes
+    """
+    engine = sql.create_engine(f"sqlite:///{dbname}")
+    query = f'SELECT DISTINCT config_hash FROM "{tablename}" WHERE status = \'done\' AND config_hash IS NOT NULL'
+    try:
+        hashes = pd.read_sql(query, con=engine)
+    except sql.exc.OperationalError as e:
+        logger.debug(f"No completed configuration found in table {tablename}: {e}")
+        return set()
+    return set(hashes["config_hash"])
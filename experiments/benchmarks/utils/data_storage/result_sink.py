@@ -0,0 +1,113 @@
+"""Buffered writer of benchmark results to SQLite databases"""
+import logging
+from time import monotonic
+
+import pandas as pd
+import sqlalchemy as sql
+from utils.data_storage.dataframe2sql import prepare_dataframe_for_sql, write_dataframe_to_sqlite
+from utils.repo_info import get_git_summary
+
+logger = logging.getLogger(__name__)
+
+
+def enable_wal(engine):
+    """Set the SQLite journal mode of all the connections of an engine to write-ahead logging
+
+    In WAL mode, readers do not block the writer and the writer does not block readers, so that results can be
+    analysed while a benchmark is running.
+    """
+    @sql.event.listens_for(engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+class SQLiteResultSink:
+    """Write benchmark results to a SQLite table in bulk
+
+    A single database engine is used for the whole run and the repository information is collected once.
+    By default, each result is written in its own transaction as soon as it is appended, so that finished results
+    survive a crash or a kill of the process. Results can instead be buffered and written in one transaction once
+    `flush_every` rows are buffered or `flush_interval` seconds have passed since the last write, which is only
+    worth it for results much cheaper to produce than a transaction. Buffered results are written when the sink is
+    closed, which happens automatically when it is used as a context manager, including when an exception is raised.
+
+    Example
+    -------
+    >>> with SQLiteResultSink("results.db", tablename="benchmark") as sink:
+    ...     for result in results:
+    ...         sink.append(result)
+    """
+
+    def __init__(self, dbname, tablename="results", dtypes=None, log_git_info=True, flush_every=1,
+                 flush_interval=30., wal=True):
+        """
+
+        Parameters
+        ----------
+        dbname: str
+            path to the SQLite database
+        tablename: str
+        dtypes: dict, None
+            SQL types of the columns
+        log_git_info: bool
+            whether to record the repository status with each result
+        flush_every: int
+            number of buffered rows that triggers a write. Buffered rows are lost if the process is killed
+        flush_interval: float
+            time in seconds after which buffered rows are written at the next append
+        wal: bool
+            whether to use write-ahead logging
+        """
+        self.dbname = dbname
+        self.tablename = tablename
+        self.dtypes = dtypes
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        self.engine = sql.create_engine(f"sqlite:///{dbname}")
+        if wal:
+            enable_wal(self.engine)
+
+        self.git_info = get_git_summary() if log_git_info else None
+
+        self.buffer = []
+        self.n_buffered_rows = 0
+        self.last_flush = monotonic()
+
+    def append(self, dataframe):
+        """Buffer results and write them if the buffer is full or old enough
+
+        Parameters
+        ----------
+        dataframe: pandas.Dataframe
+        """
+        dataframe, self.dtypes = prepare_dataframe_for_sql(dataframe, dtypes=self.dtypes, git_info=self.git_info)
+        self.buffer.append(dataframe)
+        self.n_buffered_rows += len(dataframe)
+
+        if self.n_buffered_rows >= self.flush_every or monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered results in a single transaction"""
+        if len(self.buffer) > 0:
+            dataframe = pd.concat(self.buffer, ignore_index=True, sort=False)
+            write_dataframe_to_sqlite(dataframe, self.engine, tablename=self.tablename, dtypes=self.dtypes)
+            logger.debug(f"Wrote {len(dataframe)} rows to table {self.tablename}")
+            self.buffer = []
+            self.n_buffered_rows = 0
+        self.last_flush = monotonic()
+
+    def close(self):
+        """Write the buffered results and release the database connections"""
+        self.flush()
+        self.engine.dispose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
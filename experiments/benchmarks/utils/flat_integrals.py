@@ -33,7 +33,8 @@ class FlatSampler(Sampler):
             x,px,fx: points, pdfs, function values
         """
 
-        if isinstance(f, Integrand):
+        # Integrands can be wrapped in a timer which exposes the wrapped function
+        if isinstance(getattr(f, "function", f), Integrand):
             assert self.d == f.d
 
         device = self.device
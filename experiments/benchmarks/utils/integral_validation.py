@@ -5,6 +5,8 @@ import pandas as pd
 
 import logging
 
+from zunis.utils.memory import MemoryTracker
+from zunis.utils.timing import TimedFunction, timed_call
 from utils.integrals import mean_std_integrand
 from utils.record import ComparisonRecord, EvaluationRecord
 from utils.integrands.abstract import KnownIntegrand
@@ -12,6 +14,31 @@ from utils.vanity import sigma
 
 logger = logging.getLogger(__name__)
 
+timing_keys = (
+    "survey_time",
+    "survey_sampling_time",
+    "survey_integrand_time",
+    "survey_training_time",
+    "evaluation_time",
+    "evaluation_sampling_time",
+    "evaluation_integrand_time",
+    "evaluation_points_per_second",
+    "target_relative_error",
+    "time_to_target_error",
+)
+"""Timing entries of evaluation records that are carried over to comparison records. The target relative error
+is kept alongside the time needed to reach it"""
+
+memory_keys = (
+    "survey_peak_rss_mb",
+    "survey_rss_increase_mb",
+    "survey_python_peak_mb",
+    "survey_cuda_peak_mb",
+    "evaluation_peak_rss_mb",
+    "evaluation_rss_increase_mb",
+)
+"""Memory entries of evaluation records that are carried over to comparison records"""
+
 
 class Sampler(ABC):
     """Sampling tool for integral validation
@@ -43,30 +70,108 @@ class Sampler(ABC):
         """
         return pd.DataFrame()
 
+    def get_timing(self):
+        """Return the wall-clock time spent preparing the sampler, such as training
+        This abstract class needs no preparation and returns an empty dictionary
+
+        Returns
+        -------
+            dict
+                empty dictionary
+        """
+        return dict()
+
+    def get_memory_usage(self):
+        """Return the peak memory usage while preparing the sampler
+        This abstract class needs no preparation and returns an empty dictionary
+
+        Returns
+        -------
+            dict
+                empty dictionary
+        """
+        return dict()
+
+
+def time_to_relative_error(value, value_std, n_points, evaluation_time, relative_error, setup_time=0.):
+    """Extrapolate the wall-clock time needed to estimate an integral with a given relative error
 
-def evaluate_integral(integrand, sampler, n_batch=10000, keep_history=False):
+    The variance of a Monte Carlo estimator decreases as 1/n, so reaching the relative error e requires
+    n (value_std / (e |value|))^2 points, which are sampled at the measured cost per point.
+
+    Parameters
+    ----------
+    value: float
+        integral estimate
+    value_std: float
+        uncertainty of the integral estimate
+    n_points: int
+        number of points used for the estimate
+    evaluation_time: float
+        time spent sampling and evaluating the `n_points` points
+    relative_error: float
+        target relative error
+    setup_time: float
+        fixed cost, such as training, added to the sampling time
+
+    Returns
+    -------
+        float
+    """
+    if value == 0. or n_points == 0:
+        return float("inf")
+    n_required = n_points * (value_std / (relative_error * abs(value))) ** 2
+    return setup_time + n_required * evaluation_time / n_points
+
+
+def evaluate_integral(integrand, sampler, n_batch=10000, keep_history=False, target_relative_error=1.e-3):
     """Evaluate an integral
 
+    The record holds the timing of the sampler preparation and of the evaluation, as well as the extrapolated
+    time needed to reach the relative error `target_relative_error` (see :py:func:`time_to_relative_error`).
+    The peak resident set size during the evaluation and the memory usage of the sampler preparation, if it was
+    tracked, are recorded as well.
+
     Parameters
     ----------
     integrand: utils.integrands.KnownIntegrand
     sampler: Sampler
     n_batch: int
     keep_history: bool
+    target_relative_error: float
 
     Returns
     -------
         utils.record.EvaluationRecord
     """
-
-    _, px, fx = sampler.sample(integrand, n_batch=n_batch)
+    timed_integrand = TimedFunction(integrand)
+    memory_tracker = MemoryTracker(python_tracing=False)
+    with memory_tracker:
+        (_, px, fx), evaluation_time = timed_call(sampler.sample, timed_integrand, n_batch=n_batch)
     integral, std = mean_std_integrand(fx, px)
     unc = std / sqrt(n_batch)
 
+    timing = sampler.get_timing()
+    setup_time = timing.get("survey_time", 0.)
+    timing.update({
+        "evaluation_time": evaluation_time,
+        "evaluation_sampling_time": evaluation_time - timed_integrand.time,
+        "evaluation_integrand_time": timed_integrand.time,
+        "evaluation_points_per_second": n_batch / evaluation_time if evaluation_time > 0. else float("inf"),
+        "target_relative_error": target_relative_error,
+        "time_to_target_error": time_to_relative_error(integral, unc, n_batch, evaluation_time,
+                                                       target_relative_error, setup_time=setup_time)
+    })
+    timing.update(sampler.get_memory_usage())
+    timing.update({f"evaluation_{key}": value for key, value in memory_tracker.record().items()})
+
     logger.info(f"Estimated result: {integral:.2e}+/-{unc:.2e}")
+    logger.info(f"Evaluation time: {evaluation_time:.2e}s, "
+                f"time to {target_relative_error:.1e} relative error: {timing['time_to_target_error']:.2e}s")
     result = EvaluationRecord(
         value=integral,
         value_std=unc,
+        **timing
     )
 
     if keep_history:
@@ -112,6 +217,9 @@ def validate_integral(integrand, sampler, n_batch=10000, sigma_cutoff=2, keep_hi
         percent_difference=100 * integrand.compare_relative(integral),
         match=integrand.compare_absolute(integral) / unc <= sigma_cutoff
     )
+    for key in timing_keys + memory_keys:
+        if key in eval_result:
+            result[key] = eval_result[key]
 
     if keep_history:
         result["history"] = eval_result["history"]
@@ -162,6 +270,15 @@ def compare_integral_result(result1, result2, sigma_cutoff=2, keep_history=False
         variance_ratio=(unc2 / unc1) ** 2,
         match=sigmas <= sigma_cutoff,
     )
+    for key in timing_keys + memory_keys:
+        if key in result1:
+            result[f"value_{key}"] = result1[key]
+        if key in result2:
+            result[f"target_{key}"] = result2[key]
+    if "time_to_target_error" in result1 and "time_to_target_error" in result2 \
+            and result1["time_to_target_error"] > 0.:
+        # Larger than one if the first method reaches the target relative error faster
+        result["time_to_target_error_ratio"] = result2["time_to_target_error"] / result1["time_to_target_error"]
 
     if keep_history:
         try:
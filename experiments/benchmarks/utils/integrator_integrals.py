@@ -67,6 +67,27 @@ class IntegratorSampler(Sampler):
         """
         return self.integrator.integration_history
 
+    def get_timing(self):
+        """Get the time spent training the integrator
+
+        Returns
+        -------
+            dict
+                survey phase timing (see :py:meth:`zunis.integration.base_integrator.BaseIntegrator.timing_summary`)
+        """
+        return {key: value for key, value in self.integrator.timing_summary().items() if key.startswith("survey")}
+
+    def get_memory_usage(self):
+        """Get the peak memory usage of the training, if the integrator tracks memory
+
+        Returns
+        -------
+            dict
+                survey phase memory usage
+                (see :py:meth:`zunis.integration.base_integrator.BaseIntegrator.memory_summary`)
+        """
+        return {key: value for key, value in self.integrator.memory_summary().items() if key.startswith("survey")}
+
 
 def validate_integral_integrator(f, integrator, n_batch=10000, sigma_cutoff=2, train=True, n_survey_steps=None,
                                  survey_args=None, keep_history=False):
@@ -0,0 +1,208 @@
+"""Tools to measure throughputs and peak memory usage and to compare them with stored baselines"""
+import json
+import logging
+import os
+from datetime import datetime
+from statistics import median
+
+import pandas as pd
+import torch
+
+from zunis.utils.memory import MemoryTracker
+from zunis.utils.timing import timed_call
+
+logger = logging.getLogger(__name__)
+
+
+class PeakMemoryMonitor(MemoryTracker):
+    """Context manager measuring the peak memory used while it is active
+
+    The peak RSS of the process is stored in `peak_rss`. The reported `peak_memory` is the peak increase of the RSS
+    with respect to the start on CPU and the peak increase of the allocation of the pytorch CUDA allocator on CUDA
+    devices. See :py:class:`zunis.utils.memory.MemoryTracker`.
+
+    Example
+    -------
+    >>> with PeakMemoryMonitor(device) as monitor:
+    ...     flow(x)
+    >>> monitor.peak_memory
+    """
+
+    def __init__(self, device=torch.device("cpu"), interval=0.001):
+        super(PeakMemoryMonitor, self).__init__(device=device, python_tracing=False, interval=interval)
+
+    @property
+    def peak_memory(self):
+        return self.peak_increase
+
+
+def measure_throughput(function, n_items, n_repeat=10, n_warmup=2, device=torch.device("cpu")):
+    """Measure the throughput and the peak memory usage of a function
+
+    Parameters
+    ----------
+    function: callable
+        function called without arguments
+    n_items: int
+        number of items (typically points) processed per call
+    n_repeat: int
+        number of timed calls
+    n_warmup: int
+        number of calls before timing, which are not timed
+    device: torch.device
+        device on which the function runs
+
+    Returns
+    -------
+        dict
+            median and minimum time per call in seconds, median throughput in items per second and peak memory
+            increase during the timed calls in megabytes
+    """
+    for _ in range(n_warmup):
+        function()
+
+    durations = []
+    with PeakMemoryMonitor(device) as monitor:
+        for _ in range(n_repeat):
+            _, duration = timed_call(function)
+            durations.append(duration)
+
+    time_median = median(durations)
+    return {
+        "time_median": time_median,
+        "time_min": min(durations),
+        "items_per_second": n_items / time_median if time_median > 0. else float("inf"),
+        "peak_memory_mb": monitor.peak_memory / 2 ** 20,
+    }
+
+
+def save_results(results, path, metadata=None):
+    """Save measurements to a JSON file
+
+    Parameters
+    ----------
+    results: pandas.Dataframe
+    path: str
+    metadata: dict, None
+        description of the measurement conditions, such as :py:func:`zunis.utils.hardware.hardware_summary`
+    """
+    data = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "metadata": metadata if metadata is not None else dict(),
+        "results": results.to_dict(orient="records"),
+    }
+    with open(path, "w") as output:
+        json.dump(data, output, indent=2)
+    logger.info(f"Saved {len(results)} measurements to {path}")
+
+
+def load_results(path):
+    """Load measurements saved with :py:func:`save_results`
+
+    Returns
+    -------
+        tuple
+            (results as a pandas.Dataframe, metadata dictionary)
+    """
+    with open(path) as results_file:
+        data = json.load(results_file)
+    return pd.DataFrame(data["results"]), data["metadata"]
+
+
+def code_version():
+    """Identify the version of the code being measured
+
+    Returns
+    -------
+        str
+            summary of the repository status (see :py:func:`utils.repo_info.get_git_summary`) or "unknown" outside of
+            a git repository
+    """
+    try:
+        from utils.repo_info import get_git_summary
+        return get_git_summary()
+    except Exception as e:
+        logger.warning(f"Could not read the repository status: {e}")
+        return "unknown"
+
+
+history_format_version = 1
+"""Version of the layout of history files written by :py:func:`append_to_history`"""
+
+
+def append_to_history(results, path, metadata=None):
+    """Append a run of measurements to a JSON history file, creating it if needed
+
+    Each run records the date, the code version and the measurement conditions, so that measurements of successive
+    versions of the code can be compared.
+
+    Parameters
+    ----------
+    results: pandas.Dataframe
+    path: str
+    metadata: dict, None
+    """
+    history = load_history(path) if os.path.exists(path) else {"format_version": history_format_version, "runs": []}
+    history["runs"].append({
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "code_version": code_version(),
+        "metadata": metadata if metadata is not None else dict(),
+        "results": results.to_dict(orient="records"),
+    })
+    with open(path, "w") as output:
+        json.dump(history, output, indent=2)
+    logger.info(f"Appended run {len(history['runs']) - 1} to {path}")
+
+
+def load_history(path):
+    """Load a JSON history file written by :py:func:`append_to_history`
+
+    Returns
+    -------
+        dict
+            with keys "format_version" and "runs"
+    """
+    with open(path) as history_file:
+        history = json.load(history_file)
+    if history.get("format_version") != history_format_version:
+        raise ValueError(f"Unsupported history format version {history.get('format_version')} in {path}")
+    return history
+
+
+def compare_to_baseline(results, baseline, keys, metric="items_per_second", tolerance=0.1, higher_is_better=True):
+    """Compare measurements to baseline measurements of the same configurations
+
+    Parameters
+    ----------
+    results: pandas.Dataframe
+    baseline: pandas.Dataframe
+    keys: list of str
+        columns identifying a configuration
+    metric: str
+        column holding the compared quantity
+    tolerance: float
+        relative degradation of the metric above which a configuration is flagged as a regression
+    higher_is_better: bool
+        whether larger values of the metric are improvements
+
+    Returns
+    -------
+        pandas.Dataframe
+            configurations present in both tables with the baseline and current metric values, their ratio and a
+            boolean "regression" column
+    """
+    comparison = pd.merge(results[list(keys) + [metric]], baseline[list(keys) + [metric]], on=list(keys),
+                          suffixes=("", "_baseline"))
+    comparison["ratio"] = comparison[metric] / comparison[f"{metric}_baseline"]
+    if higher_is_better:
+        comparison["regression"] = comparison["ratio"] < 1. - tolerance
+    else:
+        comparison["regression"] = comparison["ratio"] > 1. + tolerance
+
+    n_missing = len(results) - len(comparison)
+    if n_missing > 0:
+        logger.warning(f"{n_missing} configurations have no baseline")
+    for _, row in comparison.loc[comparison["regression"]].iterrows():
+        logger.warning(f"Regression: {dict(row[list(keys)])}: {metric} {row[metric]:.3e} "
+                       f"(baseline {row[f'{metric}_baseline']:.3e})")
+    return comparison
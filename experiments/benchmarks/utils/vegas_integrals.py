@@ -1,6 +1,7 @@
 import torch
 import numpy as np
 from random import shuffle
+from zunis.utils.timing import timed_call
 from utils.integral_validation import Sampler, evaluate_integral
 
 
@@ -17,38 +18,75 @@ class VegasSampler(Sampler):
         """
 
         self.integrator = integrator
-        self.point_iterator = None
+        # Points of the current vegas iteration, their sampling PDF and the position of the next point to use
+        self.points = None
+        self.point_pdfs = None
+        self.point_index = 0
         self.actual_n_batch = 0
         self.integrand = integrand
+        self.timing = dict()
 
         if train:
             self.train_integrator(n_survey_steps, n_batch)
 
     def reset_point_iterator(self):
-        self.actual_n_batch = len(list(self.integrator.random()))
-        self.point_iterator = self.integrator.random()
+        """Sample all the points of a new vegas iteration at once using `vegas.Integrator.random_batch`
+
+        The weights of a vegas iteration are such that the sum of wx f(x) over its points estimates the integral,
+        so the PDF of each point is 1/(wx N) where N is the number of points in the iteration.
+        """
+        xs = []
+        wxs = []
+        # The C backend of vegas.Integrator.random_batch reuses the same location in memory to store points:
+        # we need to copy
+        for x, wx in self.integrator.random_batch():
+            xs.append(np.array(x, copy=True))
+            wxs.append(np.array(wx, copy=True))
+        wx = np.concatenate(wxs)
+
+        self.actual_n_batch = wx.shape[0]
+        self.points = np.ascontiguousarray(np.concatenate(xs))
+        self.point_pdfs = 1. / (wx * self.actual_n_batch)
+        self.point_index = 0
+
+    def take_points(self, x, px, start, stop):
+        """Copy points of the current vegas iteration into preallocated arrays, sampling new iterations as needed
+
+        Parameters
+        ----------
+        x: numpy.ndarray
+            array of shape (n, d) to fill
+        px: numpy.ndarray
+            array of shape (n,) to fill
+        start: int
+        stop: int
+            range of the arrays to fill
+        """
+        if self.points is None:
+            self.reset_point_iterator()
+        while start < stop:
+            if self.point_index >= self.actual_n_batch:
+                self.reset_point_iterator()
+            n = min(stop - start, self.actual_n_batch - self.point_index)
+            x[start:start + n] = self.points[self.point_index:self.point_index + n]
+            px[start:start + n] = self.point_pdfs[self.point_index:self.point_index + n]
+            self.point_index += n
+            start += n
 
     def get_point(self):
         """Sample a single point from the vegas integrator with point pdfs normalized to 1.
 
-        Yields
+        Returns
         -------
-            x, px: tuple of float
+            x, px: tuple of numpy.ndarray and float
                 point and its pdf
         """
-        if self.point_iterator is None:
+        if self.points is None:
             self.reset_point_iterator()
-        try:
-            x, wx = next(self.point_iterator)
-        except StopIteration:
-            self.reset_point_iterator()
-            x, wx = next(self.point_iterator)
-        # x is originally a view: map it to an array
-        # furthermore the C backend of vegas.Integrator.random
-        # reuses the same location in memory to store points: we need to copy
-        x = np.asarray(x).copy()
-        wx = float(np.asarray(wx))*self.actual_n_batch
-        return x, 1 / wx
+        x = np.empty((1, self.points.shape[1]))
+        px = np.empty(1)
+        self.take_points(x, px, 0, 1)
+        return x[0], float(px[0])
 
     def train_integrator(self, n_survey_steps, n_batch):
         """Train the integrator before sampling
@@ -60,10 +98,19 @@ class VegasSampler(Sampler):
         n_batch: int
             maximum number of function evaluations per survey step
         """
-        self.integrator(self.integrand, nitn=n_survey_steps, neval=n_batch)
+        _, self.timing["survey_time"] = timed_call(self.integrator, self.integrand, nitn=n_survey_steps, neval=n_batch)
         # integrating changes how points are sampled, the iterator should be reset
         self.reset_point_iterator()
 
+    def get_timing(self):
+        """Get the time spent training the integrator
+
+        Returns
+        -------
+            dict
+        """
+        return dict(self.timing)
+
     def sample(self, f, n_batch=10000, *args, **kwargs):
         """
 
@@ -79,16 +126,15 @@ class VegasSampler(Sampler):
         -------
 
         """
-        xs = []
-        pxs = []
-        while len(xs) <= n_batch:
-            xi, pxi = self.get_point()
-            xs.append(xi)
-            pxs.append(pxi)
-        x = np.array(xs)
-        px = torch.tensor(pxs)
+        if self.points is None:
+            self.reset_point_iterator()
+        x = np.empty((n_batch, self.points.shape[1]))
+        px = np.empty(n_batch)
+        self.take_points(x, px, 0, n_batch)
+
         fx = f(x)
-        x = torch.tensor(x)
+        x = torch.from_numpy(x)
+        px = torch.from_numpy(px)
 
         return x, px, fx
 
@@ -0,0 +1,26 @@
+"""Tuning of the refine flat fraction of integrators"""
+import torch
+
+from zunis.integration import Integrator
+
+
+def gaussian(x):
+    return torch.exp(-((x - 0.5) ** 2).sum(dim=1) / (2 * 0.1 ** 2))
+
+
+def test_selected_refine_flat_fraction_is_optimal_out_of_sample():
+    """The selected fraction must have an integral variance close to the lowest one, estimated on a large batch
+    the flow was not trained on"""
+    torch.manual_seed(1234)
+    integrator = Integrator(f=gaussian, d=2, n_iter_survey=5, n_iter_refine=1, n_points_survey=5000,
+                            n_points_refine=5000, refine_flat_fraction="auto",
+                            trainer_options={"n_epochs": 10, "minibatch_size": 1.0})
+    integrator.integrate()
+
+    assert integrator.refine_flat_fraction in integrator.defensive_flat_fractions
+
+    with torch.no_grad():
+        sample = integrator.sample_mixture(n_points=200000, flat_fraction=max(integrator.defensive_flat_fractions))
+        variances = integrator.mixture_variances(*sample, integrator.defensive_flat_fractions)
+
+    assert variances[integrator.refine_flat_fraction] <= 1.5 * min(variances.values())
@@ -63,7 +63,7 @@ class AdaptiveSurveyIntegrator(FlatSurveySamplingIntegrator):
 
         xj = self.model_trainer.sample_forward(n_points)
         x = xj[:, :-1]
-        px = torch.exp(- xj[:, -1])
+        px = torch.exp(- xj[:, -1].to(self.estimator_dtype))
         fx = f(x)
 
         return x, px, fx
@@ -1,14 +1,33 @@
 """Implementation of basic integrator functions"""
+from time import perf_counter
+
 import numpy as np
 import pandas as pd
 import torch
 from zunis.integration.integratorAPI import SurveyRefineIntegratorAPI
+from zunis.integration.estimators import control_variate_estimate
 from zunis.training.weighted_dataset.weighted_dataset_trainer import BasicTrainer
+from zunis.utils.autotune import BatchSizeCache, architecture_summary, cache_key, probe_batch_sizes, \
+    covers_memory_cap, select_batch_size, default_batch_sizes, default_cache_path
+from zunis.utils.hardware import hardware_summary
+from zunis.utils.dtypes import resolve_dtype
+from zunis.utils.memory import MemoryTracker, available_memory, measure_memory_per_point, \
+    estimate_max_batch_size
+from zunis.utils.profiling import IntegrationProfiler
 
 
 class BaseIntegrator(SurveyRefineIntegratorAPI):
     """Base abstract class that implements common functionality"""
 
+    defensive_flat_fractions = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3)
+    """Candidate mixture fractions for the automatic tuning of the refine flat fraction"""
+
+    timing_columns = ("sampling_time", "integrand_time", "training_time", "step_time")
+    """History columns holding the wall-clock durations of each step, in seconds"""
+
+    memory_columns = ("peak_rss_mb", "rss_increase_mb", "python_peak_mb", "cuda_peak_mb")
+    """History columns holding the memory usage of each step when memory tracking is enabled"""
+
     @staticmethod
     def empty_history():
         """Create an empty history object"""
@@ -21,7 +40,9 @@ class BaseIntegrator(SurveyRefineIntegratorAPI):
 
     def __init__(self, f, trainer, n_iter=10, n_iter_survey=None, n_iter_refine=None,
                  n_points=100000, n_points_survey=None, n_points_refine=None, use_survey=False,
-                 verbosity=None, trainer_verbosity=None, **kwargs):
+                 verbosity=None, trainer_verbosity=None, estimator_dtype=torch.float64, distill=False,
+                 distill_options=None, quantize_refine=False, refine_flat_fraction=0., control_variate=False,
+                 profiling=None, memory_tracking=False, autotune_batch_sizes=False, **kwargs):
         """
 
         Parameters
@@ -35,6 +56,39 @@ class BaseIntegrator(SurveyRefineIntegratorAPI):
         n_points_refine
         use_survey
         verbosity
+        estimator_dtype: str or torch.dtype
+            dtype in which the sampling PDF, the importance weights and the integral estimators are computed
+        distill: bool
+            whether to distill the trained flow into a smaller flow at the end of the survey phase. The last survey
+            batch is used for distillation and the smaller flow is used for refining only if the variance of its
+            integral estimator is close enough to that of the trained flow
+            (see :py:meth:`StatefulTrainer.distill <zunis.training.weighted_dataset.stateful_trainer.StatefulTrainer.distill>`)
+        distill_options: None or dict
+            options passed to the distillation method of the trainer
+        quantize_refine: bool
+            whether to sample the refine phase from a copy of the trained flow with dynamically quantized int8
+            conditioners (see :py:meth:`BasicTrainer.quantize_for_inference <zunis.training.weighted_dataset.weighted_dataset_trainer.BasicTrainer.quantize_for_inference>`).
+            CPU only
+        refine_flat_fraction: float or "auto"
+            fraction a of the refine points sampled from the target space posterior (uniform for flat survey
+            integrators) instead of the flow. The refine sampling PDF is then the mixture a p(x) + (1-a) q(x), which
+            bounds the importance weights f(x)/q(x) in the regions the flow under-covers.
+            With "auto", the fraction is tuned at the end of the survey phase among
+            :py:attr:`defensive_flat_fractions` (see :py:meth:`select_refine_flat_fraction`)
+        control_variate: bool
+            whether to correct the refine integral estimates with the control variate u(x)/p(x) - 1, where u is the
+            target space posterior (uniform for flat survey integrators) and p the refine sampling PDF.
+            See :py:meth:`estimate_integral_control_variate`
+        profiling: None, bool or dict
+            if True or a dictionary of options, profile the survey and refine steps with a
+            :py:class:`IntegrationProfiler <zunis.utils.profiling.IntegrationProfiler>` created with these options.
+            The time spent in each flow cell is then summarized in :py:attr:`profiling_summary`
+        memory_tracking: bool or dict
+            if True or a dictionary of options for :py:class:`MemoryTracker <zunis.utils.memory.MemoryTracker>`,
+            record the peak memory usage of each step in the integration history
+        autotune_batch_sizes: bool or dict
+            if True or a dictionary of options for :py:meth:`tune_batch_sizes`, tune the flow sampling chunk size and
+            the training minibatch size at the start of the first survey
         kwargs
         """
         super(BaseIntegrator, self).__init__(verbosity=verbosity, **kwargs)
@@ -46,19 +100,44 @@ class BaseIntegrator(SurveyRefineIntegratorAPI):
         self.n_points_refine = n_points_refine if n_points_refine is not None else n_points
 
         self.use_survey = use_survey
-
+        self.estimator_dtype = resolve_dtype(estimator_dtype)
 
         assert isinstance(trainer, BasicTrainer), "This integrator relies on the BasicTrainer API"
         self.model_trainer = trainer
         self.model_trainer.set_verbosity(trainer_verbosity)
 
+        self.distill = distill
+        self.distill_options = distill_options if distill_options is not None else dict()
+        self.last_survey_sample = None
+        self.distillation_report = None
+        self.quantize_refine = quantize_refine
+
+        # Distribution in target space used for mixture sampling. Set by integrators that have one
+        self.posterior = None
+        self.tune_refine_flat_fraction = refine_flat_fraction == "auto"
+        self.refine_flat_fraction = 0. if self.tune_refine_flat_fraction else refine_flat_fraction
+        assert 0. <= self.refine_flat_fraction <= 1., "The refine flat fraction must be in [0, 1] or 'auto'"
+        self.control_variate = control_variate
+
+        if profiling:
+            self.profiler = IntegrationProfiler(**(profiling if isinstance(profiling, dict) else dict()))
+        if memory_tracking:
+            memory_options = memory_tracking if isinstance(memory_tracking, dict) else dict()
+            self.memory_tracker = MemoryTracker(device=self.model_trainer.device, **memory_options)
+        self.autotune_options = None
+        if autotune_batch_sizes:
+            self.autotune_options = autotune_batch_sizes if isinstance(autotune_batch_sizes, dict) else dict()
+        self.batch_size_tuning = None
+
         self.integration_history = self.empty_history()
 
     def initialize(self, **kwargs):
         self.integration_history = self.empty_history()
 
     def initialize_survey(self, **kwargs):
-        pass
+        self.last_survey_sample = None
+        if self.autotune_options is not None and self.batch_size_tuning is None:
+            self.tune_batch_sizes(**self.autotune_options)
 
     def initialize_refine(self, **kwargs):
         pass
@@ -69,41 +148,223 @@ class BaseIntegrator(SurveyRefineIntegratorAPI):
         if f is None:
             f = self.f
 
+        if self.refine_flat_fraction > 0.:
+            return self.sample_mixture(n_points=n_points, flat_fraction=self.refine_flat_fraction, f=f)
+
         xj = self.model_trainer.sample_forward(n_points)
         x = xj[:, :-1]
-        px = torch.exp(-xj[:, -1])
+        px = torch.exp(-xj[:, -1].to(self.estimator_dtype))
         fx = f(x)
 
         return x, px, fx
 
+    def sample_mixture(self, *, n_points, flat_fraction, f=None):
+        """Sample points from the mixture of the target space posterior and of the flow model
+
+        The sampling PDF is r(x) = a p(x) + (1-a) q(x) where a is `flat_fraction`. The densities of both
+        components are computed for all points, using the inverse flow for the points sampled from the posterior.
+        The number of points sampled from each component is drawn at random so that the importance sampling
+        estimator stays unbiased.
+
+        Returns
+        -------
+            tuple of torch.Tensor
+                (x, rx, fx): sampled points, mixture PDF values, function values
+        """
+        assert self.posterior is not None, "Mixture sampling requires a target space posterior"
+        if f is None:
+            f = self.f
+
+        n_posterior = int((torch.rand(n_points) < flat_fraction).sum().item())
+        xj_posterior = self.posterior(n_posterior)
+        xj_flow = self.model_trainer.sample_forward(n_points - n_posterior).to(xj_posterior.dtype)
+
+        x_posterior = xj_posterior[:, :-1]
+        x = torch.cat([x_posterior, xj_flow[:, :-1]], dim=0)
+        # The last column of sampled points is the log-inverse-PDF of their sampler
+        log_px = torch.cat([-xj_posterior[:, -1], self.posterior.log_prob(xj_flow[:, :-1])], dim=0)
+        log_qx = torch.cat([self.model_trainer.compute_logqx_no_grad(x_posterior), -xj_flow[:, -1]], dim=0)
+
+        rx = flat_fraction * torch.exp(log_px.to(self.estimator_dtype)) + \
+            (1. - flat_fraction) * torch.exp(log_qx.to(self.estimator_dtype))
+        fx = f(x)
+
+        return x, rx, fx
+
+    def mixture_variances(self, x, px, fx, flat_fractions):
+        """Estimate the variance of the integral estimator obtained when sampling from mixtures of the posterior
+        and of the flow model, reusing a batch sampled from another PDF p(x)
+
+        For a mixture r(x) = a p_posterior(x) + (1-a) q(x):
+
+        Var(f, r) = E(f(x)^2/(r(x) p(x)), x~p(x)) - E(f(x)/p(x), x~p(x))^2
+
+        Parameters
+        ----------
+        x: torch.Tensor
+        px: torch.Tensor
+        fx: torch.Tensor
+        flat_fractions: iterable of float
+            mixture fractions a for which the variance is estimated
+
+        Returns
+        -------
+            dict
+                mapping of each mixture fraction to the estimated variance
+        """
+        dtype = self.estimator_dtype
+        fx = fx.to(dtype)
+        px = px.to(dtype)
+        posterior_x = torch.exp(self.posterior.log_prob(x).to(dtype))
+        qx = torch.exp(self.model_trainer.compute_logqx_no_grad(x).to(dtype))
+        integral = torch.mean(fx / px)
+
+        variances = dict()
+        for flat_fraction in flat_fractions:
+            rx = flat_fraction * posterior_x + (1. - flat_fraction) * qx
+            variances[flat_fraction] = (torch.mean(fx ** 2 / (rx * px)) - integral ** 2).cpu().item()
+        return variances
+
+    def estimate_integral(self, px, fx):
+        """Estimate the integral and the variance of the integral estimator in the estimator dtype"""
+        integral_var, integral = torch.var_mean(fx.to(self.estimator_dtype) / px.to(self.estimator_dtype))
+        return integral.cpu().item(), integral_var.cpu().item()
+
+    def estimate_integral_control_variate(self, x, px, fx):
+        """Estimate the integral with the control variate h(x) = u(x)/p(x) - 1, where u(x) is the normalized PDF
+        of the target space posterior
+
+        Both the flow PDF and the posterior are normalized, so h has zero expectation for any sampling PDF p(x)
+        and the correction costs no integrand evaluation. The optimal coefficient is estimated on the batch.
+
+        Returns
+        -------
+            tuple of float
+                (integral, variance, control variate coefficient, variance reduction factor)
+        """
+        assert self.posterior is not None, "The control variate requires a target space posterior"
+        px = px.to(self.estimator_dtype)
+        weights = fx.to(self.estimator_dtype) / px
+        control = torch.exp(self.posterior.log_prob(x).to(self.estimator_dtype)) / px - 1.
+        return control_variate_estimate(weights, control)
+
+    def refine_step(self, **kwargs):
+        """Refine step: sample points and estimate the integral and its error, using the control variate
+        if it is enabled
+
+        possible keyword arguments:
+            sampling_args: dict
+        """
+        if not self.control_variate:
+            return super(BaseIntegrator, self).refine_step(**kwargs)
+
+        try:
+            sampling_args = kwargs["sampling_args"]
+        except KeyError:
+            sampling_args = dict()
+
+        start = perf_counter()
+        with self.memory_tracker:
+            (x, px, fx), timing = self.timed_sample(self.sample_refine, sampling_args)
+            integral, integral_var, beta, reduction = self.estimate_integral_control_variate(x, px, fx)
+        timing["step_time"] = perf_counter() - start
+        self.logger.debug(f"Control variate coefficient: {beta:.3e}, variance reduction factor: {reduction:.3e}")
+
+        self.process_refine_step((x, px, fx), integral, integral_var, control_variate_coefficient=beta,
+                                 variance_reduction=reduction, timing=timing, memory=self.memory_tracker.record())
+
+    def timing_record(self, n_points, timing=None):
+        """Format the timing of a step as history columns
+
+        Parameters
+        ----------
+        n_points: int
+        timing: None or dict
+            durations of the step phases as measured by the survey and refine steps
+
+        Returns
+        -------
+            dict
+        """
+        if timing is None:
+            return dict()
+        record = {key: timing[key] for key in self.timing_columns if key in timing}
+        if timing.get("step_time", 0.) > 0.:
+            record["points_per_second"] = n_points / timing["step_time"]
+        return record
+
     def process_survey_step(self, sample, integral, integral_var, training_record, **kwargs):
         x, px, fx = sample
         n_points = x.shape[0]
-        self.integration_history = self.integration_history.append(
-            {"integral": integral,
-             "error": (integral_var / n_points) ** 0.5,
-             "n_points": n_points,
-             "phase": "survey",
-             "training record": training_record},
-            ignore_index=True
-        )
+        if self.distill:
+            self.last_survey_sample = sample
+        step = {"integral": integral,
+                "error": (integral_var / n_points) ** 0.5,
+                "n_points": n_points,
+                "phase": "survey",
+                "training record": training_record}
+        step.update(self.timing_record(n_points, kwargs.get("timing")))
+        step.update(kwargs.get("memory") or dict())
+        self.integration_history = self.integration_history.append(step, ignore_index=True)
         self.logger.info(f"Integral: {integral:.3e} +/- {(integral_var / n_points) ** 0.5:.3e}")
 
     def process_refine_step(self, sample, integral, integral_var, **kwargs):
         x, px, fx = sample
         n_points = x.shape[0]
-        self.integration_history = self.integration_history.append(
-            {"integral": integral,
-             "error": (integral_var / n_points) ** 0.5,
-             "n_points": n_points,
-             "phase": "refine"},
-            ignore_index=True
-        )
+        step = {"integral": integral,
+                "error": (integral_var / n_points) ** 0.5,
+                "n_points": n_points,
+                "phase": "refine"}
+        # Diagnostics of the control variate estimator
+        for key in ("control_variate_coefficient", "variance_reduction"):
+            if key in kwargs:
+                step[key] = kwargs[key]
+        step.update(self.timing_record(n_points, kwargs.get("timing")))
+        step.update(kwargs.get("memory") or dict())
+        self.integration_history = self.integration_history.append(step, ignore_index=True)
 
         self.logger.info(f"Integral: {integral:.3e} +/- {(integral_var / n_points) ** 0.5:.3e}")
 
     def finalize_survey(self, **kwargs):
-        pass
+        if self.distill and self.last_survey_sample is not None:
+            self.logger.info("Distilling the trained flow")
+            self.distillation_report = self.model_trainer.distill(*self.last_survey_sample, **self.distill_options)
+        if self.quantize_refine:
+            self.logger.info("Quantizing the flow conditioners for the refine phase")
+            self.model_trainer.quantize_for_inference()
+        if self.tune_refine_flat_fraction:
+            self.refine_flat_fraction = self.select_refine_flat_fraction()
+            self.logger.info(f"Sampling a fraction {self.refine_flat_fraction} of the refine points from the "
+                             f"target space posterior")
+        self.last_survey_sample = None
+
+    def select_refine_flat_fraction(self, n_points=None):
+        """Select the refine flat fraction with the lowest estimated integral variance
+
+        The variances are estimated on a fresh batch sampled from the mixture with the largest candidate fraction,
+        which covers the regions where the flow is small. The survey batches cannot be reused: the flow was trained
+        on them, so their variance estimates are too optimistic for the flow and favour small fractions.
+
+        Parameters
+        ----------
+        n_points: int, None
+            size of the batch. If None, use the number of survey points
+
+        Returns
+        -------
+            float
+                one of :py:attr:`defensive_flat_fractions`, or the current fraction if no variance could be estimated
+        """
+        if n_points is None:
+            n_points = self.n_points_survey
+        with torch.no_grad():
+            sample = self.sample_mixture(n_points=n_points, flat_fraction=max(self.defensive_flat_fractions))
+            variances = self.mixture_variances(*sample, self.defensive_flat_fractions)
+        self.logger.debug(f"Estimated variances per refine flat fraction: {variances}")
+        candidates = {fraction: variance for fraction, variance in variances.items() if variance == variance}
+        if len(candidates) == 0:
+            return self.refine_flat_fraction
+        return min(candidates, key=candidates.get)
 
     def finalize_refine(self, **kwargs):
         pass
@@ -126,6 +387,191 @@ class BaseIntegrator(SurveyRefineIntegratorAPI):
 
         return float(result), float(error), self.integration_history
 
+    def timing_summary(self):
+        """Summarize the time spent in each phase of the last integration
+
+        For each phase, report the total wall-clock time of the phase, the total time spent in each part of its
+        steps and the number of points sampled per second of step time.
+
+        Returns
+        -------
+            dict
+                keys of the form "<phase>_time", "<phase>_<column>" for each timing column and
+                "<phase>_points_per_second"
+        """
+        summary = dict()
+        for phase in ("survey", "refine"):
+            if phase in self.phase_timing:
+                summary[f"{phase}_time"] = self.phase_timing[phase]
+            data = self.integration_history.loc[self.integration_history["phase"] == phase]
+            for column in self.timing_columns:
+                if column in data:
+                    summary[f"{phase}_{column}"] = float(data[column].sum())
+            if "step_time" in data and data["step_time"].sum() > 0.:
+                summary[f"{phase}_points_per_second"] = float(data["n_points"].sum() / data["step_time"].sum())
+        return summary
+
+    def memory_summary(self):
+        """Summarize the peak memory usage of each phase of the last integration
+
+        Only available if memory tracking is enabled.
+
+        Returns
+        -------
+            dict
+                keys of the form "<phase>_<column>" for each memory column, holding the maximum over the steps
+        """
+        summary = dict()
+        for phase in ("survey", "refine"):
+            data = self.integration_history.loc[self.integration_history["phase"] == phase]
+            for column in self.memory_columns:
+                if column in data and data[column].notna().any():
+                    summary[f"{phase}_{column}"] = float(data[column].max())
+        return summary
+
+    def estimate_max_batch_size(self, phase="refine", probe_sizes=(1000, 10000), memory=None, safety_factor=0.8):
+        """Estimate the largest batch that can be processed in a step of a phase without running out of memory
+
+        The memory needed per point is measured by processing batches of the probe sizes: sampling for the refine
+        phase, and sampling followed by the computation of the loss gradients for the survey phase. In the survey,
+        the batch size to compare with the estimate is the training minibatch size if it is smaller than the number
+        of points per step.
+
+        Parameters
+        ----------
+        phase: {"survey", "refine"}
+        probe_sizes: tuple of int
+        memory: int, None
+            memory budget in bytes. If None, use the memory currently available on the device of the trainer
+        safety_factor: float
+            fraction of the memory budget that can be used
+
+        Returns
+        -------
+            int or None
+                None if the memory budget is unknown or the memory per point could not be measured
+        """
+        if phase == "refine":
+            def probe(n_points):
+                with torch.no_grad():
+                    self.sample_refine(n_points=n_points)
+        elif phase == "survey":
+            def probe(n_points):
+                x, px, fx = self.sample_survey(n_points=n_points)
+                self.model_trainer.compute_loss_gradients(x, px, fx)
+        else:
+            raise ValueError(f"Unknown phase {phase}")
+
+        memory_per_point = measure_memory_per_point(probe, probe_sizes=probe_sizes, device=self.model_trainer.device)
+        max_batch_size = estimate_max_batch_size(memory_per_point, device=self.model_trainer.device, memory=memory,
+                                                 safety_factor=safety_factor)
+        self.logger.info(f"Estimated memory per {phase} point: {memory_per_point / 2 ** 10:.2f} kB, "
+                         f"maximum batch size: {max_batch_size}")
+        return max_batch_size
+
+    def tune_batch_sizes(self, memory_cap=None, batch_sizes=default_batch_sizes, cache_path=default_cache_path,
+                         sampling=True, training=True, use_cache=True, tolerance=0.05):
+        """Tune the chunk size used to sample from the flow and the training minibatch size
+
+        Increasing batch sizes are probed and the smallest one whose throughput is within `tolerance` of the best
+        throughput under the memory cap is selected (see :py:mod:`zunis.utils.autotune`). Sampling is probed up to
+        the number of refine points and training up to the number of survey points. The training probe computes the
+        loss gradients on points sampled from the flow, without evaluating the integrand.
+
+        The training minibatch size is only tuned if training is configured on full batches (minibatch size None,
+        1.0 or at least the number of survey points). Note that a smaller minibatch size means more gradient steps
+        per epoch, which changes the training dynamics and not only its cost.
+
+        The probe results are cached, keyed by the flow architecture, the hardware and the probed sizes, so that
+        later runs of the same setup skip the probing. The sizes are selected from the cached probes under the memory
+        cap of the current run, and probing is repeated if the cached probes stopped below that cap.
+
+        Parameters
+        ----------
+        memory_cap: int, None
+            memory budget in bytes. If None, use half of the memory currently available on the device of the trainer
+        batch_sizes: tuple of int
+            candidate batch sizes
+        cache_path: str, None
+            path of the JSON cache file. If None, results are not cached
+        sampling: bool
+            whether to tune the sampling chunk size
+        training: bool
+            whether to tune the training minibatch size
+        use_cache: bool
+            whether to reuse cached results
+        tolerance: float
+            relative throughput loss accepted in exchange for a smaller batch
+
+        Returns
+        -------
+            dict
+                with keys "sampling_chunk_size" and "minibatch_size" for the tuned sizes, None if no probed size
+                fits under the memory cap
+        """
+        trainer = self.model_trainer
+        device = trainer.device
+        if memory_cap is None:
+            available = available_memory(device)
+            memory_cap = available // 2 if available is not None else None
+
+        sampling_sizes = [size for size in batch_sizes if size <= self.n_points_refine]
+        training_sizes = [size for size in batch_sizes if size <= self.n_points_survey]
+        configured_minibatch_size = trainer.config["minibatch_size"]
+        # Minibatch sizes are None, fractions of the batch (float) or numbers of points (int)
+        full_batch = configured_minibatch_size is None or \
+            (isinstance(configured_minibatch_size, float) and configured_minibatch_size == 1.) or \
+            (isinstance(configured_minibatch_size, int) and configured_minibatch_size >= self.n_points_survey)
+        if training and not full_batch:
+            self.logger.info(f"Not tuning the training minibatch size: it is set to {configured_minibatch_size}")
+        training = training and full_batch
+
+        key = cache_key(architecture_summary(trainer.flow), hardware_summary(device),
+                        {"sampling_sizes": sampling_sizes, "training_sizes": training_sizes})
+        cache = BatchSizeCache(cache_path) if cache_path is not None else None
+        probes = cache.get(key) if cache is not None and use_cache else None
+        if probes is None:
+            probes = dict()
+
+        def train_probe(n_points):
+            xj = trainer.sample_forward(n_points)
+            trainer.compute_loss_gradients(xj[:, :-1], torch.exp(-xj[:, -1]), torch.ones_like(xj[:, -1]))
+
+        # Probe without chunking so that each probe processes its whole batch at once
+        configured_chunk_size = trainer.sampling_chunk_size
+        trainer.sampling_chunk_size = None
+        tuning = dict()
+        phases = [("sampling_chunk_size", sampling, trainer.sample_forward, sampling_sizes),
+                  ("minibatch_size", training, train_probe, training_sizes)]
+        try:
+            for name, enabled, function, sizes in phases:
+                if not enabled:
+                    continue
+                if name in probes and covers_memory_cap(probes[name], sizes, memory_cap):
+                    self.logger.info(f"Using cached probes for the {name}")
+                else:
+                    probes[name] = probe_batch_sizes(function, sizes, device=device, memory_cap=memory_cap)
+                    self.logger.debug(f"Probes for the {name}: {probes[name]}")
+                tuning[name] = select_batch_size(probes[name], memory_cap=memory_cap, tolerance=tolerance)
+                if tuning[name] is None:
+                    self.logger.warning(f"Could not tune the {name}: no probed size in {sizes} fits under the "
+                                        f"memory cap")
+        finally:
+            trainer.sampling_chunk_size = configured_chunk_size
+
+        if cache is not None:
+            cache.set(key, probes)
+
+        if tuning.get("sampling_chunk_size") is not None:
+            trainer.sampling_chunk_size = tuning["sampling_chunk_size"]
+        if tuning.get("minibatch_size") is not None:
+            trainer.set_config(minibatch_size=tuning["minibatch_size"])
+        self.logger.info(f"Sampling chunk size: {trainer.sampling_chunk_size}, "
+                         f"training minibatch size: {trainer.config['minibatch_size']}")
+
+        self.batch_size_tuning = tuning
+        return tuning
+
     def survey(self, n_survey_steps=None, **kwargs):
         if n_survey_steps is None:
             n_survey_steps = self.n_iter_survey
@@ -4,6 +4,7 @@ import logging
 
 from .flat_survey_integrator import FlatSurveySamplingIntegrator
 from .dkltrainer_integrator import DKLAdaptiveSurveyIntegrator
+from .variance_adaptive_integrator import VarianceAdaptiveSurveyIntegrator
 
 from zunis.training.weighted_dataset.stateful_trainer import StatefulTrainer
 
@@ -12,7 +13,10 @@ logger = logging.getLogger(__name__)
 def Integrator(f, d, survey_strategy="flat", n_iter=10, n_iter_survey=None, n_iter_refine=None,
                n_points=100000, n_points_survey=None, n_points_refine=None, use_survey=False,
                device=torch.device("cpu"), verbosity=None, trainer_verbosity=None,
-               loss="variance", flow="pwlinear", trainer=None, trainer_options=None, flow_options=None):
+               loss="variance", flow="pwlinear", trainer=None, trainer_options=None, flow_options=None,
+               dtype=None, network_dtype=None, estimator_dtype=torch.float64, distill=False, distill_options=None,
+               quantize_refine=False, refine_flat_fraction=0., control_variate=False, profiling=None,
+               memory_tracking=False, autotune_batch_sizes=False):
     """High level integration API
 
     This is a factory method that instantiates the relevant Integrator subclass based on the options
@@ -23,7 +27,9 @@ def Integrator(f, d, survey_strategy="flat", n_iter=10, n_iter_survey=None, n_it
         the function to integrate
     d: int
         dimensionality of the integration space
-    survey_strategy: str
+    survey_strategy: {"flat", "adaptive_dkl", "adaptive_variance"}
+        how points are sampled during the survey: uniformly, uniformly until the DKL loss is negative, or from
+        the mixture of the uniform distribution and of the flow with the lowest estimated variance
     n_iter: int
         general number of iterations - ignored for survey/refine if n_iter_survey/n_inter_refine is set
     n_iter_survey: int
@@ -57,6 +63,33 @@ def Integrator(f, d, survey_strategy="flat", n_iter=10, n_iter_survey=None, n_it
     flow_options: dict
         dictionary of options to pass to the :py:class:`zunis.models.flows.sequential.repeated_cell.RepeatedCellFlow`
         created by the stateful trainer if `trainer` is None
+    dtype: None or str or torch.dtype
+        dtype of the sampled points and of the flow Jacobians. If None, the pytorch default dtype is used
+    network_dtype: None or str or torch.dtype
+        dtype of the neural networks of the flow if different from `dtype`. Ignored if `trainer` is provided
+    estimator_dtype: str or torch.dtype
+        dtype in which the integral estimators are computed
+    distill: bool
+        whether to distill the trained flow into a smaller flow after the survey phase
+    distill_options: None or dict
+        options passed to :py:meth:`zunis.training.weighted_dataset.stateful_trainer.StatefulTrainer.distill`
+    quantize_refine: bool
+        whether to sample the refine phase with dynamically quantized int8 conditioners. CPU only
+    refine_flat_fraction: float or "auto"
+        fraction of the refine points sampled uniformly instead of from the flow. With "auto", the fraction is
+        tuned on the last survey batch
+    control_variate: bool
+        whether to reduce the variance of the refine estimates with a control variate built from the uniform PDF
+    profiling: None, bool or dict
+        if True or a dictionary of options for :py:class:`zunis.utils.profiling.IntegrationProfiler`, profile the
+        survey and refine steps
+    memory_tracking: bool or dict
+        if True or a dictionary of options for :py:class:`zunis.utils.memory.MemoryTracker`, record the peak memory
+        usage of each step in the integration history
+    autotune_batch_sizes: bool or dict
+        if True or a dictionary of options for
+        :py:meth:`zunis.integration.base_integrator.BaseIntegrator.tune_batch_sizes`, tune the flow sampling chunk
+        size and the training minibatch size before the first survey
 
     Returns
     -------
@@ -66,7 +99,7 @@ def Integrator(f, d, survey_strategy="flat", n_iter=10, n_iter_survey=None, n_it
         if trainer_options is None:
             trainer_options = dict()
         trainer = StatefulTrainer(d=d, loss=loss, flow=flow, device=device, flow_options=flow_options,
-                                  **trainer_options)
+                                  dtype=dtype, network_dtype=network_dtype, **trainer_options)
 
     # TODO work out the issue for the variance training with RealNVP
     if loss == "variance" and flow == "realnvp":
@@ -79,8 +112,15 @@ def Integrator(f, d, survey_strategy="flat", n_iter=10, n_iter_survey=None, n_it
                                             n_iter_refine=n_iter_refine,
                                             n_points=n_points, n_points_survey=n_points_survey,
                                             n_points_refine=n_points_refine, use_survey=use_survey,
-                                            device=device, verbosity=verbosity,
-                                            trainer_verbosity=trainer_verbosity)
+                                            device=device, dtype=dtype, estimator_dtype=estimator_dtype,
+                                            distill=distill, distill_options=distill_options,
+                                            quantize_refine=quantize_refine,
+                                            refine_flat_fraction=refine_flat_fraction,
+                                            control_variate=control_variate,
+                                            profiling=profiling,
+                                            memory_tracking=memory_tracking,
+                                            autotune_batch_sizes=autotune_batch_sizes,
+                                            verbosity=verbosity, trainer_verbosity=trainer_verbosity)
 
     if survey_strategy == "adaptive_dkl":
         if trainer is None:
@@ -89,5 +129,27 @@ def Integrator(f, d, survey_strategy="flat", n_iter=10, n_iter_survey=None, n_it
                                            n_iter_refine=n_iter_refine,
                                            n_points=n_points, n_points_survey=n_points_survey,
                                            n_points_refine=n_points_refine, use_survey=use_survey,
-                                           device=device, verbosity=verbosity,
-                                           trainer_verbosity=trainer_verbosity)
+                                           device=device, dtype=dtype, estimator_dtype=estimator_dtype,
+                                           distill=distill, distill_options=distill_options,
+                                           quantize_refine=quantize_refine,
+                                           refine_flat_fraction=refine_flat_fraction,
+                                           control_variate=control_variate,
+                                           profiling=profiling,
+                                           memory_tracking=memory_tracking,
+                                           autotune_batch_sizes=autotune_batch_sizes,
+                                           verbosity=verbosity, trainer_verbosity=trainer_verbosity)
+
+    if survey_strategy == "adaptive_variance":
+        return VarianceAdaptiveSurveyIntegrator(f=f, trainer=trainer, d=d, n_iter=n_iter, n_iter_survey=n_iter_survey,
+                                                n_iter_refine=n_iter_refine,
+                                                n_points=n_points, n_points_survey=n_points_survey,
+                                                n_points_refine=n_points_refine, use_survey=use_survey,
+                                                device=device, dtype=dtype, estimator_dtype=estimator_dtype,
+                                                distill=distill, distill_options=distill_options,
+                                                quantize_refine=quantize_refine,
+                                                refine_flat_fraction=refine_flat_fraction,
+                                                control_variate=control_variate,
+                                                profiling=profiling,
+                                                memory_tracking=memory_tracking,
+                                                autotune_batch_sizes=autotune_batch_sizes,
+                                                verbosity=verbosity, trainer_verbosity=trainer_verbosity)
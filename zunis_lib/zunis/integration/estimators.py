@@ -0,0 +1,36 @@
+"""Monte Carlo estimators of integrals from importance weights"""
+import torch
+
+
+def control_variate_estimate(weights, control):
+    """Estimate an integral from importance weights corrected by a control variate with zero expectation
+
+    The estimator is mean(w - beta h) where w = f(x)/p(x) are the importance weights, h is the control variate
+    and beta = Cov(w, h)/Var(h) is the optimal coefficient. The variance of the corrected weights is
+    Var(w) (1 - Corr(w, h)^2).
+
+    The coefficient is estimated on the same batch as the integral, which biases the estimator by O(1/n).
+
+    Parameters
+    ----------
+    weights: torch.Tensor
+        importance weights f(x)/p(x)
+    control: torch.Tensor
+        values of the control variate, whose expectation under p(x) is zero
+
+    Returns
+    -------
+        tuple of float
+            (integral, variance, beta, variance reduction factor Var(w)/Var(w - beta h))
+    """
+    weights_var, weights_mean = torch.var_mean(weights)
+    control_centered = control - torch.mean(control)
+    control_var = torch.mean(control_centered ** 2)
+    if control_var.item() > 0:
+        beta = torch.mean((weights - weights_mean) * control_centered) / control_var
+    else:
+        beta = torch.zeros_like(control_var)
+
+    corrected_var, corrected_mean = torch.var_mean(weights - beta * control)
+    reduction = (weights_var / corrected_var).cpu().item() if corrected_var.item() > 0 else float("inf")
+    return corrected_mean.cpu().item(), corrected_var.cpu().item(), beta.cpu().item(), reduction
@@ -1,8 +1,6 @@
 import torch
 
-# TODO: change where the method we use from this class is
 from zunis.integration.base_integrator import BaseIntegrator
-from zunis.training.weighted_dataset.weighted_dataset_trainer import BasicStatefulTrainer
 from zunis.models.flows.sampling import UniformSampler
 
 
@@ -31,20 +29,27 @@ class PosteriorSurveySamplingIntegrator(BaseIntegrator):
         self.posterior = posterior
 
     def sample_survey(self, *, n_points=None, f=None, **kwargs):
-        """Sample points from target space distribution"""
-        # TODO, change where this method is /!\
+        """Sample points from target space distribution
+
+        As for points sampled from the flow, the PDF is computed in the estimator dtype"""
         if n_points is None:
             n_points = self.n_points_survey
         if f is None:
             f = self.f
-        return BasicStatefulTrainer.generate_target_batch_from_posterior(n_points, f, self.posterior)
+
+        xlpx = self.posterior(n_points)
+        x = xlpx[:, :-1]
+        px = torch.exp(- xlpx[:, -1].to(self.estimator_dtype))
+        fx = f(x)
+
+        return x, px, fx
 
 
 class FlatSurveySamplingIntegrator(PosteriorSurveySamplingIntegrator):
     def __init__(self, f, trainer, d, n_iter=10, n_iter_survey=None, n_iter_refine=None,
                  n_points=100000, n_points_survey=None, n_points_refine=None, use_survey=False,
-                 device=torch.device("cpu"), verbosity=2, trainer_verbosity=1, **kwargs):
-        posterior = UniformSampler(d=d, device=device)
+                 device=torch.device("cpu"), dtype=None, verbosity=2, trainer_verbosity=1, **kwargs):
+        posterior = UniformSampler(d=d, device=device, dtype=dtype)
         super(FlatSurveySamplingIntegrator, self).__init__(f=f,
                                                            trainer=trainer,
                                                            d=d,
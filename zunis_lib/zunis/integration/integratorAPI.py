@@ -1,9 +1,13 @@
 import logging
+from contextlib import ExitStack
+from time import perf_counter
 from better_abc import ABC, abstractmethod, abstract_attribute
 import torch
 
 from zunis.utils.logger import set_verbosity as set_verbosity_fct
 from zunis.utils.exceptions import TrainingInterruption
+from zunis.utils.memory import MemoryTracker
+from zunis.utils.timing import TimedFunction, synchronize, timed_call
 
 class SurveyRefineIntegratorAPI(ABC):
     """API specification for an integrator that performs a number of survey steps in which
@@ -17,6 +21,14 @@ class SurveyRefineIntegratorAPI(ABC):
         self.model_trainer = abstract_attribute()
         self.logger = logging.getLogger(__name__).getChild(self.__class__.__name__ + ":" + hex(id(self)))
         self.set_verbosity(verbosity)
+        # Wall-clock duration in seconds of the last survey and refine phases, including their initialization
+        # and finalization
+        self.phase_timing = dict()
+        # Optional zunis.utils.profiling.IntegrationProfiler and the summary of its cell timings
+        self.profiler = None
+        self.profiling_summary = None
+        # Memory tracking of each step, disabled by default
+        self.memory_tracker = MemoryTracker(enabled=False)
 
     @abstractmethod
     def initialize(self, **kwargs):
@@ -66,6 +78,63 @@ class SurveyRefineIntegratorAPI(ABC):
         """
         return kwargs
 
+    def estimate_integral(self, px, fx):
+        """Estimate the integral and the variance of the integral estimator from a weighted sample
+
+        Parameters
+        ----------
+        px: torch.Tensor
+            PDF from which the points were sampled
+        fx: torch.Tensor
+            function values
+
+        Returns
+        -------
+            tuple of float
+                (integral, variance)
+        """
+        integral_var, integral = torch.var_mean(fx / px)
+        return integral.cpu().item(), integral_var.cpu().item()
+
+    def timed_sample(self, sample, sampling_args):
+        """Sample points and measure the time spent sampling and evaluating the integrand
+
+        The integrand is wrapped in a timer before being passed to the sampling method, so that the integrand
+        evaluation time can be separated from the time spent generating points.
+
+        Parameters
+        ----------
+        sample: callable
+            sampling method, such as `sample_survey` or `sample_refine`
+        sampling_args: dict
+            keyword arguments of the sampling method
+
+        Returns
+        -------
+            tuple
+                ((x, px, fx), timing) where timing is a dictionary with the keys "sampling_time" and
+                "integrand_time"
+        """
+        f = sampling_args.get("f", getattr(self, "f", None))
+        if f is not None:
+            f = TimedFunction(f)
+            sampling_args = {**sampling_args, "f": f}
+
+        sample, duration = timed_call(sample, **sampling_args)
+        integrand_time = f.time if f is not None else 0.
+        return sample, {"sampling_time": duration - integrand_time, "integrand_time": integrand_time}
+
+    def profiled_step(self, phase):
+        """Context in which a step of a phase is run, which profiles the step if profiling is enabled
+
+        Parameters
+        ----------
+        phase: {"survey", "refine"}
+        """
+        if self.profiler is None:
+            return ExitStack()
+        return self.profiler.profile_step(phase, self.model_trainer)
+
     def survey_step(self, **kwargs):
         """Basic survey step: sample points, estimate the integral, its error, train model
 
@@ -84,14 +153,17 @@ class SurveyRefineIntegratorAPI(ABC):
         except KeyError:
             training_args = dict()
 
-        x, px, fx = self.sample_survey(**sampling_args)
-        integral_var, integral = torch.var_mean(fx / px)
-        integral = integral.cpu().item()
-        integral_var = integral_var.cpu().item()
+        start = perf_counter()
+        with self.memory_tracker:
+            (x, px, fx), timing = self.timed_sample(self.sample_survey, sampling_args)
+            integral, integral_var = self.estimate_integral(px, fx)
 
-        training_record = self.model_trainer.train_on_batch(x, px, fx, **training_args)
+            training_record, timing["training_time"] = timed_call(self.model_trainer.train_on_batch, x, px, fx,
+                                                                  **training_args)
+        timing["step_time"] = perf_counter() - start
 
-        self.process_survey_step((x, px, fx), integral, integral_var, training_record=training_record)
+        self.process_survey_step((x, px, fx), integral, integral_var, training_record=training_record,
+                                 timing=timing, memory=self.memory_tracker.record())
 
     def refine_step(self, **kwargs):
         """Basic refine step: sample points, estimate the integral, its error, train model
@@ -105,12 +177,14 @@ class SurveyRefineIntegratorAPI(ABC):
         except KeyError:
             sampling_args = dict()
 
-        x, px, fx = self.sample_refine(**sampling_args)
-        integral_var, integral = torch.var_mean(fx / px)
-        integral = integral.cpu().item()
-        integral_var = integral_var.cpu().item()
+        start = perf_counter()
+        with self.memory_tracker:
+            (x, px, fx), timing = self.timed_sample(self.sample_refine, sampling_args)
+            integral, integral_var = self.estimate_integral(px, fx)
+        timing["step_time"] = perf_counter() - start
 
-        self.process_refine_step((x, px, fx), integral, integral_var)
+        self.process_refine_step((x, px, fx), integral, integral_var, timing=timing,
+                                 memory=self.memory_tracker.record())
 
     def survey(self, n_survey_steps=10, **kwargs):
         """Perform a survey phase of integration
@@ -144,12 +218,16 @@ class SurveyRefineIntegratorAPI(ABC):
         except KeyError:
             finalize_survey_args = dict()
 
+        start = perf_counter()
         self.initialize_survey(**initialize_survey_args)
 
         self.logger.info("Starting the survey phase")
+        if self.profiler is not None:
+            self.profiler.start_phase("survey")
         try:
             for i in range(n_survey_steps):
-                self.survey_step(**survey_step_args)
+                with self.profiled_step("survey"):
+                    self.survey_step(**survey_step_args)
         except TrainingInterruption as e:
             self.logger.debug(" "*72)
             self.logger.debug("="*72)
@@ -160,6 +238,10 @@ class SurveyRefineIntegratorAPI(ABC):
 
         self.logger.info("Finalizing the survey phase")
         self.finalize_survey(**finalize_survey_args)
+        synchronize()
+        self.phase_timing["survey"] = perf_counter() - start
+        if self.profiler is not None:
+            self.profiling_summary = self.profiler.end_phase("survey")
 
     def refine(self, n_refine_steps=10, **kwargs):
         """Perform the refine phase of integration
@@ -194,14 +276,22 @@ class SurveyRefineIntegratorAPI(ABC):
         except KeyError:
             finalize_refine_args = dict()
 
+        start = perf_counter()
         self.initialize_refine(**initialize_refine_args)
 
         self.logger.info("Starting the refine phase")
+        if self.profiler is not None:
+            self.profiler.start_phase("refine")
         for i in range(n_refine_steps):
-            self.refine_step(**refine_step_args)
+            with self.profiled_step("refine"):
+                self.refine_step(**refine_step_args)
 
         self.logger.info("Finalizing the refine phase")
         self.finalize_refine(**finalize_refine_args)
+        synchronize()
+        self.phase_timing["refine"] = perf_counter() - start
+        if self.profiler is not None:
+            self.profiling_summary = self.profiler.end_phase("refine")
 
     def integrate(self, n_survey_steps=10, n_refine_steps=10, **kwargs):
         self.logger.info("Starting integration")
@@ -0,0 +1,99 @@
+"""Survey/Refine integrator switching from flat to flow sampling based on the estimated integral variance"""
+import torch
+from .adaptive_survey_integrator import AdaptiveSurveyIntegrator
+
+
+class VarianceAdaptiveSurveyIntegrator(AdaptiveSurveyIntegrator):
+    """Survey/Refine adaptive integrator based on the variance of the integral estimator
+
+    At each survey step, the variance of the integral estimator that would be obtained by sampling from
+    mixtures r(x) = a u(x) + (1-a) q(x) of the flat distribution u(x) and of the flow PDF q(x) is estimated by
+    reweighting the batch that was just sampled, before the flow is trained on it. The mixture fraction a with the
+    lowest estimated variance is used to sample the next survey batch, so the survey switches away from flat
+    sampling as soon as the flow (or a mixture with the flow) does better. The estimate works with any training loss.
+
+    Estimating after training would reuse the batch the flow was just fitted to, which underestimates the variance
+    of the flow and biases the choice toward small flat fractions. The out-of-sample estimate lags one step behind
+    the training instead.
+    """
+
+    def __init__(self, f, trainer, d, n_iter=10, n_iter_survey=None, n_iter_refine=None,
+                 n_points=100000, n_points_survey=None, n_points_refine=None, use_survey=False,
+                 device=torch.device("cpu"), verbosity=2, trainer_verbosity=1, flat_fractions=(0., 0.1, 0.25, 0.5),
+                 **kwargs):
+        """
+
+        Parameters
+        ----------
+        flat_fractions: iterable of float
+            mixture fractions of the flat distribution that are tried during the survey. Pure flat sampling
+            is always tried as well
+        """
+        super(VarianceAdaptiveSurveyIntegrator, self).__init__(f,
+                                                               trainer,
+                                                               d,
+                                                               n_iter=n_iter,
+                                                               n_iter_survey=n_iter_survey,
+                                                               n_iter_refine=n_iter_refine,
+                                                               n_points=n_points,
+                                                               n_points_survey=n_points_survey,
+                                                               n_points_refine=n_points_refine,
+                                                               use_survey=use_survey,
+                                                               device=device,
+                                                               verbosity=verbosity,
+                                                               trainer_verbosity=trainer_verbosity,
+                                                               **kwargs)
+        self.flat_fractions = sorted(set(flat_fractions) | {1.})
+        # Fraction of the survey points sampled from the flat distribution
+        self.flat_fraction = 1.
+        # Variances per flat fraction estimated on the last survey batch before training on it
+        self.flat_fraction_variances = None
+
+    def initialize_survey(self, **kwargs):
+        super(VarianceAdaptiveSurveyIntegrator, self).initialize_survey(**kwargs)
+        self.flat_fraction = 1.
+        self.flat_fraction_variances = None
+        self.sample_forward = False
+
+    def tune_flat_fraction(self, variances):
+        """Select the mixture fraction with the lowest estimated variance
+
+        Parameters
+        ----------
+        variances: dict
+            estimated variance per flat fraction, see :py:meth:`mixture_variances`
+        """
+        self.logger.debug(f"Estimated variances per flat fraction: {variances}")
+        candidates = {fraction: variance for fraction, variance in variances.items() if variance == variance}
+        if len(candidates) == 0:
+            self.logger.warning("Could not estimate the variance of the integral estimator, sampling flat")
+            return 1.
+        return min(candidates, key=candidates.get)
+
+    def survey_switch_condition(self):
+        """Check if sampling from the flow, alone or mixed with the flat distribution, is estimated to yield a
+        lower variance than flat sampling"""
+        return self.flat_fraction < 1.
+
+    def sample_survey(self, *, n_points=None, f=None, **kwargs):
+        if not self.sample_forward or self.flat_fraction == 0.:
+            sample = super(VarianceAdaptiveSurveyIntegrator, self).sample_survey(n_points=n_points, f=f, **kwargs)
+        else:
+            if n_points is None:
+                n_points = self.n_points_survey
+            sample = self.sample_mixture(n_points=n_points, flat_fraction=self.flat_fraction, f=f)
+
+        # The flow has not been trained on this batch yet, so the variance estimates are out-of-sample
+        self.flat_fraction_variances = self.mixture_variances(*sample, self.flat_fractions)
+        return sample
+
+    def process_survey_step(self, sample, integral, integral_var, training_record, **kwargs):
+        flat_fraction = self.tune_flat_fraction(self.flat_fraction_variances)
+        if flat_fraction != self.flat_fraction:
+            self.logger.info(f"Sampling a fraction {flat_fraction} of the survey points from the flat distribution")
+            self.flat_fraction = flat_fraction
+        super(VarianceAdaptiveSurveyIntegrator, self).process_survey_step(sample, integral, integral_var,
+                                                                          training_record, **kwargs)
+        # Unlike the loss-based switch, the variance estimate can send the survey back to flat sampling
+        if self.flat_fraction == 1.:
+            self.sample_forward = False
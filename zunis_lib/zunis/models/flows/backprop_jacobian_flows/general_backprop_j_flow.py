@@ -11,7 +11,8 @@ class GeneralBackpropJacobianFlow(GeneralFlow):
     """Abstract class for a flow defined as a general differentiable Pytorch function
     This implements the universal transform_and_compute_jacobian behavior:
     y = flow(x), - log(j(y)) = - log(j(x)) + log(det(dy_i/dx_j))
-    The jacobian is computed naively by using autograd.
+    The jacobian is computed by using autograd: all its rows are obtained in a single backward pass
+    over a replicated batch (see :py:meth:`compute_jacobian`).
     """
     def __init__(self, *, d):
         super(GeneralBackpropJacobianFlow, self).__init__(d=d)
@@ -23,24 +24,73 @@ class GeneralBackpropJacobianFlow(GeneralFlow):
         """For a backprop_flow, the transformation is just a pytorch module"""
         return self.flow_(x)
 
-    def transform_and_compute_jacobian(self, xj):
-        """Compute the flow transformation and its Jacobian using pytorch.autograd"""
-        x = xj[:, :self.d].detach()
-        log_j = xj[:, -1]
+    def has_batch_coupling(self):
+        """Check whether the output for a point can depend on the other points of the batch
+
+        This is the case for batch normalization layers in training mode.
+        """
+        return any(isinstance(module, torch.nn.modules.batchnorm._BatchNorm) and module.training
+                   for module in self.flow_.modules())
+
+    def compute_jacobian(self, x):
+        """Compute the Jacobian matrices dy_i/dx_j of the transformation with a single backward pass
+
+        The batch is replicated d times and the i-th replica is back-propagated with the i-th unit vector
+        as output gradient, which yields the i-th row of all the Jacobian matrices at once.
+        This is only valid if the transformation acts on each point of the batch independently.
+
+        Parameters
+        ----------
+        x: torch.Tensor
+            batch of points with shape (N, d)
+
+        Returns
+        -------
+            tuple of torch.Tensor
+                (y, jx): transformed points with shape (N, d) and Jacobian matrices with shape (N, d, d)
+        """
+        n_batch = x.shape[0]
+        x_rep = x.detach().unsqueeze(0).expand(self.d, n_batch, self.d).reshape(self.d * n_batch, self.d)
+        x_rep.requires_grad = True
+
+        y_rep = self.flow_(x_rep)
 
+        directions = torch.eye(self.d, dtype=y_rep.dtype, device=y_rep.device).unsqueeze(1)
+        directions = directions.expand(self.d, n_batch, self.d).reshape(self.d * n_batch, self.d)
+        grad = torch.autograd.grad(y_rep, x_rep, directions, create_graph=True)[0]
+
+        jx = grad.reshape(self.d, n_batch, self.d).transpose(0, 1)
+        return y_rep[:n_batch], jx
+
+    def compute_jacobian_sequential(self, x):
+        """Compute the Jacobian matrices dy_i/dx_j of the transformation with one backward pass per row
+
+        Reference implementation of :py:meth:`compute_jacobian` that also supports transformations coupling the
+        points of a batch. Same signature as :py:meth:`compute_jacobian`.
+        """
+        x = x.detach()
         x.requires_grad = True
         y = self.flow_(x)
 
-        n_batch = xj.shape[0]
+        n_batch = x.shape[0]
 
-        jx = torch.zeros(n_batch, self.d, self.d).to(log_j.device)
-        directions = torch.eye(self.d).to(log_j).unsqueeze(0).repeat(n_batch, 1, 1)
+        jx = torch.zeros(n_batch, self.d, self.d, dtype=y.dtype, device=y.device)
+        directions = torch.eye(self.d).to(y).unsqueeze(0).repeat(n_batch, 1, 1)
 
         for i in range(self.d):
             jx[:, i, :] = torch.autograd.grad(y, x, directions[:, i, :],
                                               allow_unused=True, create_graph=True, retain_graph=True)[0]
-        x.requires_grad = False
-        x.grad = None
+        return y, jx
+
+    def transform_and_compute_jacobian(self, xj):
+        """Compute the flow transformation and its Jacobian using pytorch.autograd"""
+        x = xj[:, :self.d]
+        log_j = xj[:, -1]
+
+        if self.has_batch_coupling():
+            y, jx = self.compute_jacobian_sequential(x)
+        else:
+            y, jx = self.compute_jacobian(x)
 
-        log_det_j = torch.log(torch.abs(torch.det(jx)))
+        _, log_det_j = torch.slogdet(jx)
         return torch.cat([y.detach(), (log_j + log_det_j).unsqueeze(1)], 1)
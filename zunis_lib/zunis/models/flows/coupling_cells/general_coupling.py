@@ -1,4 +1,6 @@
 """Abstract class for coupling cells"""
+from copy import deepcopy
+
 import torch
 from better_abc import abstract_attribute
 
@@ -6,6 +8,65 @@ from zunis.models.flows.general_flow import GeneralFlow
 from .transforms import InvertibleTransform
 
 
+def cast_conditioners(flow, dtype):
+    """Cast the parameters of the conditioners (the neural networks that predict the transform parameters) of
+    all the coupling cells within a flow to a given dtype
+
+    The rest of the flow keeps its dtype: in particular, the variable transforms and their Jacobians are computed in
+    the dtype of the flow input. This allows running the neural networks in lower precision than the Jacobian
+    accumulation.
+
+    Parameters
+    ----------
+    flow: torch.nn.Module
+    dtype: torch.dtype
+
+    Returns
+    -------
+        torch.nn.Module
+            the flow, cast in place
+    """
+    for module in flow.modules():
+        if isinstance(module, GeneralCouplingCell):
+            module.T.to(dtype)
+    return flow
+
+
+def quantize_conditioners(flow):
+    """Create an inference-only copy of a flow in which the linear layers of the conditioners of all the coupling
+    cells are dynamically quantized to int8
+
+    The conditioners of the copy run in float32 with int8 weights on CPU. The variable transforms and their Jacobians
+    are computed as in the original flow, so that the PDF of the points sampled with the copy is the exact PDF
+    of the quantized model. The original flow is left unchanged.
+
+    Parameters
+    ----------
+    flow: torch.nn.Module
+        flow on CPU
+
+    Returns
+    -------
+        torch.nn.Module
+            quantized copy of the flow
+    """
+    assert all(p.device.type == "cpu" for p in flow.parameters()), "Dynamic quantization is only supported on CPU"
+
+    quantized_flow = deepcopy(flow)
+    qconfig_spec = dict()
+    for name, module in quantized_flow.named_modules():
+        if isinstance(module, GeneralCouplingCell):
+            module.T.to(torch.float32)
+            module.quantized = True
+            for layer_name, layer in module.T.named_modules():
+                if isinstance(layer, torch.nn.Linear):
+                    qconfig_spec[".".join(filter(None, (name, "T", layer_name)))] = \
+                        torch.quantization.default_dynamic_qconfig
+
+    torch.quantization.quantize_dynamic(quantized_flow, qconfig_spec, dtype=torch.qint8, inplace=True)
+    return quantized_flow
+
+
 def not_list(l):
     """Return the element wise negation of a list of booleans"""
     assert all([isinstance(it, bool) for it in l])
@@ -15,6 +76,9 @@ def not_list(l):
 class GeneralCouplingCell(GeneralFlow):
     """Abstract class for coupling cell"""
 
+    quantized = False
+    """Whether the conditioner was dynamically quantized (see :py:func:`quantize_conditioners`)"""
+
     def __init__(self, *, d, transform, mask):
         """
         Parameters
@@ -35,6 +99,29 @@ class GeneralCouplingCell(GeneralFlow):
         self.transform = transform
         self.T = abstract_attribute()
 
+    @property
+    def conditioner_dtype(self):
+        """dtype of the parameters of the conditioner T, None if it has no parameters
+
+        Dynamically quantized conditioners take float32 inputs."""
+        if self.quantized:
+            return torch.float32
+        try:
+            return next(self.T.parameters()).dtype
+        except StopIteration:
+            return None
+
+    def compute_transform_parameters(self, y_n):
+        """Evaluate the conditioner T on the pass-through variables
+
+        The conditioner is evaluated in its own dtype and its output is cast back to the dtype of the input
+        so that the transform is computed in the precision of the data.
+        """
+        dtype = self.conditioner_dtype
+        if dtype is None or dtype == y_n.dtype:
+            return self.T(y_n)
+        return self.T(y_n.to(dtype)).to(y_n.dtype)
+
     def transform_and_compute_jacobian(self, yj):
         """Apply the variable change on a batch of points y and compute the jacobian"""
         y_n = yj[..., self.mask]
@@ -43,7 +130,8 @@ class GeneralCouplingCell(GeneralFlow):
 
         x = torch.zeros_like(yj).to(yj.device)
         x[..., self.mask] = y_n
-        x[..., self.mask_complement], log_jy = self.transform(y_m, self.T(y_n), compute_jacobian=True)
+        x[..., self.mask_complement], log_jy = self.transform(y_m, self.compute_transform_parameters(y_n),
+                                                                    compute_jacobian=True)
         x[..., -1] = log_j + log_jy
         return x
 
@@ -54,7 +142,8 @@ class GeneralCouplingCell(GeneralFlow):
 
         x = torch.zeros_like(y).to(y.device)
         x[..., self.mask] = y_n
-        x[..., self.mask_complement], _ = self.transform(y_m, self.T(y_n), compute_jacobian=False)
+        x[..., self.mask_complement], _ = self.transform(y_m, self.compute_transform_parameters(y_n),
+                                                           compute_jacobian=False)
 
         return x
 
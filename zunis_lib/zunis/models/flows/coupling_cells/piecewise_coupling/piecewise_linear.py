@@ -5,7 +5,7 @@ import torch
 
 from ..transforms import InvertibleTransform
 from ..general_coupling import InvertibleCouplingCell
-from zunis.utils.exceptions import AvertedCUDARuntimeError
+from zunis.models.flows.validation import safe_bin_indices, check_eager
 from zunis.models.layers.trainable import ArbitraryShapeRectangularDNN
 from zunis.models.utils import Reshift
 
@@ -55,11 +55,10 @@ def piecewise_linear_transform(x, q_tilde, compute_jacobian=True):
 
     # x is in the mx-th bin: x \in [0,1],
     # mx \in [[0,b-1]], so we clamp away the case x == 1
-    mx = torch.clamp(torch.floor(b * x), 0, b - 1).to(torch.long)
-    # Need special error handling because trying to index with mx
-    # if it contains nans will lock the GPU. (device-side assert triggered)
-    if torch.any(torch.isnan(mx)).item() or torch.any(mx < 0) or torch.any(mx >= b):
-        raise AvertedCUDARuntimeError("NaN detected in PWLinear bin indexing")
+    # Indices are clamped after conversion so that NaNs cannot produce invalid indices: trying to index with them
+    # would lock the GPU (device-side assert triggered)
+    mx = safe_bin_indices(torch.floor(b * x), b)
+    check_eager(x, "NaN detected in PWLinear bin indexing")
 
     # We compute the output variable in-place
     out = x - mx * w  # alpha (element of [0.,w], the position of x in its bin
@@ -152,12 +151,9 @@ def piecewise_linear_inverse_transform(y, q_tilde, compute_jacobian=True):
     # By setting the negative values to 2., we know that the smallest value left
     # is the smallest positive
     edges[edges < 0] = 2.
-    edges = torch.clamp(torch.argmin(edges, dim=2), 0, b - 1).to(torch.long)
-
-    # Need special error handling because trying to index with mx
-    # if it contains nans will lock the GPU. (device-side assert triggered)
-    if torch.any(torch.isnan(edges)).item() or torch.any(edges < 0) or torch.any(edges >= b):
-        raise AvertedCUDARuntimeError("NaN detected in PWLinear bin indexing")
+    # argmin always returns a valid index, even with NaN inputs
+    edges = safe_bin_indices(torch.argmin(edges, dim=2), b)
+    check_eager(y, "NaN detected in PWLinear bin indexing")
 
     # Gather the left integrals at each edge. See comment about gathering in q_left_integrals
     # for the unsqueeze
@@ -252,7 +248,8 @@ class PWLinearCoupling(GeneralPWLinearCoupling):
                  input_activation=Reshift,
                  hidden_activation=torch.nn.LeakyReLU,
                  output_activation=None,
-                 use_batch_norm=False):
+                 use_batch_norm=False,
+                 conditioner=None):
         """
         Generator for PWLinearCoupling
 
@@ -278,6 +275,10 @@ class PWLinearCoupling(GeneralPWLinearCoupling):
             must be a callable generator without arguments (i.e. a classname or a function)
         use_batch_norm: bool
             whether batch normalization should be used in the DNN.
+        conditioner: None or callable
+            if set, called as `conditioner(d_in=..., out_shape=..., mask=...)` to create the neural network
+            predicting the transform parameters instead of the rectangular DNN. The DNN options are then ignored.
+            See :py:class:`SharedTrunkHead <zunis.models.layers.trainable.SharedTrunkHead>`
         """
 
         super(PWLinearCoupling, self).__init__(d=d, mask=mask)
@@ -285,6 +286,10 @@ class PWLinearCoupling(GeneralPWLinearCoupling):
         d_in = sum(mask)
         d_out = d - d_in
 
+        if conditioner is not None:
+            self.T = conditioner(d_in=d_in, out_shape=(d_out, n_bins), mask=mask)
+            return
+
         self.T = ArbitraryShapeRectangularDNN(d_in=d_in,
                                               out_shape=(d_out, n_bins),
                                               d_hidden=d_hidden,
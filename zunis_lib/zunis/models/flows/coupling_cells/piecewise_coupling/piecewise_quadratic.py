@@ -6,7 +6,7 @@ import numpy as np
 
 from ..transforms import InvertibleTransform
 from ..general_coupling import InvertibleCouplingCell
-from zunis.utils.exceptions import AvertedCUDARuntimeError
+from zunis.models.flows.validation import safe_bin_indices, check_eager
 from zunis.models.layers.trainable import ArbitraryShapeRectangularDNN
 from zunis.models.utils import Reshift
 
@@ -84,11 +84,8 @@ def piecewise_quadratic_transform(x, wv_tilde, compute_jacobian=True):
    
     # x is in the mx-th bin: x \in [0,1],
     # mx \in [[0,b-1]], so we clamp away the case x == 1
-    mx = torch.clamp(mx, 0, b - 1).to(torch.long)
-    # Need special error handling because trying to index with mx
-    # if it contains nans will lock the GPU. (device-side assert triggered)
-    if torch.any(torch.isnan(mx)).item() or torch.any(mx < 0) or torch.any(mx >= b):
-        raise AvertedCUDARuntimeError("NaN detected in PWQuad bin indexing")
+    mx = safe_bin_indices(mx, b)
+    check_eager(x, "NaN detected in PWQuad bin indexing")
     
     # alpha (element of [0.,1], the position of x in its bin)
     # gather collects the cumulated with of all bins until the one in which x lies
@@ -207,12 +204,8 @@ def piecewise_quadratic_inverse_transform(y, wv_tilde, compute_jacobian=True):
     
     # x is in the mx-th bin: x \in [0,1],
     # mx \in [[0,b-1]], so we clamp away the case x == 1
-    edges = torch.clamp(mx, 0, b - 1).to(torch.long)
-    
-    # Need special error handling because trying to index with mx
-    # if it contains nans will lock the GPU. (device-side assert triggered)
-    if torch.any(torch.isnan(edges)).item() or torch.any(edges < 0) or torch.any(edges >= b):
-        raise AvertedCUDARuntimeError("NaN detected in PWQuad bin indexing")
+    edges = safe_bin_indices(mx, b)
+    check_eager(y, "NaN detected in PWQuad bin indexing")
     
     #solve quadratic equation
     
@@ -228,10 +221,8 @@ def piecewise_quadratic_inverse_transform(y, wv_tilde, compute_jacobian=True):
     eps = torch.finfo(a.dtype).eps
     a=torch.where(torch.abs(a)<eps,eps*torch.ones_like(a),a)
     
-    d = (b**2) - (2*a*c)
-    
-    assert not torch.any(d<0), "Value error in PWQuad inversion"
-    assert not torch.any(a==0), "Value error in PWQuad inversion, a==0"
+    # the discriminant is positive for a monotonous transform: only rounding errors can make it negative
+    d = ((b**2) - (2*a*c)).clamp(min=0.)
     
     # find two solutions
     sol1 = (-b-torch.sqrt(d))/(a)
@@ -241,8 +232,7 @@ def piecewise_quadratic_inverse_transform(y, wv_tilde, compute_jacobian=True):
    
     sol=torch.where((sol1>=0)&(sol1<1), sol1, sol2)
     
-    if torch.any(torch.isnan(sol)).item():
-        raise AvertedCUDARuntimeError("NaN detected in PWQuad inversion")
+    check_eager(sol, "NaN detected in PWQuad inversion")
     
     eps = torch.finfo(sol.dtype).eps
     
@@ -340,7 +330,8 @@ class PWQuadraticCoupling(GeneralPWQuadraticCoupling):
                  input_activation=Reshift,
                  hidden_activation=torch.nn.LeakyReLU,
                  output_activation=None,
-                 use_batch_norm=False):
+                 use_batch_norm=False,
+                 conditioner=None):
         """
         Generator for PWQuadraticCoupling
 
@@ -366,6 +357,10 @@ class PWQuadraticCoupling(GeneralPWQuadraticCoupling):
             must be a callable generator without arguments (i.e. a classname or a function)
         use_batch_norm: bool
             whether batch normalization should be used in the DNN.
+        conditioner: None or callable
+            if set, called as `conditioner(d_in=..., out_shape=..., mask=...)` to create the neural network
+            predicting the transform parameters instead of the rectangular DNN. The DNN options are then ignored.
+            See :py:class:`SharedTrunkHead <zunis.models.layers.trainable.SharedTrunkHead>`
         """
 
         super(PWQuadraticCoupling, self).__init__(d=d, mask=mask)
@@ -373,6 +368,10 @@ class PWQuadraticCoupling(GeneralPWQuadraticCoupling):
         d_in = sum(mask)
         d_out = d - d_in
 
+        if conditioner is not None:
+            self.T = conditioner(d_in=d_in, out_shape=(d_out, 2*n_bins+1), mask=mask)
+            return
+
         self.T = ArbitraryShapeRectangularDNN(d_in=d_in,
                                               out_shape=(d_out, 2*n_bins+1),
                                               d_hidden=d_hidden,
@@ -0,0 +1,349 @@
+"""Implementation of the rational-quadratic spline coupling cell
+This means that the *variable transform* is a monotonic piecewise rational-quadratic function.
+
+Reference: C. Durkan, A. Bekasov, I. Murray, G. Papamakarios, Neural Spline Flows, arXiv:1906.04032
+"""
+import math
+
+import torch
+
+from ..transforms import InvertibleTransform
+from ..general_coupling import InvertibleCouplingCell
+from zunis.models.layers.trainable import ArbitraryShapeRectangularDNN
+from zunis.models.utils import Reshift
+
+third_dimension_softmax = torch.nn.Softmax(dim=2)
+
+default_min_bin_width = 1.e-3
+default_min_bin_height = 1.e-3
+default_min_derivative = 1.e-3
+
+
+def normalize_spline_parameters(whd_tilde, min_bin_width=default_min_bin_width,
+                                min_bin_height=default_min_bin_height, min_derivative=default_min_derivative):
+    """Map the un-normalized spline parameters to knot positions, bin sizes and knot derivatives
+
+    Parameters
+    ----------
+    whd_tilde: torch.Tensor
+        tensor with shape (N,k,3b+1) where b is the number of bins. The last dimension contains the un-normalized
+        bin widths (b entries), bin heights (b entries) and derivatives at the knots (b+1 entries)
+    min_bin_width: float
+    min_bin_height: float
+    min_derivative: float
+
+    Returns
+    -------
+    tuple of torch.Tensor
+        `(widths, cumwidths, heights, cumheights, derivatives)` with shapes (N,k,b), (N,k,b+1), (N,k,b), (N,k,b+1)
+        and (N,k,b+1). The cumulated widths and heights are the knot positions, from 0 to 1.
+    """
+    n_bins = (whd_tilde.shape[2] - 1) // 3
+    assert whd_tilde.shape[2] == 3 * n_bins + 1, "The spline parameters must have shape (N,k,3b+1)"
+    assert min_bin_width * n_bins < 1. and min_bin_height * n_bins < 1., "Minimal bin size too large"
+
+    w_tilde = whd_tilde[:, :, :n_bins]
+    h_tilde = whd_tilde[:, :, n_bins:2 * n_bins]
+    d_tilde = whd_tilde[:, :, 2 * n_bins:]
+
+    widths = min_bin_width + (1. - min_bin_width * n_bins) * third_dimension_softmax(w_tilde)
+    heights = min_bin_height + (1. - min_bin_height * n_bins) * third_dimension_softmax(h_tilde)
+
+    # Knot positions: cumulated sizes with a leading 0. The last knot is set to exactly 1.
+    cumwidths = torch.nn.functional.pad(torch.cumsum(widths, dim=-1), [1, 0])
+    cumheights = torch.nn.functional.pad(torch.cumsum(heights, dim=-1), [1, 0])
+    cumwidths[:, :, -1] = 1.
+    cumheights[:, :, -1] = 1.
+
+    # Derivatives are positive, with the identity transform (all derivatives equal to 1) at d_tilde=0
+    derivatives = min_derivative + (1. - min_derivative) * torch.nn.functional.softplus(d_tilde) / math.log(2.)
+
+    return widths, cumwidths, heights, cumheights, derivatives
+
+
+def search_bins(knots, values):
+    """Find the bin in which each value lies
+
+    The bin index is the number of interior knots smaller than or equal to the value. This is always
+    a valid index in [[0,b-1]], even for NaN values, so indexing does not need any check that would synchronize
+    the device.
+
+    Parameters
+    ----------
+    knots: torch.Tensor
+        knot positions with shape (N,k,b+1), from 0 to 1
+    values: torch.Tensor
+        values with shape (N,k)
+
+    Returns
+    -------
+    torch.Tensor
+        bin indices with shape (N,k,1)
+    """
+    return torch.sum(values.unsqueeze(-1) >= knots[:, :, 1:-1], dim=-1, keepdim=True)
+
+
+def gather_bin(parameters, bins):
+    """Select the bin parameters with shape (N,k) from a tensor with shape (N,k,:)"""
+    return torch.gather(parameters, -1, bins).squeeze(-1)
+
+
+def rational_quadratic_transform(x, whd_tilde, compute_jacobian=True):
+    """Apply an element-wise monotonic rational-quadratic spline transformation to some variables
+
+    Parameters
+    ----------
+    x : torch.Tensor
+        a tensor with shape (N,k) where N is the batch dimension while k is the
+        dimension of the variable space. This variable span the k-dimensional unit
+        hypercube
+
+    whd_tilde: torch.Tensor
+        is a tensor with shape (N,k,3b+1) where b is the number of bins.
+        This contains the un-normalized widths and heights of the bins and the un-normalized derivatives
+        at the knots (see :py:func:`normalize_spline_parameters`).
+
+    compute_jacobian : bool, optional
+        determines whether the jacobian should be compute or None is returned
+
+    Returns
+    -------
+    tuple of torch.Tensor
+        pair `(y,j)`.
+        - `y` is a tensor with shape (N,k) living in the k-dimensional unit hypercube
+        - `j` is the jacobian of the transformation with shape (N,) if compute_jacobian==True, else None.
+    """
+    logj = None
+
+    N, k, _ = whd_tilde.shape
+    Nx, kx = x.shape
+    assert N == Nx and k == kx, "Shape mismatch"
+
+    widths, cumwidths, heights, cumheights, derivatives = normalize_spline_parameters(whd_tilde)
+
+    bins = search_bins(cumwidths, x)
+
+    x_k = gather_bin(cumwidths, bins)
+    w_k = gather_bin(widths, bins)
+    y_k = gather_bin(cumheights, bins)
+    h_k = gather_bin(heights, bins)
+    d_k = gather_bin(derivatives, bins)
+    d_k1 = gather_bin(derivatives, bins + 1)
+    s_k = h_k / w_k
+
+    # theta (element of [0.,1], the position of x in its bin)
+    theta = (x - x_k) / w_k
+    theta_1m_theta = theta * (1. - theta)
+
+    numerator = h_k * (s_k * theta.pow(2) + d_k * theta_1m_theta)
+    denominator = s_k + (d_k1 + d_k - 2. * s_k) * theta_1m_theta
+    out = y_k + numerator / denominator
+
+    if compute_jacobian:
+        derivative_numerator = s_k.pow(2) * (d_k1 * theta.pow(2) + 2. * s_k * theta_1m_theta
+                                             + d_k * (1. - theta).pow(2))
+        logj = torch.sum(torch.log(derivative_numerator) - 2. * torch.log(denominator), dim=-1)
+
+    # Regularization: points must be strictly within the unit hypercube
+    # Use the dtype information from pytorch
+    eps = torch.finfo(out.dtype).eps
+    out = out.clamp(
+        min=eps,
+        max=1. - eps
+    )
+    return out, logj
+
+
+def rational_quadratic_inverse_transform(y, whd_tilde, compute_jacobian=True):
+    """
+    Apply the inverse of an element-wise monotonic rational-quadratic spline transformation to some variables
+
+    The inverse is analytic: in each bin, it is the root in [0,1] of a quadratic equation, which is computed
+    in a numerically stable form.
+
+    Parameters
+    ----------
+    y : torch.Tensor
+        a tensor with shape (N,k) where N is the batch dimension while k is the
+        dimension of the variable space. This variable span the k-dimensional unit
+        hypercube
+
+    whd_tilde: torch.Tensor
+        is a tensor with shape (N,k,3b+1) where b is the number of bins.
+        This contains the un-normalized widths and heights of the bins and the un-normalized derivatives
+        at the knots (see :py:func:`normalize_spline_parameters`).
+
+    compute_jacobian : bool, optional
+        determines whether the jacobian should be compute or None is returned
+
+    Returns
+    -------
+    tuple of torch.Tensor
+        pair `(x,j)`.
+        - `x` is a tensor with shape (N,k) living in the k-dimensional unit hypercube
+        - `j` is the jacobian of the transformation with shape (N,) if compute_jacobian==True, else None.
+    """
+    logj = None
+
+    N, k, _ = whd_tilde.shape
+    Ny, ky = y.shape
+    assert N == Ny and k == ky, "Shape mismatch"
+
+    widths, cumwidths, heights, cumheights, derivatives = normalize_spline_parameters(whd_tilde)
+
+    bins = search_bins(cumheights, y)
+
+    x_k = gather_bin(cumwidths, bins)
+    w_k = gather_bin(widths, bins)
+    y_k = gather_bin(cumheights, bins)
+    h_k = gather_bin(heights, bins)
+    d_k = gather_bin(derivatives, bins)
+    d_k1 = gather_bin(derivatives, bins + 1)
+    s_k = h_k / w_k
+
+    # Solve a theta^2 + b theta + c = 0 for the position theta of x in its bin
+    dy = y - y_k
+    slope_sum = d_k1 + d_k - 2. * s_k
+    a = h_k * (s_k - d_k) + dy * slope_sum
+    b = h_k * d_k - dy * slope_sum
+    c = - s_k * dy
+
+    # The discriminant is positive for a monotonic spline: only rounding errors can make it negative
+    discriminant = (b.pow(2) - 4. * a * c).clamp(min=0.)
+    theta = (2. * c) / (- b - torch.sqrt(discriminant))
+
+    x = theta * w_k + x_k
+
+    eps = torch.finfo(x.dtype).eps
+    x = x.clamp(
+        min=eps,
+        max=1. - eps
+    )
+
+    if compute_jacobian:
+        theta_1m_theta = theta * (1. - theta)
+        denominator = s_k + slope_sum * theta_1m_theta
+        derivative_numerator = s_k.pow(2) * (d_k1 * theta.pow(2) + 2. * s_k * theta_1m_theta
+                                             + d_k * (1. - theta).pow(2))
+        # The prefactor of -1 is the log of the jacobian of the inverse
+        logj = - torch.sum(torch.log(derivative_numerator) - 2. * torch.log(denominator), dim=-1)
+
+    return x.detach(), logj
+
+
+class ElementWisePWRationalQuadraticTransform(InvertibleTransform):
+    """Invertible piecewise rational-quadratic transformations over the unit hypercube
+
+    Implements a batched bijective transformation `h` from the d-dimensional unit hypercube to itself,
+    in an element-wise fashion (each coordinate transformed independently)
+
+    In each direction, the bijection is a monotonic rational-quadratic spline with b bins. The network predicts
+    the bin widths, the bin heights and the derivatives at the b+1 knots for each direction and each point
+    of the batch. They are normalized such that:
+    1. h(0) = 0
+    2. h(1) = 1
+    3. h is strictly increasing
+    4. h is continuously differentiable
+
+    Conditions 1. to 3. ensure the transformation is a bijection and therefore invertible
+    The inverse is analytic.
+    """
+
+    backward = staticmethod(rational_quadratic_transform)
+    forward = staticmethod(rational_quadratic_inverse_transform)
+
+
+class GeneralPWRationalQuadraticCoupling(InvertibleCouplingCell):
+    """Abstract class implementing a coupling cell based on rational-quadratic spline transformations
+
+    A specific way to predict the parameters of the transform must be implemented
+    in child classes.
+    """
+
+    def __init__(self, *, d, mask):
+        """Generator for the abstract class GeneralPWRationalQuadraticCoupling
+
+        Parameters
+        ----------
+        d: int
+            dimension of the space
+        mask: list of bool
+            variable mask which variables are transformed (False)
+            or used as parameters of the transform (True)
+
+        """
+        super(GeneralPWRationalQuadraticCoupling, self).__init__(d=d,
+                                                                 transform=ElementWisePWRationalQuadraticTransform(),
+                                                                 mask=mask)
+
+
+class PWRationalQuadraticCoupling(GeneralPWRationalQuadraticCoupling):
+    """Piece-wise rational-quadratic coupling
+
+    Coupling cell using an element-wise monotonic rational-quadratic spline as a change of
+    variables. The transverse neural network is a rectangular dense neural network
+
+    Notes:
+        Transformation used:
+        `zunis.models.flows.coupling_cells.piecewise_coupling.rational_quadratic.ElementWisePWRationalQuadraticTransform`
+        Neural network used:
+        zunis.models.layers.trainable.ArbitraryShapeRectangularDNN
+    """
+
+    def __init__(self, *, d, mask,
+                 n_bins=8,
+                 d_hidden=256,
+                 n_hidden=8,
+                 input_activation=Reshift,
+                 hidden_activation=torch.nn.LeakyReLU,
+                 output_activation=None,
+                 use_batch_norm=False,
+                 conditioner=None):
+        """
+        Generator for PWRationalQuadraticCoupling
+
+        Parameters
+        ----------
+        d: int
+        mask: list of bool
+            variable mask: which dimension are transformed (False) and which are not (True)
+        n_bins: int
+            number of bins in each dimensions
+        d_hidden: int
+            dimension of the hidden layers of the DNN
+        n_hidden: int
+            number of hidden layers in the DNN
+        input_activation: optional
+            pytorch activation function before feeding into the DNN.
+            must be a callable generator without arguments (i.e. a classname or a function)
+        hidden_activation: optional
+            pytorch activation function between hidden layers of the DNN.
+            must be a callable generator without arguments (i.e. a classname or a function)
+        output_activation: optional
+            pytorch activation function at the output of the DNN.
+            must be a callable generator without arguments (i.e. a classname or a function)
+        use_batch_norm: bool
+            whether batch normalization should be used in the DNN.
+        conditioner: None or callable
+            if set, called as `conditioner(d_in=..., out_shape=..., mask=...)` to create the neural network
+            predicting the transform parameters instead of the rectangular DNN. The DNN options are then ignored.
+            See :py:class:`SharedTrunkHead <zunis.models.layers.trainable.SharedTrunkHead>`
+        """
+
+        super(PWRationalQuadraticCoupling, self).__init__(d=d, mask=mask)
+
+        d_in = sum(mask)
+        d_out = d - d_in
+
+        if conditioner is not None:
+            self.T = conditioner(d_in=d_in, out_shape=(d_out, 3 * n_bins + 1), mask=mask)
+            return
+
+        self.T = ArbitraryShapeRectangularDNN(d_in=d_in,
+                                              out_shape=(d_out, 3 * n_bins + 1),
+                                              d_hidden=d_hidden,
+                                              n_hidden=n_hidden,
+                                              input_activation=input_activation,
+                                              hidden_activation=hidden_activation,
+                                              output_activation=output_activation,
+                                              use_batch_norm=use_batch_norm)
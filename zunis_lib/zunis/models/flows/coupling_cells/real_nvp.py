@@ -91,7 +91,8 @@ class RealNVP(GeneralRealNVP):
                  input_activation=None,
                  hidden_activation=torch.nn.LeakyReLU,
                  output_activation=None,
-                 use_batch_norm=False):
+                 use_batch_norm=False,
+                 conditioner=None):
         """
 
         Parameters
@@ -112,12 +113,20 @@ class RealNVP(GeneralRealNVP):
             activation function applied after the last layer of the neural network
         use_batch_norm: bool
             whether to use batch normalization after each hidden layer of the neural network
+        conditioner: None or callable
+            if set, called as `conditioner(d_in=..., out_shape=..., mask=...)` to create the neural network
+            predicting the transform parameters instead of the rectangular DNN. The DNN options are then ignored.
+            See :py:class:`SharedTrunkHead <zunis.models.layers.trainable.SharedTrunkHead>`
         """
         super(RealNVP, self).__init__(d=d, mask=mask)
 
         d_in = sum(mask)
         d_out = d - d_in
 
+        if conditioner is not None:
+            self.T = conditioner(d_in=d_in, out_shape=(d_out, 2), mask=mask)
+            return
+
         self.T = ArbitraryShapeRectangularDNN(d_in=d_in,
                                               out_shape=(d_out, 2),
                                               d_hidden=d_hidden,
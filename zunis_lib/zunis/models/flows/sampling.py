@@ -5,6 +5,7 @@ of a flow as a sampling layers that draws points and computes the required PDF
 """
 
 import torch
+from zunis.utils.dtypes import resolve_dtype
 
 
 class FactorizedFlowSampler(torch.nn.Module):
@@ -39,12 +40,13 @@ class FactorizedFlowSampler(torch.nn.Module):
 class FactorizedGaussianSampler(FactorizedFlowSampler):
     """Factorized gaussian prior
     Note that tensorflow distribution objects cannot easily be moved devices so specify the right
-    device at initialization.
+    device at initialization. The same holds for the dtype of the samples (default: the pytorch default dtype).
     """
-    def __init__(self, *, d, mu=0., sig=1., device=None):
+    def __init__(self, *, d, mu=0., sig=1., device=None, dtype=None):
         # Copy data
-        sig_ = torch.tensor(sig)
-        mu_ = torch.tensor(mu)
+        dtype = resolve_dtype(dtype)
+        sig_ = torch.tensor(sig, dtype=dtype)
+        mu_ = torch.tensor(mu, dtype=dtype)
 
         if device is not None:
             sig_ = sig_.to(device)
@@ -57,12 +59,13 @@ class FactorizedGaussianSampler(FactorizedFlowSampler):
 class UniformSampler(FactorizedFlowSampler):
     """Factorized uniform prior
     Note that tensorflow distribution objects cannot easily be moved devices so specify the right
-    device at initialization.
+    device at initialization. The same holds for the dtype of the samples (default: the pytorch default dtype).
     """
-    def __init__(self, *, d, low=0., high=1., device=None):
+    def __init__(self, *, d, low=0., high=1., device=None, dtype=None):
         # Copy data
-        low_ = torch.tensor(low, dtype=torch.get_default_dtype())
-        high_ = torch.tensor(high, dtype=torch.get_default_dtype())
+        dtype = resolve_dtype(dtype)
+        low_ = torch.tensor(low, dtype=dtype)
+        high_ = torch.tensor(high, dtype=dtype)
 
         if device is not None:
             low_ = low_.to(device)
@@ -1,6 +1,7 @@
 import torch
 
 from zunis.models.flows.general_flow import GeneralFlow
+from zunis.models.flows.validation import check_deferred
 
 
 class InvertibleSequentialFlow(GeneralFlow):
@@ -17,6 +18,15 @@ class InvertibleSequentialFlow(GeneralFlow):
                 print("All flows in an InvertibleSequentialFlow must be invertible")
                 raise
         self.inverse = False
+        # Optional callable cell_timer(index, method, x) through which the cells are applied. Used for profiling,
+        # see zunis.utils.profiling
+        self.cell_timer = None
+
+    def apply_cell(self, index, method, x):
+        """Apply a method of the cell with the given index, through the cell timer if there is one"""
+        if self.cell_timer is None:
+            return method(x)
+        return self.cell_timer(index, method, x)
 
     def invert(self):
         self.inverse = not self.inverse
@@ -26,22 +36,24 @@ class InvertibleSequentialFlow(GeneralFlow):
     def flow(self, x):
         output = x
         if self.inverse:
-            for f in self.flows[::-1]:
-                output = f.flow(output)
+            for i, f in reversed(list(enumerate(self.flows))):
+                output = self.apply_cell(i, f.flow, output)
         else:
-            for f in self.flows:
-                output = f.flow(output)
+            for i, f in enumerate(self.flows):
+                output = self.apply_cell(i, f.flow, output)
 
+        check_deferred(output, "NaN detected in the output of a sequential flow")
         return output
 
 
     def transform_and_compute_jacobian(self, xj):
         output = xj
         if self.inverse:
-            for f in self.flows[::-1]:
-                output = f.transform_and_compute_jacobian(output)
+            for i, f in reversed(list(enumerate(self.flows))):
+                output = self.apply_cell(i, f.transform_and_compute_jacobian, output)
         else:
-            for f in self.flows:
-                output = f.transform_and_compute_jacobian(output)
+            for i, f in enumerate(self.flows):
+                output = self.apply_cell(i, f.transform_and_compute_jacobian, output)
 
+        check_deferred(output, "NaN detected in the output of a sequential flow")
         return output
\ No newline at end of file
@@ -3,6 +3,7 @@ from functools import partial
 import torch
 
 from .invertible_sequential import InvertibleSequentialFlow
+from zunis.models.layers.trainable import SharedTrunk, SharedTrunkHead
 from zunis.models.flows.coupling_cells.general_coupling import InvertibleCouplingCell
 from zunis.models.flows.analytic_flows.analytic_flow import InvertibleAnalyticFlow
 from ..masking import n_ary_mask_strategy, maximal_masking_strategy,iflow_strategy
@@ -10,6 +11,7 @@ from ..masking import n_ary_mask_strategy, maximal_masking_strategy,iflow_strate
 from zunis.models.flows.coupling_cells.real_nvp import RealNVP
 from zunis.models.flows.coupling_cells.piecewise_coupling.piecewise_linear import PWLinearCoupling
 from zunis.models.flows.coupling_cells.piecewise_coupling.piecewise_quadratic import PWQuadraticCoupling
+from zunis.models.flows.coupling_cells.piecewise_coupling.rational_quadratic import PWRationalQuadraticCoupling
 from zunis.models.flows.analytic_flows.element_wise import InvertibleAnalyticSigmoid
 
 
@@ -18,7 +20,7 @@ class MaskListRepeatedCellFlow(InvertibleSequentialFlow):
     with each a different mask as a sequence of transformations"""
 
     def __init__(self, d, cell, masks, *, input_cell=None, output_cell=None, cell_params=None, input_cell_params=None,
-                 output_cell_params=None):
+                 output_cell_params=None, shared_trunk=None):
         """
 
         Parameters
@@ -40,6 +42,10 @@ class MaskListRepeatedCellFlow(InvertibleSequentialFlow):
             parameters of the input cell
         output_cell_params: dict
             parameters of the output cell
+        shared_trunk: None or dict
+            if set, the coupling cells share a :py:class:`SharedTrunk <zunis.models.layers.trainable.SharedTrunk>`
+            created with these options and each cell only owns a linear head. The cell must accept a
+            `conditioner` argument.
         """
         assert issubclass(cell, InvertibleCouplingCell), "The repeated cell must be an InvertibleCouplingCell"
 
@@ -55,8 +61,14 @@ class MaskListRepeatedCellFlow(InvertibleSequentialFlow):
             assert issubclass(input_cell, InvertibleAnalyticFlow), "The input cell must be an InvertibleAnalyticFlow"
             flows.append(input_cell(d=d, **input_cell_params))
 
-        for mask in masks:
-            flows.append(cell(d=d, mask=mask, **cell_params))
+        if shared_trunk is None:
+            for mask in masks:
+                flows.append(cell(d=d, mask=mask, **cell_params))
+        else:
+            trunk = SharedTrunk(d=d, n_cells=len(masks), **shared_trunk)
+            for i, mask in enumerate(masks):
+                conditioner = partial(SharedTrunkHead, trunk=trunk, cell_index=i)
+                flows.append(cell(d=d, mask=mask, conditioner=conditioner, **cell_params))
 
         if output_cell is not None:
             assert issubclass(output_cell, InvertibleAnalyticFlow), "The output cell must be an InvertibleAnalyticFlow"
@@ -71,7 +83,8 @@ class RepeatedCellFlow(MaskListRepeatedCellFlow):
     """
     cells = {"realnvp": (RealNVP, None, InvertibleAnalyticSigmoid),
              "pwlinear": (PWLinearCoupling, None, None),
-             "pwquad": (PWQuadraticCoupling, None, None)}
+             "pwquad": (PWQuadraticCoupling, None, None),
+             "pwrq": (PWRationalQuadraticCoupling, None, None)}
 
     masking = {
         "checkerboard": partial(n_ary_mask_strategy, n=2),
@@ -80,14 +93,15 @@ class RepeatedCellFlow(MaskListRepeatedCellFlow):
     }
 
     def __init__(self, d, cell="pwlinear", masking="checkerboard", *, input_cell=None, output_cell=None,
-                 cell_params=None, input_cell_params=None, output_cell_params=None, masking_options=None):
+                 cell_params=None, input_cell_params=None, output_cell_params=None, masking_options=None,
+                 shared_trunk=None):
         """
 
         Parameters
         ----------
         d: int
             dimensionality
-        cell: {"pwlinear", "pwquad", "realnvp"}
+        cell: {"pwlinear", "pwquad", "pwrq", "realnvp"}
             coupling cell choice
         masking: {"checkerboard", "maximal"}
             masking strategy. See :py:attr:`RepeatedCellFlow.masking <zunis.models.flows.sequential.repeated_cell.RepeatedCellFlow.masking>`
@@ -104,6 +118,9 @@ class RepeatedCellFlow(MaskListRepeatedCellFlow):
             parameters for the output_cell
         masking_options: dict, optional
             parameters for the masking strategy
+        shared_trunk: dict, optional
+            options of a conditioner trunk shared by all cells.
+            See :py:class:`MaskListRepeatedCellFlow <zunis.models.flows.sequential.repeated_cell.MaskListRepeatedCellFlow>`
         """
 
         if isinstance(cell, str):
@@ -124,4 +141,4 @@ class RepeatedCellFlow(MaskListRepeatedCellFlow):
         super(RepeatedCellFlow, self).__init__(d, cell=cell, masks=masks,
                                                input_cell=input_cell, output_cell=output_cell,
                                                cell_params=cell_params, input_cell_params=input_cell_params,
-                                               output_cell_params=output_cell_params)
+                                               output_cell_params=output_cell_params, shared_trunk=shared_trunk)
@@ -0,0 +1,72 @@
+"""Numerical validation of flow computations
+
+Checking a tensor for NaNs on a CUDA device forces the host to wait for the device. Doing so for every
+transform of every coupling cell is costly, so the amount of checking is set by a global validation mode:
+
+* "eager": every piecewise transform checks its bin indices and its output, as soon as they are computed
+* "deferred" (default): a single check is performed on the output of each
+  :py:class:`InvertibleSequentialFlow <zunis.models.flows.sequential.invertible_sequential.InvertibleSequentialFlow>`
+* "off": no checks. Invalid values propagate to the loss, which trainers check anyway.
+
+In all modes, bin indices are clamped to their valid range after conversion to integers so that corrupt
+values can never be used to index a tensor (which would trigger a device-side assert on CUDA devices).
+Invalid values are reported by raising
+:py:class:`AvertedCUDARuntimeError <zunis.utils.exceptions.AvertedCUDARuntimeError>`.
+"""
+from contextlib import contextmanager
+
+import torch
+from zunis.utils.exceptions import AvertedCUDARuntimeError
+
+validation_modes = ("eager", "deferred", "off")
+
+_validation_mode = "deferred"
+
+
+def get_validation_mode():
+    """Get the current validation mode"""
+    return _validation_mode
+
+
+def set_validation_mode(mode):
+    """Set the validation mode
+
+    Parameters
+    ----------
+    mode: {"eager", "deferred", "off"}
+    """
+    global _validation_mode
+    assert mode in validation_modes, f"The validation mode must be one of {validation_modes}"
+    _validation_mode = mode
+
+
+@contextmanager
+def validation_mode(mode):
+    """Context manager to temporarily set the validation mode"""
+    previous_mode = get_validation_mode()
+    set_validation_mode(mode)
+    try:
+        yield
+    finally:
+        set_validation_mode(previous_mode)
+
+
+def safe_bin_indices(indices, n_bins):
+    """Convert bin indices to integers within [[0, n_bins-1]]
+
+    Clamping is performed after the conversion: NaN values converted to integers are arbitrary and would
+    not be handled by clamping the floating point values.
+    """
+    return torch.clamp(indices.to(torch.long), 0, n_bins - 1)
+
+
+def check_eager(tensor, message):
+    """Raise an error if a tensor contains NaNs, only in eager validation mode"""
+    if _validation_mode == "eager" and torch.isnan(tensor).any().item():
+        raise AvertedCUDARuntimeError(message)
+
+
+def check_deferred(tensor, message):
+    """Raise an error if a tensor contains NaNs, only in deferred validation mode"""
+    if _validation_mode == "deferred" and torch.isnan(tensor).any().item():
+        raise AvertedCUDARuntimeError(message)
@@ -1,6 +1,8 @@
 """Trainable layers
 """
 import torch
+from zunis.models.utils import Reshift
+
 
 class OverallAffineLayer(torch.nn.Module):
     """Learnable overall affine transformation
@@ -81,3 +83,122 @@ class ArbitraryShapeRectangularDNN(torch.nn.Module):
     def forward(self, x):
         return self.nn(x).view(*(x.shape[:-1]), *self.out_shape)
 
+
+
+class SharedTrunk(torch.nn.Module):
+    """Neural network trunk shared between the conditioners of several coupling cells
+
+    The input of each coupling cell conditioner is scattered into a vector of the full space dimension,
+    with zeros at the positions of the transformed variables, and concatenated with a one-hot encoding of the cell.
+    The trunk maps this vector to a feature vector of dimension `d_hidden` which is then fed to a small
+    cell-specific head (see :py:class:`SharedTrunkHead`).
+    """
+
+    def __init__(self, *,
+                 d,
+                 n_cells,
+                 d_hidden=256,
+                 n_hidden=8,
+                 input_activation=Reshift,
+                 hidden_activation=torch.nn.LeakyReLU,
+                 use_batch_norm=False):
+        """
+
+        Parameters
+        ----------
+        d: int
+            dimension of the space
+        n_cells: int
+            number of coupling cells sharing the trunk
+        d_hidden: int
+            width of the trunk and dimension of the feature vector
+        n_hidden: int
+            number of hidden layers. Together with a linear head, the conditioners have the same depth as a
+            :py:class:`ArbitraryShapeRectangularDNN` with the same number of hidden layers
+        input_activation: optional
+            activation function applied to the conditioner input before scattering it in the trunk input
+        hidden_activation: optional
+            activation function applied after each layer of the trunk
+        use_batch_norm: bool
+            whether to use batch normalization after each hidden layer
+        """
+        super(SharedTrunk, self).__init__()
+        self.d = d
+        self.n_cells = n_cells
+        self.d_hidden = d_hidden
+        self.input_activation = input_activation() if input_activation is not None else None
+
+        self.nn = create_rectangular_dnn(d_in=d + n_cells,
+                                         d_out=d_hidden,
+                                         d_hidden=d_hidden,
+                                         n_hidden=max(n_hidden - 1, 0),
+                                         hidden_activation=hidden_activation,
+                                         output_activation=hidden_activation,
+                                         use_batch_norm=use_batch_norm)
+
+    def forward(self, x, positions, cell_index):
+        """Compute the features for the conditioner of a cell
+
+        Parameters
+        ----------
+        x: torch.Tensor
+            conditioner input with shape (N, len(positions))
+        positions: list of int
+            positions of the input variables in the full space
+        cell_index: int
+            index of the cell
+
+        Returns
+        -------
+            torch.Tensor
+                features with shape (N, d_hidden)
+        """
+        if self.input_activation is not None:
+            x = self.input_activation(x)
+
+        trunk_input = torch.zeros(x.shape[0], self.d + self.n_cells, dtype=x.dtype, device=x.device)
+        trunk_input[:, positions] = x
+        trunk_input[:, self.d + cell_index] = 1.
+        return self.nn(trunk_input)
+
+
+class SharedTrunkHead(torch.nn.Module):
+    """Coupling cell conditioner made of a shared trunk and a cell-specific linear head
+
+    Instances are meant to be created through the `conditioner` argument of coupling cells, which calls it
+    with the arguments `d_in`, `out_shape` and `mask`. The trunk and cell index are set beforehand,
+    for example with `functools.partial`.
+    """
+
+    def __init__(self, *, trunk, cell_index, d_in, out_shape, mask):
+        """
+
+        Parameters
+        ----------
+        trunk: :py:class:`SharedTrunk`
+            shared trunk
+        cell_index: int
+            index of the cell in the trunk one-hot encoding
+        d_in: int
+            number of input variables
+        out_shape: tuple of int
+            shape of the output for each point
+        mask: list of bool
+            mask of the coupling cell: the input variables are the True entries
+        """
+        super(SharedTrunkHead, self).__init__()
+        assert 0 <= cell_index < trunk.n_cells, "The cell index must be smaller than the number of cells of the trunk"
+        self.trunk = trunk
+        self.cell_index = cell_index
+        self.positions = [i for i, m in enumerate(mask) if m]
+        assert len(self.positions) == d_in, "The mask does not match the number of input variables"
+        self.out_shape = tuple(out_shape)
+
+        d_out = 1
+        for d in out_shape:
+            d_out *= d
+        self.head = torch.nn.Linear(trunk.d_hidden, d_out)
+
+    def forward(self, x):
+        features = self.trunk(x, self.positions, self.cell_index)
+        return self.head(features).view(*(x.shape[:-1]), *self.out_shape)
@@ -0,0 +1,40 @@
+"""Learning rate schedulers for flow training
+
+Schedulers are stepped once per training epoch by
+:py:class:`BasicStatefulTrainer <zunis.training.weighted_dataset.weighted_dataset_trainer.BasicStatefulTrainer>`.
+They live as long as the trainer, so that a schedule spans all the batches of a survey stage.
+"""
+from torch.optim.lr_scheduler import LambdaLR, ReduceLROnPlateau
+
+
+def linear_warmup(optimizer, warmup_epochs, start_factor=0.1):
+    """Linear learning rate warmup
+
+    The learning rate rises linearly from `start_factor` times its base value to its base value over
+    `warmup_epochs` epochs and then stays constant.
+
+    Parameters
+    ----------
+    optimizer: torch.optim.Optimizer
+    warmup_epochs: int
+        number of epochs before the base learning rate is reached
+    start_factor: float
+        fraction of the base learning rate used at the first epoch
+
+    Returns
+    -------
+        torch.optim.lr_scheduler.LambdaLR
+    """
+    assert warmup_epochs > 0, "The number of warmup epochs must be positive"
+
+    def factor(epoch):
+        if epoch >= warmup_epochs:
+            return 1.
+        return start_factor + (1. - start_factor) * epoch / warmup_epochs
+
+    return LambdaLR(optimizer, factor)
+
+
+def is_metric_scheduler(scheduler):
+    """Whether a scheduler must be given a metric value when stepping"""
+    return isinstance(scheduler, ReduceLROnPlateau)
@@ -0,0 +1,107 @@
+"""Distillation of trained flows into smaller flows
+
+After the survey phase, a flow is only used for sampling. A smaller student flow can be trained to reproduce the
+PDF of the trained teacher flow by matching their log-densities on a batch of points, which makes each sampled
+point cheaper during the refine phase.
+"""
+import torch
+
+from .minibatching import parse_minibatch_size
+
+
+def flow_log_density(flow, latent_prior, xj):
+    """Compute the log-PDF of a flow model on a batch of points in target space
+
+    Parameters
+    ----------
+    flow: :py:class:`GeneralFlow <zunis.models.flows.general_flow.GeneralFlow>`
+    latent_prior: :py:class:`FactorizedFlowSampler <zunis.models.flows.sampling.FactorizedFlowSampler>`
+    xj: torch.Tensor
+        batch of points in target space with an extra last column of zeros
+
+    Returns
+    -------
+        torch.Tensor
+            log q(x)
+    """
+    if not flow.inverse:
+        flow.invert()
+    zj = flow(xj)
+    return zj[:, -1] + latent_prior.log_prob(zj[:, :-1])
+
+
+def log_density_matching_loss(student_logqx, teacher_logqx, weights=None):
+    """Mean squared difference between the log-densities of a student and a teacher flow
+
+    Parameters
+    ----------
+    student_logqx: torch.Tensor
+    teacher_logqx: torch.Tensor
+    weights: None or torch.Tensor
+        optional per-point weights
+
+    Returns
+    -------
+        torch.Tensor
+    """
+    squared_difference = (student_logqx - teacher_logqx) ** 2
+    if weights is None:
+        return torch.mean(squared_difference)
+    return torch.mean(weights * squared_difference)
+
+
+def distill_flow(teacher, student, latent_prior, x, weights=None, n_epochs=50, minibatch_size=None, optim=None):
+    """Train a student flow to reproduce the PDF of a teacher flow
+
+    Parameters
+    ----------
+    teacher: :py:class:`GeneralFlow <zunis.models.flows.general_flow.GeneralFlow>`
+        trained flow
+    student: :py:class:`GeneralFlow <zunis.models.flows.general_flow.GeneralFlow>`
+        flow to train. Both flows share the same latent prior.
+    latent_prior: :py:class:`FactorizedFlowSampler <zunis.models.flows.sampling.FactorizedFlowSampler>`
+    x: torch.Tensor
+        batch of points in target space on which the log-densities are matched
+    weights: None or torch.Tensor
+        optional per-point weights of the matching loss, for example the normalized importance weights f(x)/p(x)
+        to focus on the regions that dominate the integral
+    n_epochs: int
+        number of iterations over the batch
+    minibatch_size: None or int or float
+        see :py:func:`parse_minibatch_size <zunis.training.weighted_dataset.minibatching.parse_minibatch_size>`
+    optim: None or callable
+        optimizer constructor taking the student parameters as its only argument. If None, default Adam is used
+
+    Returns
+    -------
+        list of float
+            matching loss averaged over each epoch
+    """
+    xj = torch.cat([x, torch.zeros(x.shape[0], 1, dtype=x.dtype, device=x.device)], dim=1)
+    with torch.no_grad():
+        teacher_logqx = flow_log_density(teacher, latent_prior, xj)
+
+    if optim is None:
+        optimizer = torch.optim.Adam(student.parameters())
+    else:
+        optimizer = optim(student.parameters())
+
+    n_points = x.shape[0]
+    minibatch_size = min(parse_minibatch_size(minibatch_size, n_points), n_points)
+
+    losses = []
+    for epoch in range(n_epochs):
+        order = torch.randperm(n_points, device=x.device)
+        epoch_loss = 0.
+        for begin in range(0, n_points, minibatch_size):
+            indices = order[begin:begin + minibatch_size]
+            student_logqx = flow_log_density(student, latent_prior, xj[indices])
+            loss = log_density_matching_loss(student_logqx, teacher_logqx[indices],
+                                             weights[indices] if weights is not None else None)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            epoch_loss += loss.detach().cpu().item() * indices.shape[0]
+        losses.append(epoch_loss / n_points)
+
+    return losses
@@ -0,0 +1,161 @@
+"""Minibatch iteration over weighted datasets
+
+A weighted dataset (x, p(x), f(x)) is iterated over many times during training: once per epoch.
+The tools in this module prepare the flow input (x with an appended log-inverse-PDF column) once per batch
+and then write each minibatch into preallocated buffers instead of allocating new tensors at every
+gradient step.
+"""
+import torch
+
+
+def parse_minibatch_size(minibatch_size, n_points):
+    """Convert a minibatch size specification into a number of points
+
+    Parameters
+    ----------
+    minibatch_size: None or int or float
+        None (full batch), a float in ]0,1] (fraction of the full batch) or a positive int
+    n_points: int
+        size of the full batch
+
+    Returns
+    -------
+        int
+    """
+    if minibatch_size is None:
+        return n_points
+    elif isinstance(minibatch_size, float) and 0 < minibatch_size <= 1.:
+        return max(int(minibatch_size * n_points), 1)
+
+    assert isinstance(minibatch_size, int) and minibatch_size > 0, \
+        f"minibatch size must be None, a float in ]0,1] or a positive int. Got {type(minibatch_size)}"
+    return minibatch_size
+
+
+class MinibatchIterator:
+    """Iterable over the minibatches of a weighted dataset
+
+    Each iteration over this object is one epoch. The batch is shuffled with a single random permutation per epoch
+    and each minibatch is gathered into preallocated buffers of shape `(minibatch_size, d+1)`, `(minibatch_size,)`
+    and `(minibatch_size,)`. The last column of the point buffer is the log-inverse-PDF column expected by flows
+    in training mode and is always zero.
+
+    Notes
+    -----
+    The yielded tensors are views of the internal buffers: they are only valid until the next minibatch is
+    requested, which is the natural lifetime of a minibatch in a training loop.
+
+    If the batch lives on the CPU while training happens on a CUDA device, the batch is copied once to pinned
+    host memory and minibatches are transferred asynchronously to the device buffers. Batches living on any other
+    device than the training device are copied to it once.
+    """
+
+    def __init__(self, x, px, fx, minibatch_size=None, shuffle=True, prefetch=False, device=None):
+        """
+
+        Parameters
+        ----------
+        x: torch.Tensor
+            batch of points in target space with shape (N, d)
+        px: torch.Tensor
+            PDF of the distribution from which x was sampled, with shape (N,)
+        fx: torch.Tensor
+            un-normalized target function values, with shape (N,)
+        minibatch_size: None or int or float
+            see :py:func:`parse_minibatch_size`
+        shuffle: bool
+            whether to draw a new random ordering of the batch at each epoch
+        prefetch: bool
+            whether to double-buffer: gather the next minibatch before the current one is yielded
+        device: None or torch.device
+            device on which minibatches are yielded. Defaults to the device of `x`.
+        """
+        n_points, d = x.shape
+        assert px.shape == fx.shape == (n_points,), "Shape mismatch: expected (N,d), (N,) and (N,)"
+
+        self.n_points = n_points
+        self.minibatch_size = min(parse_minibatch_size(minibatch_size, n_points), n_points)
+        self.shuffle = shuffle
+        self.prefetch = prefetch
+        self.device = x.device if device is None else torch.device(device)
+
+        xj = torch.cat([x, torch.zeros(n_points, 1, dtype=x.dtype, device=x.device)], dim=1)
+
+        # Full batch training: no buffers needed, the same tensors are yielded at each epoch
+        if self.minibatch_size == n_points:
+            self.data = (xj.to(self.device), px.to(self.device), fx.to(self.device))
+            self.staging = False
+            self.buffers = []
+            return
+
+        self.staging = self.device.type == "cuda" and xj.device.type == "cpu"
+        if self.staging:
+            xj, px, fx = xj.pin_memory(), px.pin_memory(), fx.pin_memory()
+        else:
+            # Other device pairs (CUDA to CPU, between CUDA devices) are copied once so that minibatches are
+            # gathered on the target device
+            xj, px, fx = xj.to(self.device), px.to(self.device), fx.to(self.device)
+        self.data = (xj, px, fx)
+
+        n_buffers = 2 if prefetch else 1
+        self.buffers = [self.allocate_buffer() for _ in range(n_buffers)]
+
+    def allocate_buffer(self):
+        """Allocate a set of minibatch buffers
+
+        Returns
+        -------
+            tuple of tuple of torch.Tensor
+                (host buffers, device buffers). They are the same tensors unless staging through pinned memory
+        """
+        device_buffer = tuple(torch.empty((self.minibatch_size,) + tuple(t.shape[1:]), dtype=t.dtype,
+                                          device=self.device) for t in self.data)
+        if not self.staging:
+            return device_buffer, device_buffer
+
+        host_buffer = tuple(torch.empty((self.minibatch_size,) + tuple(t.shape[1:]), dtype=t.dtype).pin_memory()
+                            for t in self.data)
+        return host_buffer, device_buffer
+
+    def fill(self, buffer, indices):
+        """Gather the points at `indices` into a buffer and return views of the filled part"""
+        n = indices.shape[0]
+        host_buffer, device_buffer = buffer
+        for source, host, target in zip(self.data, host_buffer, device_buffer):
+            torch.index_select(source, 0, indices, out=host[:n])
+            if self.staging:
+                target[:n].copy_(host[:n], non_blocking=True)
+        return tuple(target[:n] for target in device_buffer)
+
+    def __len__(self):
+        return (self.n_points + self.minibatch_size - 1) // self.minibatch_size
+
+    def __iter__(self):
+        if not self.buffers:
+            yield self.data
+            return
+
+        source_device = self.data[0].device
+        if self.shuffle:
+            order = torch.randperm(self.n_points, device=source_device)
+        else:
+            order = torch.arange(self.n_points, device=source_device)
+
+        bounds = [(begin, min(begin + self.minibatch_size, self.n_points))
+                  for begin in range(0, self.n_points, self.minibatch_size)]
+
+        if not self.prefetch:
+            for begin, end in bounds:
+                yield self.fill(self.buffers[0], order[begin:end])
+            return
+
+        # Double buffering: the next minibatch is gathered before the current one is handed over.
+        begin, end = bounds[0]
+        current = self.fill(self.buffers[0], order[begin:end])
+        for i in range(1, len(bounds) + 1):
+            if i < len(bounds):
+                begin, end = bounds[i]
+                upcoming = self.fill(self.buffers[i % 2], order[begin:end])
+            yield current
+            if i < len(bounds):
+                current = upcoming
@@ -0,0 +1,139 @@
+"""Replay buffer for weighted datasets
+
+Evaluating the integrand is typically the dominant cost of an integration. Instead of discarding each survey batch
+after training on it, a replay buffer keeps a bounded number of past batches (x, p(x), f(x)) and the trainer
+trains on all of them.
+
+Points from older batches were sampled from older flow states (or from a flat distribution). Each point keeps the
+PDF p(x) it was actually sampled from. For any batch k, the weighted losses estimate their target integral without
+bias when each point is weighted by f(x)/p_k(x), so the union of batches, each with its own sampling PDF, is also an
+unbiased estimator of the same loss.
+"""
+import torch
+
+
+def effective_sample_fraction(px, fx):
+    """Effective sample size of an importance-weighted batch divided by its size
+
+    Parameters
+    ----------
+    px: torch.Tensor
+        sampling PDF values
+    fx: torch.Tensor
+        function values
+
+    Returns
+    -------
+        float
+            (sum w)^2 / (n sum w^2) with w = f(x)/p(x). This is 1 for perfectly flat weights and close to 0 when
+            a few points dominate the batch.
+    """
+    w = fx / px
+    w2_sum = (w ** 2).sum()
+    if w2_sum == 0.:
+        return 0.
+    return ((w.sum() ** 2) / (w.shape[0] * w2_sum)).cpu().item()
+
+
+class ReplayBuffer:
+    """Bounded store of past weighted batches
+
+    Batches are stored whole and evicted whole so that each stored batch remains a proper sample from its
+    own sampling distribution.
+
+    Eviction policies:
+
+    * "age": the oldest batches are evicted first
+    * "weight": the batches with the lowest effective sample fraction (the noisiest importance weights)
+      are evicted first
+
+    The most recent batch is never evicted.
+    """
+
+    eviction_policies = ("age", "weight")
+
+    def __init__(self, max_points, eviction="age", max_age=None):
+        """
+
+        Parameters
+        ----------
+        max_points: int
+            maximum number of points kept in the buffer. The most recent batch is kept even if it is larger.
+        eviction: {"age", "weight"}
+            eviction policy when the buffer is over capacity
+        max_age: None or int
+            if set, batches added more than `max_age` batches ago are evicted regardless of capacity.
+            `max_age=1` keeps only the most recent batch
+        """
+        assert eviction in self.eviction_policies, f"Eviction policy must be one of {self.eviction_policies}"
+        assert max_points > 0, "The replay buffer must be able to hold points"
+        assert max_age is None or max_age >= 1, "The maximum age must be at least 1 to keep the most recent batch"
+        self.max_points = max_points
+        self.eviction = eviction
+        self.max_age = max_age
+        self.batches = []
+        self.n_batches_seen = 0
+
+    @property
+    def n_points(self):
+        """Number of points currently stored"""
+        return sum(batch["x"].shape[0] for batch in self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+    def add(self, x, px, fx):
+        """Store a new batch and evict old ones if needed
+
+        Parameters
+        ----------
+        x: torch.Tensor
+            batch of points sampled from p(x)
+        px: torch.Tensor
+            PDF from which the points were sampled
+        fx: torch.Tensor
+            function values
+        """
+        self.batches.append({
+            "x": x.detach(),
+            "px": px.detach(),
+            "fx": fx.detach(),
+            "index": self.n_batches_seen,
+            "score": effective_sample_fraction(px, fx) if self.eviction == "weight" else None
+        })
+        self.n_batches_seen += 1
+        self.evict()
+
+    def evict(self):
+        """Apply the age limit and the capacity limit"""
+        if self.max_age is not None:
+            self.batches = [batch for batch in self.batches if self.n_batches_seen - batch["index"] <= self.max_age]
+
+        n_points = self.n_points
+        while n_points > self.max_points and len(self.batches) > 1:
+            if self.eviction == "age":
+                position = 0
+            else:
+                position = min(range(len(self.batches) - 1), key=lambda i: self.batches[i]["score"])
+            evicted = self.batches.pop(position)
+            n_points -= evicted["x"].shape[0]
+
+    def as_batch(self):
+        """Concatenate all stored batches
+
+        Returns
+        -------
+            tuple of torch.Tensor
+                (x, px, fx)
+        """
+        assert len(self.batches) > 0, "The replay buffer is empty"
+        if len(self.batches) == 1:
+            batch = self.batches[0]
+            return batch["x"], batch["px"], batch["fx"]
+
+        return tuple(torch.cat([batch[key] for batch in self.batches], dim=0) for key in ("x", "px", "fx"))
+
+    def reset(self):
+        """Empty the buffer"""
+        self.batches = []
+        self.n_batches_seen = 0
@@ -1,11 +1,15 @@
 """Main weighted dataset stateful trainer API class"""
 from functools import partial
+from math import isfinite
 import torch
 
 from .weighted_dataset_trainer import BasicStatefulTrainer
 from zunis.models.flows.sequential.repeated_cell import RepeatedCellFlow
+from zunis.models.flows.coupling_cells.general_coupling import cast_conditioners
+from zunis.utils.dtypes import resolve_dtype
 from .dkl_training import weighted_dkl_loss
-from .variance_training import weighted_variance_loss
+from .variance_training import weighted_variance_loss, importance_sampling_variance
+from .distillation import distill_flow, flow_log_density
 from zunis.models.flows.sampling import UniformSampler, FactorizedGaussianSampler, FactorizedFlowSampler
 
 
@@ -20,10 +24,18 @@ class StatefulTrainer(BasicStatefulTrainer):
     }
     """Dictionary for the string-based API to define the loss function used in training"""
 
+    validation_metric_map = {
+        "loss": None,
+        "variance": importance_sampling_variance
+    }
+    """Dictionary for the string-based API to define the metric used for early stopping. `None` means that the
+    training loss is used"""
+
     default_flow_priors = {
         "realnvp": FactorizedGaussianSampler,
         "pwlinear": UniformSampler,
-        "pwquad": UniformSampler}
+        "pwquad": UniformSampler,
+        "pwrq": UniformSampler}
     """Dictionary for the string-based API to define the distribution of the data in latent space based on
     the choice of coupling cell"""
 
@@ -34,7 +46,8 @@ class StatefulTrainer(BasicStatefulTrainer):
     """Dictionary for the string-based API to define the distribution of the data in latent space"""
 
     def __init__(self, d, loss="variance", flow="pwlinear", flow_prior=None, flow_options=None, prior_options=None,
-                 device=torch.device("cpu"), n_epochs=10, optim=None, **kwargs):
+                 device=torch.device("cpu"), n_epochs=10, optim=None, scheduler=None, dtype=None, network_dtype=None,
+                 **kwargs):
         """
 
         Parameters
@@ -63,6 +76,22 @@ class StatefulTrainer(BasicStatefulTrainer):
             number of epochs per batch of data during training
         optim: None or torch.optim.Optimizer sublcass
             optimizer to use for training. If none, default Adam is used
+        scheduler: None or function
+            learning rate scheduler constructor taking the optimizer as its only argument, for example the output of
+            :py:func:`get_scheduler_from_config <zunis.utils.config.loaders.get_scheduler_from_config>`.
+            If None, the learning rate is constant
+        dtype: None or str or torch.dtype
+            dtype of the flow and of the latent space samples: this is the precision in which the variable
+            transforms and their Jacobians are computed. If None, the pytorch default dtype is used for new models
+            and provided models are left as they are
+        network_dtype: None or str or torch.dtype
+            dtype of the neural networks of the coupling cells, if different from `dtype`. For example,
+            `dtype="float64"` and `network_dtype="float32"` runs the networks in single precision and accumulates
+            the Jacobians in double precision.
+        kwargs:
+            options passed to :py:class:`BasicStatefulTrainer <zunis.training.weighted_dataset.weighted_dataset_trainer.BasicStatefulTrainer>`.
+            The early stopping option `validation_metric` can be a string, mapped using
+            :py:attr:`zunis.training.weighted_dataset.stateful_trainer.StatefulTrainer.validation_metric_map`
         """
 
         # The loss function is either a string that points to the loss_map class dictionary or an actual loss function
@@ -79,6 +108,9 @@ class StatefulTrainer(BasicStatefulTrainer):
         # - an actual prior object to be used as-is
         if prior_options is None:
             prior_options = dict()
+        if dtype is not None:
+            dtype = resolve_dtype(dtype)
+            prior_options = {"dtype": dtype, **prior_options}
 
         if flow_prior is None:
             assert isinstance(flow,
@@ -92,15 +124,173 @@ class StatefulTrainer(BasicStatefulTrainer):
                 "The flow prior must be either None, a string or a FactorizedFlowSampler"
 
         # Two options for flows: either use the RepeatedCellFlow interface or pass an actual flow object
+        # The specification of string-based flows is kept to build smaller students when distilling
         if isinstance(flow, str):
             if flow_options is None:
                 flow_options = dict()
+            self.flow_spec = {"d": d, "cell": flow, **flow_options}
             flow = RepeatedCellFlow(d=d, cell=flow, **flow_options).to(device)
+        else:
+            self.flow_spec = None
+        self.flow_dtype = resolve_dtype(dtype) if dtype is not None else None
+        self.network_dtype = resolve_dtype(network_dtype) if network_dtype is not None else None
+
+        if dtype is not None:
+            flow = flow.to(dtype)
+        if self.network_dtype is not None:
+            cast_conditioners(flow, self.network_dtype)
 
         if optim is None:
             optim_ = torch.optim.Adam(flow.parameters())
         else:
             optim_ = optim(flow.parameters())
 
+        if scheduler is not None:
+            kwargs["scheduler"] = scheduler(optim_)
+
+        if isinstance(kwargs.get("validation_metric", None), str):
+            kwargs["validation_metric"] = self.validation_metric_map[kwargs["validation_metric"]]
+
         super(StatefulTrainer, self).__init__(flow, flow_prior, n_epochs=n_epochs, optim=optim_, **kwargs)
         self.loss = loss
+
+    def set_config(self, **kwargs):
+        """Set the saved configuration, mapping string-based options to their values"""
+        if isinstance(kwargs.get("validation_metric", None), str):
+            kwargs["validation_metric"] = self.validation_metric_map[kwargs["validation_metric"]]
+        super(StatefulTrainer, self).set_config(**kwargs)
+
+    def build_student_flow(self, cell_params=None, shared_trunk=None):
+        """Build a flow with the same cells and masking as the trained flow but smaller conditioners
+
+        Parameters
+        ----------
+        cell_params: None or dict
+            conditioner options of the student cells, replacing those of the trained flow.
+            If None, use `{"d_hidden": 64, "n_hidden": 2}`
+        shared_trunk: None or dict
+            shared trunk options of the student, replacing those of the trained flow
+
+        Returns
+        -------
+            :py:class:`RepeatedCellFlow <zunis.models.flows.sequential.repeated_cell.RepeatedCellFlow>`
+        """
+        assert self.flow_spec is not None, "Students can only be built for flows defined with the string-based API"
+        if cell_params is None:
+            cell_params = {"d_hidden": 64, "n_hidden": 2}
+
+        spec = {key: value for key, value in self.flow_spec.items() if key not in ("cell_params", "shared_trunk")}
+        if shared_trunk is not None:
+            spec["shared_trunk"] = shared_trunk
+        else:
+            spec["cell_params"] = cell_params
+
+        student = RepeatedCellFlow(**spec).to(self.device)
+        if self.flow_dtype is not None:
+            student = student.to(self.flow_dtype)
+        if self.network_dtype is not None:
+            cast_conditioners(student, self.network_dtype)
+        return student
+
+    def distill(self, x, px, fx, student=None, student_cell_params=None, n_epochs=50, minibatch_size=None,
+                weighted=True, tolerance=0.1, validation_fraction=0.2, optim=None):
+        """Distill the trained flow into a smaller student flow and use the student if it is good enough
+
+        The student is trained to match the log-PDF of the trained flow on a batch of points and is validated by
+        comparing the variances of the importance sampling estimators of both flows on held-out points.
+        If the student variance is within `tolerance` of the trained flow variance, the student replaces the
+        trained flow. The optimizer is then reset on the student parameters and the scheduler and checkpoints
+        are discarded.
+
+        Parameters
+        ----------
+        x: torch.Tensor
+            batch of points, for example the last survey batch
+        px: torch.Tensor
+            PDF of the points
+        fx: torch.Tensor
+            integrand values of the points
+        student: None or :py:class:`GeneralFlow <zunis.models.flows.general_flow.GeneralFlow>`
+            flow to distill into. If None, one is built with :py:meth:`build_student_flow`
+        student_cell_params: None or dict
+            conditioner options passed to :py:meth:`build_student_flow`
+        n_epochs: int
+            number of epochs of distillation
+        minibatch_size: None or int or float
+            minibatch size used for distillation
+        weighted: bool
+            whether to weight the log-density matching loss by the normalized importance weights |f(x)|/p(x)
+        tolerance: float
+            maximum relative increase in variance for the student to be accepted
+        validation_fraction: float
+            fraction of the batch held out for validation
+        optim: None or callable
+            optimizer constructor for distillation. If None, default Adam is used
+
+        Returns
+        -------
+            dict
+                distillation report with keys "accepted", "teacher_variance", "student_variance",
+                "teacher_parameters", "student_parameters" and "losses"
+        """
+        if student is None:
+            student = self.build_student_flow(cell_params=student_cell_params)
+
+        n_validation = int(validation_fraction * x.shape[0])
+        assert 0 < n_validation < x.shape[0], "The validation fraction must leave points for training and validation"
+        indices = torch.randperm(x.shape[0], device=x.device)
+        validation_indices = indices[:n_validation]
+        training_indices = indices[n_validation:]
+
+        x_train = x[training_indices]
+        weights = None
+        if weighted:
+            weights = (fx[training_indices] / px[training_indices]).abs()
+            weights = (weights / weights.mean()).to(x.dtype)
+
+        losses = distill_flow(self.flow, student, self.latent_prior, x_train, weights=weights, n_epochs=n_epochs,
+                              minibatch_size=minibatch_size, optim=optim)
+
+        x_val, px_val, fx_val = x[validation_indices], px[validation_indices], fx[validation_indices]
+        with torch.no_grad():
+            teacher_logqx = self.compute_logqx_no_grad(x_val)
+            xj_val = torch.cat([x_val, torch.zeros(n_validation, 1, dtype=x_val.dtype, device=x_val.device)], dim=1)
+            student_logqx = flow_log_density(student, self.latent_prior, xj_val)
+            teacher_variance = importance_sampling_variance(
+                *self.cast_loss_inputs(fx_val, px_val, teacher_logqx)).cpu().item()
+            student_variance = importance_sampling_variance(
+                *self.cast_loss_inputs(fx_val, px_val, student_logqx)).cpu().item()
+
+        # Negative or non-finite variance estimates are broken: the student is only accepted against a valid teacher
+        teacher_valid = isfinite(teacher_variance) and teacher_variance >= 0.
+        student_valid = isfinite(student_variance) and student_variance >= 0.
+        accepted = teacher_valid and student_valid and student_variance <= (1. + tolerance) * teacher_variance
+        if not teacher_valid:
+            self.logger.warning(f"Invalid teacher variance estimate {teacher_variance:.3e}, rejecting the student")
+        report = {
+            "accepted": accepted,
+            "teacher_variance": teacher_variance,
+            "student_variance": student_variance,
+            "teacher_parameters": sum(p.numel() for p in self.flow.parameters()),
+            "student_parameters": sum(p.numel() for p in student.parameters()),
+            "losses": losses
+        }
+
+        if accepted:
+            self.logger.info(f"Using the distilled flow ({report['student_parameters']} parameters instead of "
+                             f"{report['teacher_parameters']}): variance {student_variance:.3e} "
+                             f"vs {teacher_variance:.3e}")
+            self.flow = student
+            self.clear_inference_flow()
+            self.bump_model_version()
+            old_optim = self.config["optim"]
+            if old_optim is not None:
+                self.config["optim"] = type(old_optim)(student.parameters(), **old_optim.defaults)
+            self.config["scheduler"] = None
+            self.checkpoint_data = None
+            self.best_validation_state = None
+        else:
+            self.logger.info(f"Rejecting the distilled flow: variance {student_variance:.3e} "
+                             f"vs {teacher_variance:.3e}")
+
+        return report
@@ -59,6 +59,19 @@ def weighted_variance_loss(fx, px, logqx):
     return torch.mean(fx ** 2 / (px * torch.exp(logqx)))
 
 
+def importance_sampling_variance(fx, px, logqx):
+    """Estimated variance of the importance sampling estimator of the integral of f when sampling from q,
+    computed from points sampled from p.
+
+    This is the proxy variance loss minus the squared integral estimate:
+
+    Var(f,q) = E(f(x)^2/(q(x) p(x)), x~p(x)) - E(f(x)/p(x), x~p(x))^2
+
+    Unlike the proxy loss, this can be compared between different batches and to other sampling distributions.
+    """
+    return weighted_variance_loss(fx, px, logqx) - torch.mean(fx / px) ** 2
+
+
 class BasicVarTrainer(BasicTrainer):
     """Basic trainer based on the variance loss"""
     def __init__(self, flow, latent_prior):
@@ -1,11 +1,16 @@
 import logging
 import torch
-from copy import deepcopy
 from collections import OrderedDict
+from copy import deepcopy
 from math import isfinite, ceil
 from better_abc import ABC, abstractmethod, abstract_attribute
+from .minibatching import MinibatchIterator
+from .replay_buffer import ReplayBuffer
 from .training_record import TrainingRecord
+from zunis.training.schedulers import is_metric_scheduler
+from zunis.models.flows.coupling_cells.general_coupling import quantize_conditioners
 from zunis.utils.logger import set_verbosity as set_verbosity_fct
+from zunis.utils.dtypes import resolve_dtype
 from zunis.utils.exceptions import AvertedCUDARuntimeError, NoCheckpoint, TrainingInterruption
 
 
@@ -74,16 +79,83 @@ class BasicTrainer(ABC):
         self.flow = flow
         self.latent_prior = latent_prior
         self.loss = abstract_attribute()
+        # dtype in which the loss is computed. If None, the loss inputs are used as they are
+        self.loss_dtype = None
+        # Optional inference-only copy of the flow used for sampling and density evaluation
+        self.inference_flow = None
+        # Version of the model parameters, bumped whenever they change. Cached densities are tagged with it
+        self.model_version = 0
+        self.density_cache_size = 0
+        self.density_cache = OrderedDict()
+        # Maximum number of points pushed through the flow at once when sampling. None samples in a single pass
+        self.sampling_chunk_size = None
         self.logger = logging.getLogger(__name__).getChild(self.__class__.__name__ + ":" + hex(id(self)))
         self.set_verbosity(verbosity)
 
+    @property
+    def device(self):
+        """Device on which the flow parameters live"""
+        try:
+            return next(self.flow.parameters()).device
+        except StopIteration:
+            return None
+
+    @property
+    def sampling_flow(self):
+        """Flow used for sampling and density evaluation: the inference flow if there is one, the trained flow
+        otherwise"""
+        if self.inference_flow is not None:
+            return self.inference_flow
+        return self.flow
+
+    def quantize_for_inference(self):
+        """Use a copy of the flow with dynamically quantized int8 conditioners for sampling and density evaluation
+
+        The sampled points and their PDF are both computed with the quantized copy, so importance sampling
+        estimators stay unbiased. The copy is discarded as soon as the flow is trained again. CPU only.
+        """
+        self.inference_flow = quantize_conditioners(self.flow)
+        self.bump_model_version()
+
+    def clear_inference_flow(self):
+        """Sample from the trained flow again"""
+        if self.inference_flow is not None:
+            self.inference_flow = None
+            self.bump_model_version()
+
+    def bump_model_version(self):
+        """Signal that the model parameters changed, which invalidates cached densities"""
+        self.model_version += 1
+        self.density_cache.clear()
+
+    @staticmethod
+    def density_cache_key(x):
+        """Identify a tensor and the version of its content
+
+        The version counter of a tensor is incremented by every in-place operation on it or on its views
+        """
+        return x.data_ptr(), tuple(x.shape), x.stride(), x.dtype, x.device, x._version
+
     def sample_forward(self, n_points):
-        if self.flow.inverse:
-            self.flow.invert()
+        """Sample points and their log-inverse PDF from the flow
+
+        If `sampling_chunk_size` is set, the points are sampled in chunks of at most that size to bound the memory
+        used by the flow.
+        """
+        flow = self.sampling_flow
+        if flow.inverse:
+            flow.invert()
+
+        chunk_size = self.sampling_chunk_size
+        if chunk_size is None or n_points <= chunk_size:
+            xj = self.latent_prior(n_points)
+            with torch.no_grad():
+                xj = flow(xj)
+            return xj.detach()
 
-        xj = self.latent_prior(n_points)
         with torch.no_grad():
-            xj = self.flow(xj)
+            xj = torch.cat([flow(self.latent_prior(min(chunk_size, n_points - start)))
+                            for start in range(0, n_points, chunk_size)])
         return xj.detach()
 
     def process_loss(self, loss):
@@ -98,20 +170,115 @@ class BasicTrainer(ABC):
     def handle_cuda_error(self, error):
         raise
 
-    def compute_loss_no_grad(self, x, px, fx):
-        if not self.flow.inverse:
-            self.flow.invert()
+    def process_epoch(self):
+        """Called after each epoch of training on a batch. Returns True if training on this batch should stop"""
+        return False
 
-        with torch.no_grad():
-            xj = torch.cat(x, torch.ones(x.shape[0], 1), dim=1)
+    def finalize_epochs(self):
+        """Called after the last epoch of training on a batch"""
+        pass
 
-            zj = self.flow(xj)
+    def cast_loss_inputs(self, fx, px, logqx):
+        """Cast the inputs of the loss function to the loss dtype if it is set
+
+        Returns
+        -------
+            tuple of torch.Tensor
+                (fx, px, logqx)
+        """
+        if self.loss_dtype is None:
+            return fx, px, logqx
+        return fx.to(self.loss_dtype), px.to(self.loss_dtype), logqx.to(self.loss_dtype)
+
+    def compute_logqx_no_grad(self, x):
+        """Compute the log-PDF of the flow model on a batch of points in target space without tracking gradients
+
+        If `density_cache_size` is positive, the results for the last `density_cache_size` batches are cached
+        until the model parameters change, so that evaluating the same batch several times between
+        training steps (loss reporting, validation, diagnostics) only runs the flow once.
+
+        Parameters
+        ----------
+            x: torch.Tensor
+                batch of points in target space
+
+        Returns
+        -------
+            torch.Tensor
+                log q(x)
+        """
+        if self.density_cache_size > 0:
+            key = self.density_cache_key(x)
+            try:
+                # The cached batch is kept alive so that its memory cannot be reused by another tensor
+                _, logqx = self.density_cache[key]
+                self.density_cache.move_to_end(key)
+                return logqx
+            except KeyError:
+                pass
+
+        flow = self.sampling_flow
+        if not flow.inverse:
+            flow.invert()
+
+        with torch.no_grad():
+            xj = torch.cat([x, torch.zeros(x.shape[0], 1, dtype=x.dtype, device=x.device)], dim=1)
+            zj = flow(xj)
             z = zj[:, :-1]
             logqx = zj[:, -1] + self.latent_prior.log_prob(z)
-            loss = self.loss(fx, px, logqx)
+
+        if self.density_cache_size > 0:
+            self.density_cache[key] = (x, logqx)
+            while len(self.density_cache) > self.density_cache_size:
+                self.density_cache.popitem(last=False)
+
+        return logqx
+
+    def compute_loss_no_grad(self, x, px, fx):
+        logqx = self.compute_logqx_no_grad(x)
+        with torch.no_grad():
+            loss = self.loss(*self.cast_loss_inputs(fx, px, logqx))
 
         return loss.cpu().item()
 
+    def compute_loss_gradients(self, x, px, fx):
+        """Compute the loss and its gradients on a batch without updating the model
+
+        This has the computational cost of a training step and is used to probe the memory usage of training.
+        The gradients are cleared afterwards.
+
+        Returns
+        -------
+            float
+                loss value
+        """
+        loss = self.compute_flow_input_loss(self.flow_input(x), px, fx)
+        loss.backward()
+        self.flow.zero_grad()
+        return loss.detach().cpu().item()
+
+    @staticmethod
+    def flow_input(x):
+        """Format a batch of points in target space as a flow input by appending a column of zeros
+        (the initial log-inverse-PDF)"""
+        return torch.cat([x, torch.zeros(x.shape[0], 1, dtype=x.dtype, device=x.device)], dim=1)
+
+    def compute_flow_input_loss(self, xj, px, fx):
+        """Compute the training loss on a minibatch already formatted as a flow input, keeping the graph for the
+        backward pass
+
+        Returns
+        -------
+            torch.Tensor
+        """
+        if not self.flow.inverse:
+            self.flow.invert()
+
+        zj = self.flow(xj)
+        z = zj[:, :-1]
+        logqx = zj[:, -1] + self.latent_prior.log_prob(z)
+        return self.loss(*self.cast_loss_inputs(fx, px, logqx))
+
     def train_step_on_target_minibatch(self, x, px, fx, optim):
         """Perform one training set on a minibatch
 
@@ -126,23 +293,33 @@ class BasicTrainer(ABC):
             optim:
                 pytorch optimizer object
         """
-        if not self.flow.inverse:
-            self.flow.invert()
+        return self.train_step_on_flow_input(self.flow_input(x), px, fx, optim)
 
-        xj = torch.cat([x, torch.zeros(x.shape[0], 1).to(x.device)], dim=1)
+    def train_step_on_flow_input(self, xj, px, fx, optim):
+        """Perform one training step on a minibatch already formatted as a flow input
 
-        zj = self.flow(xj)
-        z = zj[:, :-1]
-        logqx = zj[:, -1] + self.latent_prior.log_prob(z)
+        Parameters
+        ----------
+            xj:
+                batch of points in target space sampled from some PDF p(x) with an extra last column of zeros
+                (the initial log-inverse-PDF)
+            px:
+                values of p(x) for the batch
+            fx:
+                values of the target (un-normalized) PDF
+            optim:
+                pytorch optimizer object
+        """
         optim.zero_grad()
-        loss = self.loss(fx, px, logqx)
+        loss = self.compute_flow_input_loss(xj, px, fx)
         loss.backward()
         optim.step()
+        self.bump_model_version()
         loss = loss.detach().cpu().item()
 
         return loss
 
-    def train_step_on_target_batch(self, x, px, fx, optim, minibatch_size=None):
+    def train_step_on_target_batch(self, x, px, fx, optim, minibatch_size=None, minibatches=None):
         """Training function on a fixed batch: iterate once over the whole batch
 
         Parameters
@@ -157,37 +334,25 @@ class BasicTrainer(ABC):
                 pytorch optimizer object
             minibatch_size: None or int
                 Optional. Size of each minibatch for gradient steps.
+            minibatches: None or :py:class:`MinibatchIterator <zunis.training.weighted_dataset.minibatching.MinibatchIterator>`
+                Optional. Minibatch iterator over (x, px, fx), reused across epochs to avoid re-allocating
+                minibatch buffers. If provided, `minibatch_size` is ignored.
 
         Notes
         -----
             if minibatch_size is unset (or None), then it is set to the size of the full batch and a single
             gradient step is taken
         """
-        n_points = x.shape[0]
-        if minibatch_size is None:
-            minibatch_size = n_points
-        elif isinstance(minibatch_size, float) and 0 < minibatch_size <= 1.:
-            minibatch_size = int(minibatch_size * x.shape[0])
-        else:
-            assert isinstance(minibatch_size,
-                              int) and minibatch_size > 0, f"minibatch size must be None, a float in ]0,1] or a " \
-                                                           f"positive int. Got {type(minibatch_size)}"
-
-        begin = 0
-        while begin < n_points:
-            end = min(begin + minibatch_size, n_points)
-            loss = self.train_step_on_target_minibatch(
-                x[begin:end],
-                px[begin:end],
-                fx[begin:end],
-                optim,
-            )
+        if minibatches is None:
+            minibatches = MinibatchIterator(x, px, fx, minibatch_size, device=self.device)
+
+        for xj_batch, px_batch, fx_batch in minibatches:
+            loss = self.train_step_on_flow_input(xj_batch, px_batch, fx_batch, optim)
             early_stop = self.process_loss(loss)
             if early_stop:
                 raise TrainingInterruption("Early stopping condition was raised")
-            begin = end
 
-    def train_on_target_batch(self, x, px, fx, optim, n_epochs, minibatch_size=None):
+    def train_on_target_batch(self, x, px, fx, optim, n_epochs, minibatch_size=None, shuffle=True, prefetch=False):
         """Training function on a fixed batch: train for a fixed number of epochs on each batch
 
         Parameters
@@ -204,6 +369,10 @@ class BasicTrainer(ABC):
                 number of iterations over the full batch
             minibatch_size:
                 Optional. Size of each minibatch for gradient steps
+            shuffle:
+                Optional. Whether to iterate over minibatches in a new random order at each epoch
+            prefetch:
+                Optional. Whether to gather the next minibatch before the current one is used (double-buffering)
 
         Notes
         -----
@@ -211,16 +380,24 @@ class BasicTrainer(ABC):
             gradient step is taken
         """
         self.logger.info(f"Training on batch: {x.shape[0]} points")
+        # The inference copy of the flow would not follow training
+        self.clear_inference_flow()
+        minibatches = MinibatchIterator(x, px, fx, minibatch_size, shuffle=shuffle, prefetch=prefetch,
+                                        device=self.device)
         for epoch in range(n_epochs):
             self.logger.info(f"Epoch {epoch + 1}/{n_epochs}")
             try:
-                self.train_step_on_target_batch(x, px, fx, optim, minibatch_size)
+                self.train_step_on_target_batch(x, px, fx, optim, minibatches=minibatches)
             except InvalidLossError as e:
                 self.logger.exception("Invalid loss detected - handling started")
                 self.handle_invalid_loss(e)
             except AvertedCUDARuntimeError as e:
                 self.logger.exception("CUDA error averted - handling started")
                 self.handle_cuda_error(e)
+            if self.process_epoch():
+                self.logger.info(f"Stopping training on this batch after {epoch + 1} epochs")
+                break
+        self.finalize_epochs()
 
     @staticmethod
     def generate_target_batch_from_posterior(n_points, f, target_posterior):
@@ -292,20 +469,87 @@ class BasicTrainer(ABC):
 
 class BasicStatefulTrainer(BasicTrainer, GenericTrainerAPI):
     def __init__(self, flow, latent_prior, checkpoint=True, checkpoint_on_cuda=True, checkpoint_path=None, max_reloads=None,
-                 **kwargs):
+                 replay_buffer_size=None, replay_eviction="age", replay_max_age=None, loss_dtype=None,
+                 density_cache_size=0, sampling_chunk_size=None, checkpoint_optimizer=False, **kwargs):
+        """
+
+        Parameters
+        ----------
+        flow: :py:class:`GeneralFlow <zunis.models.flows.general_flow.GeneralFlow>`
+            flow model to train
+        latent_prior: :py:class:`FactorizedFlowSampler <zunis.models.flows.sampling.FactorizedFlowSampler>`
+            distribution of the latent space
+        checkpoint: bool
+            whether to save checkpoints of the best model during training
+        checkpoint_on_cuda: bool
+            whether checkpoints kept in memory stay on the model device
+        checkpoint_path: None or str
+            if set, checkpoints are also saved to this path
+        checkpoint_optimizer: bool
+            whether checkpoints also hold the state of the optimizer and of the scheduler. This roughly triples the
+            cost of each checkpoint with Adam, which is paid at every improving training step
+        max_reloads: None or int
+            maximum number of checkpoint reloads to recover from training errors
+        replay_buffer_size: None or int
+            if set, batches passed to :py:meth:`train_on_batch` are kept in a
+            :py:class:`ReplayBuffer <zunis.training.weighted_dataset.replay_buffer.ReplayBuffer>` holding at most
+            this many points and training is performed on the whole buffer
+        replay_eviction: {"age", "weight"}
+            eviction policy of the replay buffer
+        replay_max_age: None or int
+            maximum number of batches a batch stays in the replay buffer, at least 1. 1 keeps only the newest batch
+        loss_dtype: None or str or torch.dtype
+            dtype in which the loss is computed. Using float64 keeps the importance weights f(x)/q(x) accurate when
+            the flow runs in lower precision. If None, the loss is computed in the dtype of its inputs
+        density_cache_size: int
+            number of batches for which densities computed without gradients are cached between parameter updates.
+            0 disables the cache
+        sampling_chunk_size: None or int
+            maximum number of points sampled from the flow at once. None samples in a single pass
+        kwargs:
+            configuration options (see :py:meth:`set_config`)
+
+        Notes
+        -----
+        Early stopping is enabled by setting the `validation_fraction` configuration option: this fraction of each
+        batch is held out of training and the validation metric is evaluated on it after each epoch. The metric is
+        the loss unless `validation_metric` is set to a function with the same signature as the loss.
+        Training on the batch stops after `patience` epochs without improvement (never if `patience` is None)
+        and the model state with the best validation metric is restored at the end of training on the batch.
+
+        The `scheduler` configuration option is a learning rate scheduler instantiated on the `optim` optimizer.
+        It is stepped after each epoch and is not reset between batches. Schedulers that need a metric
+        (ReduceLROnPlateau) are given the validation metric if early stopping is enabled and the running
+        average of the loss otherwise.
+
+        With `checkpoint_optimizer`, checkpoints hold the state of the optimizer and of the scheduler together with
+        the flow weights so that recovering from a checkpoint does not restart the optimization with cold optimizer
+        moments. By default, checkpoints only hold the flow weights.
+        """
         super(BasicStatefulTrainer, self).__init__(flow, latent_prior)
+        if loss_dtype is not None:
+            self.loss_dtype = resolve_dtype(loss_dtype)
+        self.density_cache_size = density_cache_size
+        self.sampling_chunk_size = sampling_chunk_size
 
         # Setting up the saved configuration accessed through the GenericTrainerAPI
         # Note that the GenericTrainerAPI, operates at the level of a single batch
         # As a result, only relevant keys are part of the config
 
         # The keys are stored separately so as to be immutable
-        self.config_keys = ("n_epochs", "minibatch_size", "optim")
+        self.config_keys = ("n_epochs", "minibatch_size", "optim", "scheduler", "shuffle", "prefetch",
+                            "validation_fraction", "validation_metric", "patience")
 
         self.config = {
             "n_epochs": None,
             "minibatch_size": None,
-            "optim": None
+            "optim": None,
+            "scheduler": None,
+            "shuffle": True,
+            "prefetch": False,
+            "validation_fraction": None,
+            "validation_metric": None,
+            "patience": None
         }
 
         for key in kwargs:
@@ -317,6 +561,7 @@ class BasicStatefulTrainer(BasicTrainer, GenericTrainerAPI):
         self.checkpoint_on_cuda = checkpoint_on_cuda
         self.checkpoint_data = None
         self.checkpoint_path = checkpoint_path
+        self.checkpoint_optimizer = checkpoint_optimizer
         self.n_reloads = 0
         if max_reloads is None:
             self.max_reloads = None if not checkpoint else 1
@@ -328,22 +573,66 @@ class BasicStatefulTrainer(BasicTrainer, GenericTrainerAPI):
         else:
             self.record = TrainingRecord(checkpoint=checkpoint_path)
 
+        # Early stopping logic
+        self.validation_batch = None
+        self.best_validation_state = None
+        self.epochs_without_improvement = 0
+
+        if replay_buffer_size is None:
+            self.replay_buffer = None
+        else:
+            self.replay_buffer = ReplayBuffer(replay_buffer_size, eviction=replay_eviction, max_age=replay_max_age)
+
     def set_checkpoint(self):
         """Save the current model state as a checkpoint"""
         if not self.checkpoint:
             self.logger.error("This trainer cannot save checkpoints")
             raise AssertionError("This trainer cannot save checkpoints")
 
-        state_dict = deepcopy(self.flow.state_dict())
+        state = {"flow": self.flow.state_dict()}
+        if self.checkpoint_optimizer:
+            if self.config["optim"] is not None:
+                state["optim"] = self.config["optim"].state_dict()
+            if self.config["scheduler"] is not None:
+                state["scheduler"] = self.config["scheduler"].state_dict()
+
+        state = deepcopy(state)
         if self.checkpoint_on_cuda:
-            self.checkpoint_data = state_dict
+            self.checkpoint_data = state
         else:
-            self.checkpoint_data = OrderedDict(
-                [(key, value.cpu()) for key, value in state_dict.items()]
-            )
+            self.checkpoint_data = self.state_to_cpu(state)
         if self.checkpoint_path is not None:
             torch.save(self.checkpoint_data, self.checkpoint_path)
 
+    @classmethod
+    def state_to_cpu(cls, state):
+        """Recursively copy the tensors of a nested state dictionary to the CPU"""
+        if isinstance(state, torch.Tensor):
+            return state.cpu()
+        if isinstance(state, dict):
+            return type(state)((key, cls.state_to_cpu(value)) for key, value in state.items())
+        if isinstance(state, (list, tuple)):
+            return type(state)(cls.state_to_cpu(value) for value in state)
+        return state
+
+    def load_checkpoint_data(self, state):
+        """Load a checkpoint into the flow, the optimizer and the scheduler
+
+        Checkpoints that only contain the flow state dictionary are also accepted
+        """
+        self.clear_inference_flow()
+        self.bump_model_version()
+        if "flow" not in state:
+            self.flow.load_state_dict(state)
+            return
+
+        self.flow.load_state_dict(state["flow"])
+        # Optimizer.load_state_dict casts the state to the device of the parameters
+        if "optim" in state and self.config["optim"] is not None:
+            self.config["optim"].load_state_dict(deepcopy(state["optim"]))
+        if "scheduler" in state and self.config["scheduler"] is not None:
+            self.config["scheduler"].load_state_dict(state["scheduler"])
+
     def restore_checkpoint(self, path=None):
         """Restore from a checkpoint if available"""
         # This function is called when something fails
@@ -355,7 +644,7 @@ class BasicStatefulTrainer(BasicTrainer, GenericTrainerAPI):
         # Use a NoCheckpoint exception to allow whatever error triggered this function to be the main failure cause
         if path is not None:
             try:
-                self.flow.load_state_dict(torch.load(path))
+                self.load_checkpoint_data(torch.load(path))
                 return
             except Exception:
                 self.logger.exception(f"Error when loading state dict from file")
@@ -366,7 +655,7 @@ class BasicStatefulTrainer(BasicTrainer, GenericTrainerAPI):
         if self.checkpoint and self.checkpoint_data is not None:
             self.logger.warning("Reloading the latest checkpoint from memory")
             try:
-                self.flow.load_state_dict(self.checkpoint_data)
+                self.load_checkpoint_data(self.checkpoint_data)
                 return
             # In case of error, log the stack trace and try loading from disk if possible
             except Exception:
@@ -374,7 +663,7 @@ class BasicStatefulTrainer(BasicTrainer, GenericTrainerAPI):
             if self.checkpoint_path is not None:
                 self.logger.warning("Trying to load latest checkpoint from disk")
                 try:
-                    self.flow.load_state_dict(torch.load(self.checkpoint_path))
+                    self.load_checkpoint_data(torch.load(self.checkpoint_path))
                     return
                 # Again, if we fail, log the stack trace and raise a NoCheckpoint to allow upstream triage
                 except Exception:
@@ -442,14 +731,92 @@ class BasicStatefulTrainer(BasicTrainer, GenericTrainerAPI):
             self.set_checkpoint()
         return output
 
-    def train_step_on_target_minibatch(self, x, px, fx, optim):
-        loss = super(BasicStatefulTrainer, self).train_step_on_target_minibatch(x, px, fx, optim)
+    def compute_validation_metric(self):
+        """Evaluate the validation metric on the held-out part of the current batch"""
+        x, px, fx = self.validation_batch
+        metric = self.config["validation_metric"]
+        if metric is None:
+            metric = self.loss
+        logqx = self.compute_logqx_no_grad(x)
+        with torch.no_grad():
+            return metric(*self.cast_loss_inputs(fx, px, logqx)).cpu().item()
+
+    def step_scheduler(self, validation=None):
+        """Step the learning rate scheduler at the end of an epoch if there is one"""
+        scheduler = self.config["scheduler"]
+        if scheduler is None:
+            return
+
+        if not is_metric_scheduler(scheduler):
+            scheduler.step()
+            return
+
+        metric = validation if validation is not None else self.record["loss"]
+        if metric is not None and isfinite(metric):
+            scheduler.step(metric)
+
+    def process_epoch(self):
+        """Track the validation metric, step the learning rate scheduler and check the early stopping condition"""
+        if self.validation_batch is None:
+            self.step_scheduler()
+            return False
+
+        validation = self.compute_validation_metric()
+        self.record.log_metric(validation, "validation")
+        self.logger.debug(f"Validation: {validation:.3e}")
+        self.step_scheduler(validation)
+
+        if not isfinite(validation):
+            self.logger.warning(f"Invalid validation metric value {validation}")
+            self.epochs_without_improvement += 1
+        elif self.record["best_validation"] is None or validation < self.record["best_validation"]:
+            self.record["best_validation"] = validation
+            self.record["best_validation_epoch"] = self.record.epoch
+            self.best_validation_state = deepcopy(self.flow.state_dict())
+            self.epochs_without_improvement = 0
+            return False
+        else:
+            self.epochs_without_improvement += 1
+
+        patience = self.config["patience"]
+        return patience is not None and self.epochs_without_improvement >= patience
+
+    def finalize_epochs(self):
+        """Restore the model state with the best validation metric"""
+        if self.best_validation_state is not None and self.record["best_validation_epoch"] < self.record.epoch:
+            self.logger.info(f"Restoring the model state from epoch {self.record['best_validation_epoch']} "
+                             f"with validation metric {self.record['best_validation']:.3e}")
+            self.flow.load_state_dict(self.best_validation_state)
+            self.bump_model_version()
+        self.best_validation_state = None
+
+    def split_validation_batch(self, x, px, fx):
+        """Hold out a random fraction of a batch for validation
+
+        Returns
+        -------
+            tuple of torch.Tensor
+                (x, px, fx) the part of the batch used for training
+        """
+        validation_fraction = self.config["validation_fraction"]
+        n_validation = int(validation_fraction * x.shape[0])
+        assert 0 < n_validation < x.shape[0], "The validation fraction must leave points for training and validation"
+
+        indices = torch.randperm(x.shape[0], device=x.device)
+        validation_indices = indices[:n_validation]
+        training_indices = indices[n_validation:]
+        self.validation_batch = (x[validation_indices], px[validation_indices], fx[validation_indices])
+        return x[training_indices], px[training_indices], fx[training_indices]
+
+    def train_step_on_flow_input(self, xj, px, fx, optim):
+        loss = super(BasicStatefulTrainer, self).train_step_on_flow_input(xj, px, fx, optim)
         self.record.next_step()
         return loss
 
-    def train_step_on_target_batch(self, x, px, fx, optim, minibatch_size=None):
+    def train_step_on_target_batch(self, x, px, fx, optim, minibatch_size=None, minibatches=None):
         self.record.new_epoch()
-        super(BasicStatefulTrainer, self).train_step_on_target_batch(x, px, fx, optim, minibatch_size)
+        super(BasicStatefulTrainer, self).train_step_on_target_batch(x, px, fx, optim, minibatch_size,
+                                                                     minibatches=minibatches)
 
     def train_on_target_batches_from_posterior(self,
                                                *,
@@ -493,15 +860,34 @@ class BasicStatefulTrainer(BasicTrainer, GenericTrainerAPI):
         return self.config
 
     def train_on_batch(self, x, px, fx, **kwargs):
-        """Train on a batch of points using the saved configuration"""
+        """Train on a batch of points using the saved configuration
+
+        If the trainer has a replay buffer, the batch is added to it and training is performed on all the points
+        stored in the buffer.
+        """
         self.set_config(**kwargs)
 
+        self.validation_batch = None
+        self.best_validation_state = None
+        self.epochs_without_improvement = 0
+        if self.config["validation_fraction"]:
+            x, px, fx = self.split_validation_batch(x, px, fx)
+
+        if self.replay_buffer is not None:
+            self.replay_buffer.add(x, px, fx)
+            x, px, fx = self.replay_buffer.as_batch()
+            self.logger.info(f"Training on {len(self.replay_buffer)} batches from the replay buffer")
+
         try:
             checkpoint_path = kwargs["checkpoint_path"]
         except KeyError:
             checkpoint_path = self.checkpoint_path
 
-        self.record = TrainingRecord(checkpoint=checkpoint_path)
+        if self.validation_batch is None:
+            self.record = TrainingRecord(checkpoint=checkpoint_path)
+        else:
+            self.record = TrainingRecord(checkpoint=checkpoint_path, metrics=["validation"],
+                                         best_validation=None, best_validation_epoch=None)
 
         optim = self.config["optim"]
         if optim is None:
@@ -517,5 +903,6 @@ class BasicStatefulTrainer(BasicTrainer, GenericTrainerAPI):
             raise error
 
         minibatch_size = self.config["minibatch_size"]
-        self.train_on_target_batch(x, px, fx, optim=optim, n_epochs=n_epochs, minibatch_size=minibatch_size)
+        self.train_on_target_batch(x, px, fx, optim=optim, n_epochs=n_epochs, minibatch_size=minibatch_size,
+                                   shuffle=self.config["shuffle"], prefetch=self.config["prefetch"])
         return self.record
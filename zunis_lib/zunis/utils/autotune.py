@@ -0,0 +1,212 @@
+"""Automatic tuning of the batch sizes used to sample from flows and to train them
+
+Increasing batch sizes are probed while measuring the throughput and the peak memory usage. The selected batch
+size is the smallest one whose throughput is close to the best throughput among the batch sizes that fit under
+the memory cap. Probe results are cached in a JSON file, keyed by the flow architecture and the hardware, so that
+later runs with the same setup skip the probing. The memory cap is not part of the key: the batch size is selected
+from the cached probes under the memory cap of each run.
+"""
+import json
+import logging
+import os
+from hashlib import sha1
+
+import torch
+
+from zunis.utils.memory import MemoryTracker
+from zunis.utils.timing import timed_call
+
+logger = logging.getLogger(__name__)
+
+default_cache_path = os.path.join(os.path.expanduser("~"), ".cache", "zunis", "batch_sizes.json")
+"""Default location of the batch size cache"""
+
+default_batch_sizes = tuple(2 ** k for k in range(10, 21))
+"""Default probed batch sizes"""
+
+
+def architecture_summary(flow):
+    """Describe a flow architecture
+
+    The description holds the flow class, its dimension, its number of parameters, their dtype and a hash of the
+    representation of the module tree, which lists the layers and their shapes.
+
+    Returns
+    -------
+        dict
+    """
+    parameters = list(flow.parameters())
+    return {
+        "flow": type(flow).__name__,
+        "d": getattr(flow, "d", None),
+        "n_parameters": sum(p.numel() for p in parameters),
+        "dtype": str(parameters[0].dtype) if len(parameters) > 0 else None,
+        "modules": sha1(repr(flow).encode()).hexdigest(),
+    }
+
+
+def cache_key(*summaries):
+    """Hash dictionaries describing a setup into a cache key
+
+    Returns
+    -------
+        str
+    """
+    return sha1(json.dumps(summaries, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class BatchSizeCache:
+    """Tuned batch sizes stored in a JSON file"""
+
+    def __init__(self, path=default_cache_path):
+        """
+
+        Parameters
+        ----------
+        path: str
+        """
+        self.path = path
+
+    def load(self):
+        """Read all cache entries
+
+        Returns
+        -------
+            dict
+                empty if the cache file does not exist or cannot be read
+        """
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return dict()
+
+    def get(self, key):
+        """Get a cache entry
+
+        Returns
+        -------
+            dict or None
+        """
+        return self.load().get(key, None)
+
+    def set(self, key, value):
+        """Set a cache entry and write the cache file"""
+        entries = self.load()
+        entries[key] = value
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never see a partial file
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump(entries, cache_file, indent=2)
+        os.replace(temporary_path, self.path)
+
+
+def is_out_of_memory_error(error):
+    """Check whether a pytorch runtime error is an allocation failure"""
+    message = str(error)
+    return "out of memory" in message or "can't allocate memory" in message
+
+
+def probe_batch_sizes(function, batch_sizes=default_batch_sizes, device=torch.device("cpu"), memory_cap=None,
+                      n_repeat=2):
+    """Measure the throughput and the peak memory usage of a function of the batch size for increasing batch sizes
+
+    Probing stops at the first batch size that exceeds the memory cap or fails to allocate memory.
+
+    Parameters
+    ----------
+    function: callable
+        function of the batch size
+    batch_sizes: iterable of int
+    device: torch.device
+    memory_cap: int, None
+        in bytes
+    n_repeat: int
+        number of timed calls per batch size, after a warm-up call. The fastest call is used
+
+    Returns
+    -------
+        list of dict
+            with keys "batch_size", "points_per_second" and "peak_memory" (in bytes)
+    """
+    tracker = MemoryTracker(device, python_tracing=False)
+    results = []
+    for batch_size in sorted(batch_sizes):
+        try:
+            function(batch_size)
+            durations = []
+            with tracker:
+                for _ in range(n_repeat):
+                    _, duration = timed_call(function, batch_size)
+                    durations.append(duration)
+        except RuntimeError as e:
+            if not is_out_of_memory_error(e):
+                raise
+            logger.info(f"Batch size {batch_size} does not fit in memory")
+            if tracker.device.type == "cuda":
+                torch.cuda.empty_cache()
+            break
+
+        result = {
+            "batch_size": batch_size,
+            "points_per_second": batch_size / min(durations) if min(durations) > 0. else float("inf"),
+            "peak_memory": tracker.peak_increase,
+        }
+        logger.debug(f"Probed batch size: {result}")
+        results.append(result)
+        if memory_cap is not None and result["peak_memory"] > memory_cap:
+            break
+    return results
+
+
+def covers_memory_cap(results, batch_sizes, memory_cap=None):
+    """Check whether probe results are enough to select a batch size under a memory cap
+
+    This is the case if all batch sizes were probed or if the probing stopped after exceeding the memory cap,
+    since larger batches need more memory.
+
+    Parameters
+    ----------
+    results: list of dict
+        see :py:func:`probe_batch_sizes`
+    batch_sizes: iterable of int
+        probed batch sizes
+    memory_cap: int, None
+        in bytes
+
+    Returns
+    -------
+        bool
+    """
+    if len(results) == len(set(batch_sizes)):
+        return True
+    return len(results) > 0 and memory_cap is not None and results[-1]["peak_memory"] > memory_cap
+
+
+def select_batch_size(results, memory_cap=None, tolerance=0.05):
+    """Select the smallest batch size whose throughput is within a tolerance of the best throughput under the
+    memory cap
+
+    Parameters
+    ----------
+    results: list of dict
+        see :py:func:`probe_batch_sizes`
+    memory_cap: int, None
+        in bytes
+    tolerance: float
+        relative throughput loss accepted in exchange for a smaller batch
+
+    Returns
+    -------
+        int or None
+            None if no batch size fits under the memory cap
+    """
+    candidates = [result for result in results if memory_cap is None or result["peak_memory"] <= memory_cap]
+    if len(candidates) == 0:
+        return None
+    best = max(result["points_per_second"] for result in candidates)
+    return min(result["batch_size"] for result in candidates
+               if result["points_per_second"] >= (1. - tolerance) * best)
@@ -3,6 +3,7 @@ from functools import partial
 
 import torch
 from zunis.utils.config import Configuration
+from zunis.training.schedulers import linear_warmup
 
 from .defaults import local_path
 
@@ -38,6 +39,55 @@ def get_optim_from_config(config=None):
     return partial(optim, **config["optim_config"].as_dict())
 
 
+scheduler_aliases = {
+    "cosine": torch.optim.lr_scheduler.CosineAnnealingLR,
+    "plateau": torch.optim.lr_scheduler.ReduceLROnPlateau,
+    "warmup": linear_warmup
+}
+"""Short names for learning rate schedulers that can be used in configuration files"""
+
+
+def get_scheduler_from_config(config=None):
+    """Get a learning rate scheduler constructor from a config dictionary
+
+    Parameters
+    ----------
+    config: dictionary-like, optional
+        dictionary-like object with the following structure:
+        {
+        "scheduler_cls": <alias in `scheduler_aliases` or scheduler class name within torch.optim.lr_scheduler>,
+        "scheduler_config": <dictionary defining the key-word argument parameters for instantiating that class>
+        }
+        If no argument is given or if `scheduler_cls` is None, no scheduler is used.
+
+    Returns
+    -------
+        None or :obj:`function`
+            a pre-filled scheduler constructor that only needs to be fed the optimizer
+
+    Notes
+    -----
+    As in :py:func:`get_optim_from_config`, the scheduler is not instantiated.
+    Schedulers are stepped once per epoch: epoch-based settings such as the `T_max` of "cosine" count epochs summed
+    over all the batches the trainer is trained on.
+    """
+    if config is None or config["scheduler_cls"] is None:
+        return None
+
+    try:
+        scheduler = scheduler_aliases[config["scheduler_cls"]]
+    except KeyError:
+        scheduler = getattr(torch.optim.lr_scheduler, config["scheduler_cls"])
+
+    try:
+        scheduler_config = config["scheduler_config"]
+    except KeyError:
+        scheduler_config = None
+    if scheduler_config is None:
+        return partial(scheduler)
+    return partial(scheduler, **dict(scheduler_config))
+
+
 def get_default_integrator_config():
     """Get a copy of the full default text-based integrator config
 
@@ -48,6 +98,7 @@ def get_default_integrator_config():
 
 def create_integrator_args(config=None):
     """Create the full hierarchy of arguments for an integrator, including an instantiated optimizer
+    and, if the trainer options have a `scheduler` entry, a learning rate scheduler constructor
 
     Parameters
     ----------
@@ -73,4 +124,7 @@ def create_integrator_args(config=None):
         args["trainer_options"]["optim"] = get_optim_from_config(optim_config)
     except KeyError:
         args["trainer_options"] = {"optim": get_optim_from_config(optim_config)}
+
+    if "scheduler" in args["trainer_options"]:
+        args["trainer_options"]["scheduler"] = get_scheduler_from_config(args["trainer_options"]["scheduler"])
     return args
\ No newline at end of file
@@ -0,0 +1,35 @@
+"""Floating point precision handling
+
+Precision can be specified as a `torch.dtype` or as the name of a pytorch dtype ("float32", "float64", "double",
+"bfloat16", ...) so that it can be set in configuration files.
+"""
+import torch
+
+
+def resolve_dtype(dtype, default=None):
+    """Convert a dtype specification into a `torch.dtype`
+
+    Parameters
+    ----------
+    dtype: None or str or torch.dtype
+        dtype specification
+    default: None or str or torch.dtype
+        value used if `dtype` is None. If both are None, the pytorch default dtype is used
+
+    Returns
+    -------
+        torch.dtype
+    """
+    if dtype is None:
+        if default is None:
+            return torch.get_default_dtype()
+        return resolve_dtype(default)
+
+    if isinstance(dtype, torch.dtype):
+        return dtype
+
+    assert isinstance(dtype, str), f"A dtype must be a torch.dtype or a string. Got {type(dtype)}"
+    resolved = getattr(torch, dtype, None)
+    if not isinstance(resolved, torch.dtype) or not resolved.is_floating_point:
+        raise ValueError(f"{dtype} is not the name of a pytorch floating point dtype")
+    return resolved
@@ -1,21 +1,30 @@
-"""Function wrappers to provide API-compatible functions"""
+"""Function wrappers to provide API-compatible functions
+
+All wrappers take an optional `dtype` argument setting the dtype of the returned function values. If it is None,
+numpy batch functions return tensors with the dtype of their numpy output and argument functions return tensors
+with the pytorch default dtype.
+"""
 
 import torch
+from zunis.utils.dtypes import resolve_dtype
 
 
-def wrap_numpy_hypercube_batch_function(f):
+def wrap_numpy_hypercube_batch_function(f, dtype=None):
     """Take a function that evaluates on numpy batches with values in the unit hypercube
     and return a function that evaluates on pytorch batches in the unit hypercube
     """
+    if dtype is not None:
+        dtype = resolve_dtype(dtype)
+
     def torchf(x):
         npx = x.detach().cpu().numpy()
         npfx = f(npx)
-        return torch.tensor(npfx, device=x.device)
+        return torch.as_tensor(npfx, dtype=dtype, device=x.device)
 
     return torchf
 
 
-def wrap_numpy_compact_batch_function(f, dimensions):
+def wrap_numpy_compact_batch_function(f, dimensions, dtype=None):
     """Take a function that evaluates on numpy batches with values in compact intervals provided
     as a list of shape (d,2) where each element is the pair (lower,upper) of interval boundaries.
     and return a function that evaluates on pytorch batches in the unit hypercube,
@@ -27,16 +36,18 @@ def wrap_numpy_compact_batch_function(f, dimensions):
     starts = tdim[:, 0]
     lengths = tdim[:, 1] - tdim[:, 0]
     jac = torch.prod(lengths).cpu().item()
+    if dtype is not None:
+        dtype = resolve_dtype(dtype)
 
     def torchf(x):
         npx = (x * lengths.to(x.device) + starts.to(x.device)).detach().cpu().numpy()
         npfx = f(npx)
-        return (torch.tensor(npfx) * jac).to(x.device)
+        return torch.as_tensor(npfx, dtype=dtype, device=x.device) * jac
 
     return torchf
 
 
-def wrap_compact_arguments_function(f, dimensions):
+def wrap_compact_arguments_function(f, dimensions, dtype=None):
     """Take a function that evaluates on a sequence of arguments with values in compact intervals provided
     as a list of shape (d,2) where each element is the pair (lower,upper) of interval boundaries and
     return a function that evaluates on pytorch batches in the unit hypercube,
@@ -50,29 +61,27 @@ def wrap_compact_arguments_function(f, dimensions):
     starts = tdim[:, 0]
     lengths = tdim[:, 1] - tdim[:, 0]
     jac = torch.prod(lengths).item()
+    dtype = resolve_dtype(dtype)
 
     def torchf(x):
         lxs = (x * lengths.to(x.device) + starts.to(x.device)).detach().cpu().tolist()
-        fxs = torch.zeros(x.shape[0], device=x.device)
-        for i, lx in enumerate(lxs):
-            fxs[i] = f(*lx)
+        fxs = torch.tensor([f(*lx) for lx in lxs], dtype=dtype, device=x.device)
         return fxs * jac
 
     return torchf
 
 
-def wrap_hypercube_arguments_function(f):
+def wrap_hypercube_arguments_function(f, dtype=None):
     """Take a function that evaluates on a sequence of arguments with values in the unit hypercube and
         return a function that evaluates on pytorch batches in the unit hypercube,
         weighted by the proper Jacobian factor to preserve integrals.
 
         Explicitly: f(x_1,x_2,...,x_N) where x_i are numbers in [0, 1] returns a single float.
         """
+    dtype = resolve_dtype(dtype)
+
     def torchf(x):
         lxs = x.detach().cpu().tolist()
-        fxs = torch.zeros(x.shape[0], device=x.device)
-        for i, lx in enumerate(lxs):
-            fxs[i] = f(*lx)
-        return fxs
+        return torch.tensor([f(*lx) for lx in lxs], dtype=dtype, device=x.device)
 
     return torchf
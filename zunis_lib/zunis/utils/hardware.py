@@ -0,0 +1,33 @@
+"""Description of the hardware and software on which computations run"""
+import os
+import platform
+
+import torch
+
+from zunis.utils.memory import total_memory
+
+
+def hardware_summary(device=torch.device("cpu")):
+    """Describe the hardware and software on which a device runs
+
+    Used to label benchmark measurements and to key the cache of tuned batch sizes.
+
+    Returns
+    -------
+        dict
+    """
+    device = torch.device(device) if device is not None else torch.device("cpu")
+    summary = {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "n_threads": torch.get_num_threads(),
+        "device": str(device),
+        "total_memory": total_memory(device),
+    }
+    if device.type == "cuda":
+        summary["device_name"] = torch.cuda.get_device_name(device)
+    return summary
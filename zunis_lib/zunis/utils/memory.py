@@ -0,0 +1,264 @@
+"""Memory usage tracking and batch size limits
+
+Three sources of information are combined:
+
+- the resident set size (RSS) of the process, sampled in a background thread, which includes the memory of CPU
+  tensors,
+- `tracemalloc`, which traces the allocations of Python objects but not the storage of pytorch tensors,
+- the statistics of the pytorch CUDA caching allocator when CUDA is in use.
+
+pytorch 1.6 does not expose statistics of its CPU allocator, which is why the RSS is used for CPU tensors.
+"""
+import os
+import platform
+import threading
+import tracemalloc
+
+import torch
+
+megabyte = 2 ** 20
+
+
+def current_rss():
+    """Resident set size of the process in bytes
+
+    Read from /proc/self/statm where it is available (Linux). Otherwise, return the peak resident set size
+    of the process as reported by `getrusage`.
+
+    Returns
+    -------
+        int
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        scale = 1 if platform.system() == "Darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def read_meminfo(field):
+    """Read a field of /proc/meminfo in bytes (Linux only)
+
+    Returns
+    -------
+        int or None
+            None if the field cannot be read
+    """
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def available_memory(device=torch.device("cpu")):
+    """Memory available for new allocations on a device, in bytes
+
+    On CUDA devices, this is the total memory of the device minus the memory allocated by pytorch. On CPU, this is
+    the available memory reported by /proc/meminfo (Linux only).
+
+    Returns
+    -------
+        int or None
+            None if the available memory cannot be determined
+    """
+    device = torch.device(device) if device is not None else torch.device("cpu")
+    if device.type == "cuda":
+        return torch.cuda.get_device_properties(device).total_memory - torch.cuda.memory_allocated(device)
+    return read_meminfo("MemAvailable")
+
+
+def total_memory(device=torch.device("cpu")):
+    """Total memory of a device in bytes: of the GPU for CUDA devices and of the host for the CPU (Linux only)
+
+    Returns
+    -------
+        int or None
+            None if the total memory cannot be determined
+    """
+    device = torch.device(device) if device is not None else torch.device("cpu")
+    if device.type == "cuda":
+        return torch.cuda.get_device_properties(device).total_memory
+    return read_meminfo("MemTotal")
+
+
+class MemoryTracker:
+    """Context manager measuring the peak memory usage while it is active
+
+    After the context exits, :py:meth:`record` returns the peak RSS, its increase with respect to the start, the peak
+    memory traced by `tracemalloc` and, on CUDA devices, the peak memory allocated by pytorch, all in megabytes.
+    A disabled tracker does nothing and records nothing. Trackers can be re-used but not nested.
+
+    Example
+    -------
+    >>> tracker = MemoryTracker(device)
+    >>> with tracker:
+    ...     integrator.sample_refine()
+    >>> tracker.record()
+    """
+
+    def __init__(self, device=torch.device("cpu"), python_tracing=True, interval=0.001, enabled=True):
+        """
+
+        Parameters
+        ----------
+        device: torch.device, None
+            None stands for the CPU
+        python_tracing: bool
+            whether to trace the allocations of Python objects with `tracemalloc`. Tracing slows down Python code
+            significantly
+        interval: float
+            time between two samples of the RSS, in seconds
+        enabled: bool
+        """
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self.python_tracing = python_tracing
+        self.interval = interval
+        self.enabled = enabled
+
+        self.initial_rss = None
+        self.peak_rss = None
+        self.initial_cuda = None
+        self.peak_cuda = None
+        self.initial_python = None
+        self.peak_python = None
+        self._started_tracing = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample_rss(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+            self.initial_cuda = torch.cuda.memory_allocated(self.device)
+
+        if self.python_tracing:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            self.initial_python = tracemalloc.get_traced_memory()[0]
+
+        self.initial_rss = current_rss()
+        self.peak_rss = self.initial_rss
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_rss, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.enabled:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+        if self.python_tracing:
+            self.peak_python = tracemalloc.get_traced_memory()[1] - self.initial_python
+            if self._started_tracing:
+                tracemalloc.stop()
+
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+            self.peak_cuda = torch.cuda.max_memory_allocated(self.device) - self.initial_cuda
+
+    @property
+    def peak_increase(self):
+        """Peak memory increase in bytes: of the CUDA allocation on CUDA devices and of the RSS on CPU"""
+        if self.device.type == "cuda":
+            return self.peak_cuda
+        return self.peak_rss - self.initial_rss
+
+    def record(self):
+        """Measurements of the last tracked block
+
+        Returns
+        -------
+            dict
+                keys "peak_rss_mb", "rss_increase_mb" and, if available, "python_peak_mb" and "cuda_peak_mb"
+        """
+        if not self.enabled or self.peak_rss is None:
+            return dict()
+        record = {
+            "peak_rss_mb": self.peak_rss / megabyte,
+            "rss_increase_mb": (self.peak_rss - self.initial_rss) / megabyte,
+        }
+        if self.python_tracing:
+            record["python_peak_mb"] = self.peak_python / megabyte
+        if self.device.type == "cuda":
+            record["cuda_peak_mb"] = self.peak_cuda / megabyte
+        return record
+
+
+def measure_memory_per_point(function, probe_sizes=(1000, 10000), device=torch.device("cpu")):
+    """Estimate the memory needed per point by a function of the batch size
+
+    The peak memory increase is measured for each probe size and the memory per point is the slope between the
+    smallest and the largest probe. On CPU, the RSS only grows when the allocator requests memory from the system, so
+    the estimate is only meaningful for batches large enough to be allocated directly (typically above a few
+    hundred kilobytes).
+
+    Parameters
+    ----------
+    function: callable
+        function of the batch size
+    probe_sizes: tuple of int
+    device: torch.device
+
+    Returns
+    -------
+        float
+            memory per point in bytes
+    """
+    probe_sizes = sorted(probe_sizes)
+    tracker = MemoryTracker(device, python_tracing=False)
+    peaks = []
+    for n_points in probe_sizes:
+        with tracker:
+            function(n_points)
+        peaks.append(tracker.peak_increase)
+
+    if len(probe_sizes) > 1 and peaks[-1] > peaks[0]:
+        return (peaks[-1] - peaks[0]) / (probe_sizes[-1] - probe_sizes[0])
+    return max(peaks[-1], 0) / probe_sizes[-1]
+
+
+def estimate_max_batch_size(memory_per_point, device=torch.device("cpu"), memory=None, safety_factor=0.8):
+    """Estimate the largest batch that fits in memory
+
+    Parameters
+    ----------
+    memory_per_point: float
+        in bytes, see :py:func:`measure_memory_per_point`
+    device: torch.device
+    memory: int, None
+        memory budget in bytes. If None, use the memory currently available on the device
+    safety_factor: float
+        fraction of the budget that can be used
+
+    Returns
+    -------
+        int or None
+            None if the memory budget is unknown or the memory per point could not be measured
+    """
+    if memory is None:
+        memory = available_memory(device)
+    if memory is None or memory_per_point <= 0:
+        return None
+    return int(safety_factor * memory / memory_per_point)
@@ -0,0 +1,255 @@
+"""Opt-in profiling of the survey and refine steps of integrators
+
+Selected steps are run under a profiler (cProfile or the pytorch autograd profiler) and the time spent in each cell
+of the sequential flows of the trainer is measured. Profiling is enabled with the `profiling` option of integrators,
+which can be set in configuration files, for example:
+
+.. code-block:: yaml
+
+    profiling:
+      backend: torch
+      steps:
+        survey: [0, 5]
+        refine: [0]
+      output_dir: profiles
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+from contextlib import contextmanager
+from functools import partial
+from time import perf_counter
+
+import pandas as pd
+import torch
+
+from zunis.models.flows.sequential.invertible_sequential import InvertibleSequentialFlow
+from zunis.utils.timing import synchronize
+
+logger = logging.getLogger(__name__)
+
+
+class CellTimer:
+    """Accumulate the wall-clock time spent in the cells of sequential flows
+
+    Instances are set as the `cell_timer` of
+    :py:class:`InvertibleSequentialFlow <zunis.models.flows.sequential.invertible_sequential.InvertibleSequentialFlow>`
+    objects with the flow label bound as first argument.
+    """
+
+    def __init__(self):
+        self.phase = None
+        self.records = dict()
+
+    def __call__(self, flow_label, index, method, x):
+        synchronize()
+        start = perf_counter()
+        output = method(x)
+        synchronize()
+        duration = perf_counter() - start
+
+        key = (self.phase, flow_label, index, type(method.__self__).__name__, method.__name__)
+        time, calls = self.records.get(key, (0., 0))
+        self.records[key] = (time + duration, calls + 1)
+        return output
+
+    def summary(self):
+        """Format the accumulated timings as a table with one row per phase, flow, cell and method
+
+        Returns
+        -------
+            pandas.Dataframe
+        """
+        rows = [{"phase": phase, "flow": flow_label, "cell_index": index, "cell": cell, "method": method,
+                 "calls": calls, "time": time, "time_per_call": time / calls}
+                for (phase, flow_label, index, cell, method), (time, calls) in self.records.items()]
+        return pd.DataFrame(rows, columns=["phase", "flow", "cell_index", "cell", "method", "calls", "time",
+                                           "time_per_call"])
+
+
+class IntegrationProfiler:
+    """Profile selected survey and refine steps of an integrator
+
+    For each selected step, the profiler report (sorted by cumulative time for cProfile, by self CPU time for
+    pytorch) is stored in :py:attr:`reports` and the time spent in each flow cell is accumulated.
+    """
+
+    backends = ("cprofile", "torch")
+
+    def __init__(self, steps=None, backend="cprofile", cell_timing=True, output_dir=None, n_rows=30):
+        """
+
+        Parameters
+        ----------
+        steps: None or dict
+            steps to profile, as a dictionary mapping "survey" and "refine" to lists of step indices (starting at 0
+            in each phase) or to "all". Phases that are not listed are not profiled. If None, all steps are profiled.
+        backend: {"cprofile", "torch"} or None
+            profiler used on the selected steps. `torch.autograd.profiler` records the pytorch operators, including
+            CUDA kernels when CUDA is in use. With None, only the flow cells are timed.
+        cell_timing: bool
+            whether to time the cells of the sequential flows of the trainer during the selected steps
+        output_dir: str, None
+            if set, the raw profiles (pstats dumps or chrome traces), the reports and the cell timing table are
+            written in this directory
+        n_rows: int
+            number of rows of the profiler reports
+        """
+        assert backend is None or backend in self.backends, f"The profiling backend must be one of {self.backends}"
+        self.steps = steps
+        self.backend = backend
+        self.cell_timing = cell_timing
+        self.output_dir = output_dir
+        self.n_rows = n_rows
+
+        self.step_counters = {"survey": 0, "refine": 0}
+        self.cell_timer = CellTimer()
+        self.reports = []
+
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def is_selected(self, phase, step):
+        """Check whether a step of a phase should be profiled"""
+        if self.steps is None:
+            return True
+        selection = self.steps.get(phase, [])
+        return selection == "all" or step in selection
+
+    def start_phase(self, phase):
+        """Reset the step counter of a phase"""
+        self.step_counters[phase] = 0
+
+    @staticmethod
+    def sequential_flows(trainer):
+        """List the sequential flows of a trainer with a label identifying them
+
+        Returns
+        -------
+            list of tuple
+                (label, flow) pairs
+        """
+        flows = [("flow", trainer.flow)]
+        inference_flow = getattr(trainer, "inference_flow", None)
+        if inference_flow is not None:
+            flows.append(("inference_flow", inference_flow))
+
+        sequential_flows = []
+        for label, flow in flows:
+            for name, module in flow.named_modules():
+                if isinstance(module, InvertibleSequentialFlow):
+                    sequential_flows.append((label if name == "" else f"{label}.{name}", module))
+        return sequential_flows
+
+    def run_profiler(self):
+        """Create the profiler object of the backend
+
+        Returns
+        -------
+            profiler object that can be enabled and disabled, or None if no backend is used
+        """
+        if self.backend == "cprofile":
+            return cProfile.Profile()
+        if self.backend == "torch":
+            return torch.autograd.profiler.profile(use_cuda=torch.cuda.is_available() and torch.cuda.is_initialized())
+        return None
+
+    def start_profiler(self, profiler):
+        if self.backend == "cprofile":
+            profiler.enable()
+        elif self.backend == "torch":
+            profiler.__enter__()
+
+    def stop_profiler(self, profiler):
+        if self.backend == "cprofile":
+            profiler.disable()
+        elif self.backend == "torch":
+            profiler.__exit__(None, None, None)
+
+    def report(self, profiler, phase, step):
+        """Format the result of a profiler as text and save the raw profile if there is an output directory"""
+        if self.backend == "cprofile":
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(self.n_rows)
+            text = stream.getvalue()
+            raw_path = f"{phase}_{step}.pstats"
+            if self.output_dir is not None:
+                profiler.dump_stats(os.path.join(self.output_dir, raw_path))
+        else:
+            text = profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=self.n_rows)
+            raw_path = f"{phase}_{step}.trace.json"
+            if self.output_dir is not None:
+                profiler.export_chrome_trace(os.path.join(self.output_dir, raw_path))
+
+        if self.output_dir is not None:
+            with open(os.path.join(self.output_dir, f"{phase}_{step}.txt"), "w") as report_file:
+                report_file.write(text)
+        return text
+
+    @contextmanager
+    def profile_step(self, phase, trainer):
+        """Context in which a step is run: profiles it if it is selected
+
+        Parameters
+        ----------
+        phase: {"survey", "refine"}
+        trainer: zunis.training.weighted_dataset.weighted_dataset_trainer.BasicTrainer
+            trainer whose flows are timed cell by cell
+        """
+        step = self.step_counters[phase]
+        self.step_counters[phase] += 1
+        if not self.is_selected(phase, step):
+            yield
+            return
+
+        flows = self.sequential_flows(trainer) if self.cell_timing else []
+        self.cell_timer.phase = phase
+        for label, flow in flows:
+            flow.cell_timer = partial(self.cell_timer, label)
+
+        profiler = self.run_profiler()
+        synchronize()
+        start = perf_counter()
+        self.start_profiler(profiler)
+        try:
+            yield
+        finally:
+            synchronize()
+            self.stop_profiler(profiler)
+            duration = perf_counter() - start
+            for _, flow in flows:
+                flow.cell_timer = None
+
+        text = self.report(profiler, phase, step) if profiler is not None else None
+        self.reports.append({"phase": phase, "step": step, "time": duration, "report": text})
+        logger.debug(f"Profiled {phase} step {step} ({duration:.3e}s)")
+
+    def summary(self):
+        """Time spent in each flow cell during the profiled steps
+
+        The fraction of the profiled step time of the phase spent in each cell is given in the column
+        "step_time_fraction". Nested sequential flows are timed at all levels.
+
+        Returns
+        -------
+            pandas.Dataframe
+        """
+        summary = self.cell_timer.summary()
+        step_times = pd.DataFrame(self.reports, columns=["phase", "step", "time", "report"]).groupby("phase")["time"]
+        summary["step_time_fraction"] = summary["time"] / summary["phase"].map(step_times.sum())
+        return summary
+
+    def end_phase(self, phase):
+        """Summarize the profiling so far and write the summary if there is an output directory
+
+        Returns
+        -------
+            pandas.Dataframe
+                see :py:meth:`summary`
+        """
+        summary = self.summary()
+        if self.output_dir is not None:
+            summary.to_csv(os.path.join(self.output_dir, "cell_timing.csv"), index=False)
+        return summary
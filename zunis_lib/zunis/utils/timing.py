@@ -0,0 +1,60 @@
+"""Wall-clock timing of integration steps
+
+CUDA kernels run asynchronously: timers synchronize the device before reading the clock so that the measured
+durations include the GPU work that was queued during the timed section.
+"""
+from time import perf_counter
+
+import torch
+
+
+def synchronize():
+    """Wait for all queued CUDA kernels to complete, if CUDA is in use"""
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        torch.cuda.synchronize()
+
+
+def timed_call(function, *args, **kwargs):
+    """Call a function and measure its wall-clock duration
+
+    Returns
+    -------
+        tuple
+            (function output, duration in seconds)
+    """
+    synchronize()
+    start = perf_counter()
+    output = function(*args, **kwargs)
+    synchronize()
+    return output, perf_counter() - start
+
+
+class TimedFunction:
+    """Wrapper around a function that accumulates the wall-clock time spent in its calls
+
+    Used to separate the integrand evaluation time from the rest of the sampling time: the wrapper is passed
+    instead of the integrand to the sampling methods of integrators.
+    """
+
+    def __init__(self, function):
+        """
+
+        Parameters
+        ----------
+        function: callable
+        """
+        self.function = function
+        self.time = 0.
+        self.n_calls = 0
+
+    def __call__(self, *args, **kwargs):
+        output, duration = timed_call(self.function, *args, **kwargs)
+        self.time += duration
+        self.n_calls += 1
+        return output
+
+    def __getattr__(self, item):
+        # Only called for attributes that are not defined on the wrapper: forward to the wrapped function
+        if item == "function":
+            raise AttributeError(item)
+        return getattr(self.function, item)